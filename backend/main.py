@@ -12,6 +12,8 @@ application.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # курсор следующей страницы GET /groups/{id}/files
+    expose_headers=["X-Next-Cursor"],
     )
 
 
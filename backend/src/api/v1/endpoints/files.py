@@ -5,6 +5,7 @@ import json
 import asyncio
 from pathlib import Path
 import mimetypes
+from urllib.parse import quote
 from typing import List, Optional, Literal
 
 from loguru import logger
@@ -13,19 +14,23 @@ from fastapi.responses import JSONResponse, FileResponse
 from fastapi import status as http
 
 from src.api.v1.schemas.file_schemas import (
-    FileOut, FileStatus, FilePatch, FileContentIn, FileContentOut
+    FileOut, FileStatus, FilePatch, FileContentIn, FileContentOut,
+    FileStatusBatchIn, FileStatusBatchItem, FileStatusBatchOut,
 )
 from src.utils.common import (
-    stage_dir, group_dir_status, atomic_write_json, read_json_file, group_dir_final, group_dir_process
+    stage_dir, stage_key, atomic_write_json, read_json_file, group_dir_final, group_dir_process, now_iso,
 )
 
-from src.utils.files import  _find_source_image, _copy2, _write_text_atomic
+from src.utils.files import  _find_source_image, _copy2, _write_text_atomic, _expand_result_v2
 
-from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
+from src.infra.storage.factory import get_store
 from src.core.configs import configs
 from src.services.report.report import FileReportBuilder
+from src.services.progress.progress import progress_tracker, stamp_stage
+from src.services.events.events import publish_file_status
+from src.services.journal.journal import status_journal
 
-store = AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(base_dir=configs.dirs.store))
+store = get_store()
 
 files_router = APIRouter(prefix="/files", tags=["files"])
 
@@ -49,10 +54,9 @@ async def _resolve_content_path(
       - если найдено >1 кандидата — 409
       - если не найдено — 404 (если must_exist=True) или путь по умолчанию (если False)
     """
-    if not await store.exists(f"files/{file_uuid}"):
+    meta = await store.read_or_none(f"files/{file_uuid}")
+    if meta is None:
         raise HTTPException(http.HTTP_404_NOT_FOUND, "file not found")
-
-    meta = await store.read(f"files/{file_uuid}")
     group_uuid = meta["group_uuid"]
     base: Path = stage_dir(group_uuid, stage)
 
@@ -65,12 +69,19 @@ async def _resolve_content_path(
             raise HTTPException(http.HTTP_404_NOT_FOUND, f"content file '{p.name}' not found")
         return p
 
-    # 2) {file_uuid}.json
+    # 2) Имя, записанное callback'ом стадии (или найденное ранее поиском)
+    recorded = (meta.get("results") or {}).get(stage_key(stage))
+    if recorded:
+        p = base / recorded
+        if p.exists():
+            return p
+
+    # 3) {file_uuid}.json
     p_default = base / f"{file_uuid}.json"
     if p_default.exists():
         return p_default
 
-    # 3) По шаблонам
+    # 4) По шаблонам — только для данных, записанных до появления meta["results"]
     stem = Path(meta.get("original_name", "")).stem
     patterns: List[str] = []
     if stem:
@@ -85,6 +96,8 @@ async def _resolve_content_path(
     uniq = list({str(p): p for p in candidates}.values())
 
     if len(uniq) == 1:
+        # запоминаем найденное: следующий запрос обойдётся без glob
+        await _remember_result_name(file_uuid, stage, uniq[0].name)
         return uniq[0]
 
     if len(uniq) == 0:
@@ -98,17 +111,59 @@ async def _resolve_content_path(
     return uniq[-1]
 
 
+@files_router.post("/status:batch", response_model=FileStatusBatchOut)
+async def get_files_status_batch(body: FileStatusBatchIn):
+    """
+    Статусы пачки файлов одним запросом: одно пакетное чтение мет из store, без обращений к ФС.
+    content_url ведёт на JSON-результат текущей стадии, если его имя уже записано в meta["results"].
+    """
+    fids = list(dict.fromkeys(body.file_uuids))
+    out = FileStatusBatchOut()
+    for fid, meta in zip(fids, await store.read_many([f"files/{fid}" for fid in fids])):
+        if meta is None:
+            out.missing.append(fid)
+            continue
+        status = meta.get("status", FileStatus.progress.value)
+        try:
+            file_status = FileStatus(status)
+        except ValueError:
+            # meta со статусом, которого нет в FileStatus, не валит всю пачку
+            logger.warning(f"status:batch: file {fid} has unknown status {status!r}")
+            out.invalid.append(fid)
+            continue
+        result = (meta.get("results") or {}).get(stage_key(status))
+        out.files.append(FileStatusBatchItem(
+            file_uuid=fid,
+            group_uuid=meta["group_uuid"],
+            filename=meta.get("original_name") or meta.get("filename", ""),
+            status=file_status,
+            result_filename=result,
+            content_url=f"/api/v1/files/{fid}/content?stage={status}&filename={quote(result)}" if result else None,
+        ))
+    return out
+
+
 @files_router.patch("/{file_uuid}", response_model=FileOut)
 async def patch_file(file_uuid: str, patch: FilePatch):
-    key = f"files/{file_uuid}"
-    if not await store.exists(key):
+    changed = {}
+
+    def _patch(rec: dict) -> dict:
+        changed["old_status"] = rec.get("status")
+        rec["status"] = patch.status.value
+        rec["updated_at"] = now_iso()
+        changed["first_time"] = stamp_stage(rec, rec["status"])
+        changed["rec"] = rec
+        return rec
+
+    try:
+        await store.update(f"files/{file_uuid}", _patch)
+    except FileNotFoundError:
         raise HTTPException(http.HTTP_404_NOT_FOUND, "file not found")
-    rec = await store.read(key)
-    rec["status"] = patch.status.value
+    rec, old_status, first_time = changed["rec"], changed["old_status"], changed["first_time"]
 
-    s_path = group_dir_status(rec["group_uuid"]) / f"{file_uuid}.json"
-    await atomic_write_json(s_path, rec)
-    await store.replace(key, rec)
+    await status_journal.append(rec["group_uuid"], [rec])
+    await progress_tracker.record_transition(rec["group_uuid"], old_status, rec["status"], first_time)
+    publish_file_status(rec)
 
     return FileOut(
         file_uuid=rec["file_uuid"],
@@ -118,6 +173,21 @@ async def patch_file(file_uuid: str, patch: FilePatch):
     )
 
 
+async def _remember_result_name(file_uuid: str, stage: str, name: Optional[str]) -> None:
+    """Записать (или убрать при name=None) имя JSON-результата стадии в meta файла."""
+    def _patch(rec):
+        results = rec.setdefault("results", {})
+        if name is None:
+            results.pop(stage_key(stage), None)
+        else:
+            results[stage_key(stage)] = name
+        return rec
+    try:
+        await store.update(f"files/{file_uuid}", _patch)
+    except FileNotFoundError:
+        pass
+
+
 @files_router.get("/{file_uuid}/content", response_model=FileContentOut)
 async def get_file_content(
     file_uuid: str,
@@ -126,7 +196,8 @@ async def get_file_content(
 ):
     p = await _resolve_content_path(file_uuid, stage=stage, filename=filename, must_exist=True)
     data = await read_json_file(p)
-    return FileContentOut(file_uuid=file_uuid, json=data)
+    # компактный v2 от ml-pipeline отдаём фронту в привычном v1
+    return FileContentOut(file_uuid=file_uuid, json=_expand_result_v2(data))
 
 
 @files_router.put("/{file_uuid}/content", response_model=FileContentOut)
@@ -149,10 +220,9 @@ async def put_file_content(
     """
 
     # ---- 0. читаем метаданные файла (нужны имя и group_uuid) ----
-    if not await store.exists(f"files/{file_uuid}"):
+    meta = await store.read_or_none(f"files/{file_uuid}")
+    if meta is None:
         raise HTTPException(status_code=http.HTTP_404_NOT_FOUND, detail="file not found")
-
-    meta = await store.read(f"files/{file_uuid}")
     group_uuid = meta.get("group_uuid")
     original_name = (meta.get("filename") or meta.get("original_name") or "").strip()
 
@@ -175,6 +245,8 @@ async def put_file_content(
     # await _write_text_atomic(stage_json_path, json.dumps(payload_dict, ensure_ascii=False, indent=2))
     p = await _resolve_content_path(file_uuid, stage=stage, filename=filename, must_exist=False)
     await atomic_write_json(p, payload.json)
+    if not filename and (meta.get("results") or {}).get(stage_key(stage)) != p.name:
+        await _remember_result_name(file_uuid, stage, p.name)
 
     # ---- 2. подготовка train-имён (единый basename для пары JSON+image) ----
     if filename:
@@ -225,6 +297,8 @@ async def delete_file_content(
         raise
     if p.exists():
         await asyncio.to_thread(p.unlink)
+    if not filename:
+        await _remember_result_name(file_uuid, stage, None)
     return JSONResponse(status_code=http.HTTP_204_NO_CONTENT, content=None)
 
 def _raw_image_path(group_uuid: str, filename: str) -> Path:
@@ -243,10 +317,9 @@ async def get_file_image(file_uuid: str):
     Content-Type ставится по расширению файла.
     """
     key = f"files/{file_uuid}"
-    if not await store.exists(key):
+    meta = await store.read_or_none(key)
+    if meta is None:
         raise HTTPException(http.HTTP_404_NOT_FOUND, "file not found")
-
-    meta = await store.read(key)
     group_uuid = meta.get("group_uuid")
     filename = meta.get("filename") or meta.get("original_name")
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import bisect
 import httpx
 import urllib
 import os
@@ -9,25 +10,31 @@ import tempfile
 from pathlib import Path
 from typing import Optional, List, Literal
 
-from fastapi import APIRouter, UploadFile, Query, File as FAFile, Form, HTTPException
+from fastapi import APIRouter, UploadFile, Query, File as FAFile, Form, HTTPException, Header, Response
 from fastapi import status as http
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from src.api.v1.schemas.group_schemas import GroupOut, GroupPatch
+from src.api.v1.schemas.group_schemas import GroupOut, GroupPatch, GroupProgressOut
 from src.api.v1.schemas.file_schemas import FileOut, FileStatus
 from src.utils.common import (
     _gid, _fid, now_iso,
-    ensure_group_dirs, group_dir_raw, group_dir_status,
-    extract_zip_filtered, atomic_write_json, read_json_file,
+    ensure_group_dirs, group_dir_raw,
+    extract_zip_filtered, _stem_map_key,
+)
+from src.utils.groups import (
+    _save_upload_to_path, _append_group_index, _should_accept, _dispatch_ml_pipeline, _write_file_metas,
+    _group_status_view, _staging_dir, _publish_staged,
 )
-from src.utils.groups import _save_upload_to_path, _append_group_index, _should_accept
 
-from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
-from src.tasks.ml_tasks import start_ml_pipeline
+from src.infra.storage.factory import get_store
+from src.tasks.ml_tasks import cancel_group_processing
 from src.core.configs import configs
 from src.services.report.report import ReportBuilder
+from src.services.progress.progress import progress_tracker
+from src.services.events.events import status_events, publish_file_status
+from src.services.journal.journal import status_journal
 
-store = AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(base_dir=configs.dirs.store))
+store = get_store()
 
 groups_router = APIRouter(prefix="/groups", tags=["Groups"])
 
@@ -44,6 +51,8 @@ async def upload_zip(
 ):
     group_uuid = _gid()
     ensure_group_dirs(group_uuid)
+    await status_journal.create(group_uuid)
+    await progress_tracker.create(group_uuid)
 
     # карточка группы в store
     group_doc = {
@@ -53,90 +62,171 @@ async def upload_zip(
     }
     await store.create(f"groups/{group_uuid}", group_doc, overwrite=True)
 
-    # сохранить архив и распаковать в raw_data/
+    # сохранить архив и распаковать во временный staging: в raw_data/ файлы попадут после записи мет
+    staging = _staging_dir(group_uuid)
+    raw_dir = group_dir_raw(group_uuid)
     fd, tmp_name = await asyncio.to_thread(lambda: tempfile.mkstemp(prefix="upload_", suffix=".zip"))
     os.close(fd)
     try:
-        with open(tmp_name, "wb") as out:
-            while True:
-                chunk = await archive.read(1 << 20)
-                if not chunk:
-                    break
-                out.write(chunk)
-        files = await extract_zip_filtered(Path(tmp_name), group_dir_raw(group_uuid))
+        try:
+            with open(tmp_name, "wb") as out:
+                while True:
+                    chunk = await archive.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            files = await extract_zip_filtered(Path(tmp_name), staging)
+        finally:
+            try: os.remove(tmp_name)
+            except OSError as e: print(f"Error: {e}")
+
+        moves = [(src, raw_dir / src.relative_to(staging)) for src in files if src.is_file()]
+        sources = [dst for _, dst in moves]
+        status_docs: List[dict] = []
+        for src in sources:
+            created_at = now_iso()
+            status_docs.append({
+                "file_uuid": _fid(),
+                "group_uuid": group_uuid,
+                "original_name": src.name,
+                "raw_path": str(src),
+                "status": FileStatus.progress.value,
+                "created_at": created_at,
+                "stages": {FileStatus.progress.value: created_at},
+            })
+        await _write_file_metas(group_uuid, status_docs)
+        # индекс группы
+        file_ids = [doc["file_uuid"] for doc in status_docs]
+        await store.create(f"group_index/{group_uuid}", {"files": file_ids}, overwrite=True)
+        await progress_tracker.add_files(group_uuid, len(file_ids))
+        await _publish_staged(staging, moves)
     finally:
-        try: os.remove(tmp_name)
-        except OSError as e: print(f"Error: {e}")
-
-    file_ids: List[str] = []
-    for src in files:
-        if not src.is_file():
-            continue
-        file_uuid = _fid()
-        file_ids.append(file_uuid)
-
-        status_doc = {
-            "file_uuid": file_uuid,
-            "group_uuid": group_uuid,
-            "original_name": src.name,
-            "raw_path": str(src),
-            "status": FileStatus.progress.value,
-            "created_at": now_iso(),
-        }
-        await atomic_write_json(group_dir_status(group_uuid) / f"{file_uuid}.json", status_doc)
-        await store.create(f"files/{file_uuid}", status_doc, overwrite=True)
-        start_ml_pipeline.send(group_uuid)
-    # индекс группы
-    await store.create(f"group_index/{group_uuid}", {"files": file_ids}, overwrite=True)
+        shutil.rmtree(staging, ignore_errors=True)
 
+    # в обработку — когда меты и индекс уже записаны и callback найдёт файл
+    for index, (src, doc) in enumerate(zip(sources, status_docs)):
+        publish_file_status(doc)
+        _dispatch_ml_pipeline(group_uuid, src, index)
     return GroupOut(group_uuid=group_uuid, fond=fond, opis=opis, delo=delo)
 
 
 @groups_router.get("/{group_uuid}/files", response_model=List[FileOut])
-async def list_files_in_group(group_uuid: str):
-    if not await store.exists(f"group_index/{group_uuid}"):
+async def list_files_in_group(
+    group_uuid: str,
+    response: Response,
+    status: Optional[FileStatus] = Query(None, description="Только файлы в этом статусе"),
+    limit: Optional[int] = Query(None, ge=1, le=5000, description="Размер страницы (без него — все файлы)"),
+    cursor: Optional[int] = Query(None, ge=0, description="Значение X-Next-Cursor предыдущей страницы"),
+):
+    """
+    Файлы группы в порядке загрузки. С limit — постранично: курсор следующей страницы
+    приходит в заголовке X-Next-Cursor, его нет — страница последняя.
+    """
+    # из материализованного журнала статусов группы — без чтения files/{fid} на каждую запись
+    files = await _group_status_view(group_uuid)
+    if files is None:
         raise HTTPException(http.HTTP_404_NOT_FOUND, "group not found")
-    idx = await store.read(f"group_index/{group_uuid}")
-    out: List[FileOut] = []
-    for fid in idx.get("files", []):
-        s_path = group_dir_status(group_uuid) / f"{fid}.json"
-        if not s_path.exists():
-            # запись могла быть удалена
-            continue
-        doc = await read_json_file(s_path)
-        out.append(FileOut(
-            file_uuid=fid,
+
+    entries = list(files.values())
+    if cursor is not None:
+        # курсор — seq последнего отданного файла: ни смена статусов, ни новые файлы страницы не сдвигают
+        entries = entries[bisect.bisect_right([e["seq"] for e in entries], cursor):]
+    if status is not None:
+        entries = [e for e in entries if e["status"] == status.value]
+    if limit is not None and len(entries) > limit:
+        entries = entries[:limit]
+        response.headers["X-Next-Cursor"] = str(entries[-1]["seq"])
+
+    return [
+        FileOut(
+            file_uuid=e["file_uuid"],
             group_uuid=group_uuid,
-            filename=doc.get("original_name", ""),
-            status=FileStatus(doc.get("status", FileStatus.progress.value)),
-        ))
-    return out
+            filename=e.get("filename", ""),
+            status=FileStatus(e["status"]),
+        )
+        for e in entries
+    ]
+
+
+@groups_router.get("/{group_uuid}/progress", response_model=GroupProgressOut)
+async def get_group_progress(group_uuid: str):
+    """Сколько файлов группы в каждой стадии, пропускная способность и ETA."""
+    progress = await progress_tracker.get(group_uuid)
+    if progress is None:
+        raise HTTPException(http.HTTP_404_NOT_FOUND, "group not found")
+    return progress
+
+
+@groups_router.get("/{group_uuid}/events")
+async def stream_group_events(
+    group_uuid: str,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    last_event_id: Optional[int] = Query(None, description="Продолжить после события с этим id (если нет заголовка Last-Event-ID)"),
+):
+    """
+    SSE-поток изменений статусов файлов группы (event: status).
+    При переподключении EventSource сам присылает Last-Event-ID — пропущенные события
+    досылаются из буфера; если их уже нет, приходит event: reset и список нужно перечитать.
+    """
+    if not await store.exists(f"groups/{group_uuid}"):
+        raise HTTPException(http.HTTP_404_NOT_FOUND, "group not found")
+    if last_event_id_header:
+        try:
+            last_event_id = int(last_event_id_header)
+        except ValueError:
+            last_event_id = None
+    return StreamingResponse(
+        status_events.stream(group_uuid, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@groups_router.get("/{group_uuid}/queue")
+async def get_group_queue(group_uuid: str):
+    """Позиция группы в очереди ml-pipeline и оценка времени до конца (для ETA на фронте)."""
+    if not await store.exists(f"groups/{group_uuid}"):
+        raise HTTPException(http.HTTP_404_NOT_FOUND, "group not found")
+    url = configs.ml_pipeline.url.rstrip("/") + "/queue"
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            r = await client.get(url, params={"group_uuid": group_uuid})
+            r.raise_for_status()
+            return r.json()
+    except httpx.HTTPError as e:
+        raise HTTPException(http.HTTP_502_BAD_GATEWAY, f"ml-pipeline unavailable: {e}")
 
 
 @groups_router.get("/{group_uuid}", response_model=GroupOut)
 async def get_group(group_uuid: str):
     key = f"groups/{group_uuid}"
-    if not await store.exists(key):
+    rec = await store.read_or_none(key)
+    if rec is None:
         raise HTTPException(http.HTTP_404_NOT_FOUND, "group not found")
-    rec = await store.read(key)
     return GroupOut(group_uuid=group_uuid, fond=rec.get("fond"), opis=rec.get("opis"), delo=rec.get("delo"))
 
 @groups_router.patch("/{group_uuid}", response_model=GroupOut)
 async def patch_group(group_uuid: str, patch: GroupPatch):
-    key = f"groups/{group_uuid}"
-    if not await store.exists(key):
+    def _patch(rec: dict) -> dict:
+        for f in ("fond", "opis", "delo"):
+            val = getattr(patch, f)
+            if val is not None:
+                rec[f] = val
+        return rec
+
+    try:
+        await store.update(f"groups/{group_uuid}", _patch)
+    except FileNotFoundError:
         raise HTTPException(http.HTTP_404_NOT_FOUND, "group not found")
-    rec = await store.read(key)
-    for f in ("fond", "opis", "delo"):
-        val = getattr(patch, f)
-        if val is not None:
-            rec[f] = val
-    await store.replace(key, rec)
+    rec = await store.read(f"groups/{group_uuid}")
     return GroupOut(group_uuid=group_uuid, fond=rec.get("fond"), opis=rec.get("opis"), delo=rec.get("delo"))
 
 
 @groups_router.delete("/{group_uuid}", status_code=http.HTTP_204_NO_CONTENT)
 async def delete_group(group_uuid: str):
+    # остановить OCR/LLM по группе: воркеры бросят её на границе скана или стадии
+    cancel_group_processing.send(group_uuid)
+
     # удалить папку группы целиком
     root = (configs.dirs.data / "groups" / group_uuid).resolve()
     try:
@@ -148,11 +238,14 @@ async def delete_group(group_uuid: str):
 
     # удалить записи в store
     await store.delete(f"groups/{group_uuid}", missing_ok=True)
-    if await store.exists(f"group_index/{group_uuid}"):
-        idx = await store.read(f"group_index/{group_uuid}")
-        for fid in idx.get("files", []):
-            await store.delete(f"files/{fid}", missing_ok=True)
+    idx = await store.read_or_none(f"group_index/{group_uuid}")
+    if idx is not None:
+        await store.delete_many([f"files/{fid}" for fid in idx.get("files", [])], missing_ok=True)
         await store.delete(f"group_index/{group_uuid}", missing_ok=True)
+    await store.delete(_stem_map_key(group_uuid), missing_ok=True)
+    await progress_tracker.delete(group_uuid)
+    status_events.forget(group_uuid)
+    status_journal.forget(group_uuid)
 
     return JSONResponse(status_code=http.HTTP_204_NO_CONTENT, content=None)
 
@@ -162,14 +255,31 @@ async def upload_files_to_group(
     files: List[UploadFile] = FAFile(..., description="Один или несколько файлов")
 ):
     group_key = f"groups/{group_uuid}"
+    new_group = False
     if not await store.exists(group_key):
-        await store.create(group_key, {"group_uuid": group_uuid, "created_at": now_iso()}, overwrite=True)
+        try:
+            await store.create(group_key, {"group_uuid": group_uuid, "created_at": now_iso()})
+            new_group = True
+        except FileExistsError:
+            pass
 
     ensure_group_dirs(group_uuid)
+    if new_group:
+        await status_journal.create(group_uuid)
+        await progress_tracker.create(group_uuid)
     raw_dir = group_dir_raw(group_uuid)
+    staging = _staging_dir(group_uuid)
+    try:
+        return await _upload_files_staged(group_uuid, files, raw_dir, staging)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
 
+async def _upload_files_staged(group_uuid: str, files: List[UploadFile], raw_dir: Path, staging: Path) -> List[FileOut]:
     created: List[FileOut] = []
-    created_ids: List[str] = []
+    metas: List[dict] = []
+    saved: List[Path] = []
+    moves: List[tuple] = []
 
     for uf in files:
         filename = (uf.filename or "").strip()
@@ -179,34 +289,41 @@ async def upload_files_to_group(
             # пропускаем неразрешённые расширения/маковский мусор
             continue
 
-        # путь назначения
+        # путь назначения; пока меты не записаны, файл лежит в staging
         dst_path = raw_dir / filename
-        await _save_upload_to_path(dst_path, uf)
+        staged_path = staging / filename
+        await _save_upload_to_path(staged_path, uf)
+        moves.append((staged_path, dst_path))
 
         # метаданные файла
         fid = _fid()
+        created_at = now_iso()
         meta = {
             "file_uuid": fid,
             "group_uuid": group_uuid,
             "original_name": filename,
             "raw_path": str(dst_path),
             "status": FileStatus.progress.value,
-            "created_at": now_iso(),
+            "created_at": created_at,
+            "stages": {FileStatus.progress.value: created_at},
         }
-
-        # statuses/{fid}.json + store/files/{fid}.json
-        await atomic_write_json(group_dir_status(group_uuid) / f"{fid}.json", meta)
-        await store.create(f"files/{fid}", meta, overwrite=True)
-            
+        metas.append(meta)
+        saved.append(dst_path)
         created.append(FileOut(
             file_uuid=fid, group_uuid=group_uuid, filename=filename, status=FileStatus.progress
         ))
-        created_ids.append(fid)
-        start_ml_pipeline.send(group_uuid)
     if not created:
         raise HTTPException(http.HTTP_400_BAD_REQUEST, "no valid files to upload")
 
-    await _append_group_index(group_uuid, created_ids)
+    # store/files/{fid}.json — одной пачкой
+    await _write_file_metas(group_uuid, metas)
+    first_index = await _append_group_index(group_uuid, [m["file_uuid"] for m in metas])
+    await progress_tracker.add_files(group_uuid, len(metas))
+    await _publish_staged(staging, moves)
+
+    for index, (dst_path, meta) in enumerate(zip(saved, metas), start=first_index):
+        publish_file_status(meta)
+        _dispatch_ml_pipeline(group_uuid, dst_path, index)
     return created
 
 
@@ -221,6 +338,8 @@ async def create_group_and_upload_files(
 ):
     group_uuid = _gid()
     ensure_group_dirs(group_uuid)
+    await status_journal.create(group_uuid)
+    await progress_tracker.create(group_uuid)
 
     group_doc = {
         "group_uuid": group_uuid,
@@ -1,21 +1,23 @@
 # src/api/v1/endpoints/pipeline_callback.py
 from pathlib import Path
 import httpx, urllib.parse, time, os
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import APIRouter, HTTPException, status as http, BackgroundTasks
 
-from src.core.configs import configs
 from src.tasks.ml_tasks import start_postproccessing_pipeline
-from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
-from src.api.v1.schemas.file_schemas import FileStatus, FileOut, FileStatusModel
-from src.utils.common import group_dir_status, atomic_write_json, _resolve_fid_by_filename
+from src.infra.storage.factory import get_store
+from src.api.v1.schemas.file_schemas import FileStatus, FileOut, FileStatusModel, CallbackBulkIn, CallbackBulkOut
+from src.utils.common import _resolve_fid_by_filename, stage_key, now_iso
+from src.services.progress.progress import progress_tracker, stamp_stage
+from src.services.events.events import publish_file_status
+from src.services.journal.journal import status_journal
 
 router = APIRouter(prefix="/pipeline", tags=["pipeline"])
-store = AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(base_dir=configs.dirs.store))
+store = get_store()
 
 
-@router.post("/callback_postprocessing", response_model=FileOut)
-async def pipeline_callback(payload: dict):
+async def _apply_status(payload: dict) -> Tuple[str, str, dict]:
+    """Записать статус из callback'а: вернуть (group_uuid, file_uuid, meta)."""
     gid = payload.get("group_uuid")
     filename = payload.get("filename")
     fid: Optional[str] = payload.get("file_uuid")
@@ -23,55 +25,90 @@ async def pipeline_callback(payload: dict):
 
     if not gid or not filename:
         raise HTTPException(http.HTTP_400_BAD_REQUEST, "group_uuid and filename are required")
+    try:
+        status = FileStatus(status).value
+    except ValueError:
+        # неизвестный статус в meta сломал бы все чтения файла (FileOut, status:batch)
+        raise HTTPException(http.HTTP_400_BAD_REQUEST, {"message": "unknown status", "status": status})
 
     if not fid:
         fid = await _resolve_fid_by_filename(gid, filename)
         if not fid:
             raise HTTPException(http.HTTP_404_NOT_FOUND, {"message": "file not found for given filename", "filename": filename})
 
-    meta_key = f"files/{fid}"
-    if not await store.exists(meta_key):
+    # имя JSON-результата стадии: GET /files/{id}/content найдёт его без glob
+    # (старый postprocessing не шлёт result_filename, но его filename и есть имя результата)
+    result_name = payload.get("result_filename") or (filename if filename.endswith(".json") else None)
+
+    changed: Dict[str, Any] = {}
+
+    def _patch(meta: dict) -> dict:
+        changed["old_status"] = meta.get("status")
+        meta["status"] = status
+        meta["updated_at"] = now_iso()
+        changed["first_time"] = stamp_stage(meta, status)
+        if result_name:
+            meta.setdefault("results", {})[stage_key(status)] = Path(result_name).name
+        changed["meta"] = meta
+        return meta
+
+    # update, а не read+replace: параллельный callback/PATCH из другого воркера не потеряется
+    try:
+        await store.update(f"files/{fid}", _patch)
+    except FileNotFoundError:
         raise HTTPException(http.HTTP_404_NOT_FOUND, "file not found")
+    meta, old_status, first_time = changed["meta"], changed["old_status"], changed["first_time"]
 
-    meta = await store.read(meta_key)
-    meta["status"] = status
-
-    await store.replace(meta_key, meta)
-    await atomic_write_json(group_dir_status(gid) / f"{fid}.json", meta)
-
-    return FileOut(file_uuid=fid, group_uuid=gid, filename=meta.get("filename") or "", status=status)
-
-@router.post("/callback_ocr", response_model=FileOut)
-async def pipeline_callback(payload: dict, background_tasks: BackgroundTasks):
-    gid = payload.get("group_uuid")
-    filename = payload.get("filename")
-    fid: Optional[str] = payload.get("file_uuid")
-    status = payload.get("status")
+    await status_journal.append(gid, [meta])
+    await progress_tracker.record_transition(gid, old_status, status, first_time)
+    publish_file_status(meta)
+    return gid, fid, meta
 
-    if not gid or not filename:
-        raise HTTPException(http.HTTP_400_BAD_REQUEST, "group_uuid and filename are required")
 
-    if not fid:
-        fid = await _resolve_fid_by_filename(gid, filename)
-        if not fid:
-            raise HTTPException(http.HTTP_404_NOT_FOUND, {"message": "file not found for given filename", "filename": filename})
+def _start_postprocessing(background_tasks: BackgroundTasks, gid: str) -> None:
+    callback_url = f"http://backend:8000/api/v1/pipeline/callback_postprocessing"
+    background_tasks.add_task(
+        start_postproccessing_pipeline,
+        "http://postprocessing", 8000, "process", "final", gid, callback_url
+    )
 
-    meta_key = f"files/{fid}"
-    if not await store.exists(meta_key):
-        raise HTTPException(http.HTTP_404_NOT_FOUND, "file not found")
 
-    meta = await store.read(meta_key)
-    meta["status"] = status
+@router.post("/callback_postprocessing", response_model=FileOut)
+async def pipeline_callback(payload: dict):
+    gid, fid, meta = await _apply_status(payload)
+    return FileOut(file_uuid=fid, group_uuid=gid, filename=meta.get("filename") or "", status=meta["status"])
 
-    await store.replace(meta_key, meta)
-    await atomic_write_json(group_dir_status(gid) / f"{fid}.json", meta)
+@router.post("/callback_ocr", response_model=FileOut)
+async def pipeline_callback(payload: dict, background_tasks: BackgroundTasks):
+    gid, fid, meta = await _apply_status(payload)
 
-    if status == "upgrading":
-        callback_url = f"http://backend:8000/api/v1/pipeline/callback_postprocessing"
-        background_tasks.add_task(
-            start_postproccessing_pipeline,
-            "http://postprocessing", 8000, "process", "final", gid, callback_url
-        )
+    if meta["status"] == "upgrading":
+        _start_postprocessing(background_tasks, gid)
 	# start_postproccessing_pipeline("http://postprocessing", 8000, "process", "final", gid, callback_url)
 
-    return FileOut(file_uuid=fid, group_uuid=gid, filename=meta.get("filename") or "", status=status)
+    return FileOut(file_uuid=fid, group_uuid=gid, filename=meta.get("filename") or "", status=meta["status"])
+
+@router.post("/callback_ocr/bulk", response_model=CallbackBulkOut)
+async def pipeline_callback_bulk(body: CallbackBulkIn, background_tasks: BackgroundTasks):
+    """Пачка статусов от ml-pipeline: ошибки по отдельным файлам не валят остальные."""
+    out = CallbackBulkOut()
+    upgraded_groups: List[str] = []
+
+    for payload in body.items:
+        try:
+            gid, fid, meta = await _apply_status(payload)
+        except HTTPException as e:
+            out.failed.append({
+                "group_uuid": payload.get("group_uuid"), "filename": payload.get("filename"),
+                "status_code": e.status_code, "detail": e.detail,
+            })
+            continue
+        out.updated.append(FileOut(file_uuid=fid, group_uuid=gid, filename=meta.get("filename") or "", status=meta["status"]))
+        if meta["status"] == "upgrading" and gid not in upgraded_groups:
+            upgraded_groups.append(gid)
+
+    # постобработка обходит всю папку process/ — достаточно одного запуска на группу
+    for gid in upgraded_groups:
+        _start_postprocessing(background_tasks, gid)
+
+    return out
@@ -1,5 +1,5 @@
 import enum
-from typing import Any
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -26,3 +26,22 @@ class FileContentOut(BaseModel):
 
 class FileContentIn(BaseModel):
     json: Any
+
+class CallbackBulkIn(BaseModel):
+    items: List[Dict[str, Any]]
+
+class CallbackBulkOut(BaseModel):
+    updated: List[FileOut] = Field(default_factory=list)
+    failed: List[Dict[str, Any]] = Field(default_factory=list)
+
+class FileStatusBatchIn(BaseModel):
+    file_uuids: List[str] = Field(..., min_length=1, max_length=1000)
+
+class FileStatusBatchItem(FileOut):
+    result_filename: Optional[str] = None  # JSON-результат текущей стадии, если уже записан
+    content_url: Optional[str] = None
+
+class FileStatusBatchOut(BaseModel):
+    files: List[FileStatusBatchItem] = Field(default_factory=list)
+    missing: List[str] = Field(default_factory=list)
+    invalid: List[str] = Field(default_factory=list)  # meta есть, но статус не из FileStatus
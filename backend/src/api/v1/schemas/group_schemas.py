@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic import BaseModel, Field
 
@@ -15,3 +15,20 @@ class GroupPatch(BaseModel):
     fond: Optional[str] = None
     opis: Optional[str] = None
     delo: Optional[str] = None
+
+class StageProgress(BaseModel):
+    reached: int = 0
+    first_at: Optional[str] = None
+    last_at: Optional[str] = None
+    throughput_per_min: Optional[float] = None
+
+class GroupProgressOut(BaseModel):
+    group_uuid: str
+    total: int
+    counts: Dict[str, int]
+    percent_done: float
+    stages: Dict[str, StageProgress]
+    started_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    elapsed_seconds: float
+    eta_seconds: Optional[float] = None
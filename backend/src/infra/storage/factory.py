@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+from src.core.configs import configs
+from src.infra.storage.interface import AsyncFileStorageI
+
+
+@lru_cache(maxsize=None)
+def get_store() -> AsyncFileStorageI:
+    """Хранилище, выбранное в configs.store.backend; один экземпляр на процесс."""
+    if configs.store.backend == "sqlite":
+        from src.infra.storage.sqlite_storage import AsyncSqliteJsonStore, SqliteStoreConfig
+        return AsyncSqliteJsonStore(SqliteStoreConfig(
+            path=configs.store.sqlite_path,
+            readers=configs.store.sqlite_readers,
+            # писатель и так коммитит пачку записей одной транзакцией — это и есть group commit
+            synchronous="NORMAL" if configs.store.durability == "relaxed" else "FULL",
+        ))
+
+    from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
+    return AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(
+        base_dir=configs.dirs.store,
+        cache_size=configs.store.cache_size,
+        shard_depth=configs.store.shard_depth,
+        shard_width=configs.store.shard_width,
+        durability=configs.store.durability,
+        group_commit_window=configs.store.group_commit_ms / 1000,
+    ))
@@ -1,16 +1,34 @@
 from __future__ import annotations
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, Awaitable, Callable, Iterable, Optional, Union
+from functools import partial
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple, Union
 
 
 Json = Any
 PatchFn = Union[Callable[[Json], Json], Callable[[Json], Awaitable[Json]]]
 
+DEFAULT_BULK_CONCURRENCY = 32
+
+
+async def gather_bounded(calls: Iterable[Callable[[], Awaitable[Any]]], limit: int) -> List[Any]:
+    """Выполнить вызовы не более чем по limit одновременно; результаты — в порядке вызовов."""
+    sem = asyncio.Semaphore(max(1, limit))
+
+    async def _one(call):
+        async with sem:
+            return await call()
+
+    return list(await asyncio.gather(*(_one(c) for c in calls)))
+
 
 class AsyncFileStorageI(ABC):
     """Асинхронный интерфейс JSON-хранилища."""
 
+    # поля, по которым query() отвечает по индексу, а не перебором
+    indexed_fields: Tuple[str, ...] = ()
+
     @abstractmethod
     async def create(self, key: str, data: Json, *, overwrite: bool = False) -> None: ...
     @abstractmethod
@@ -30,4 +48,36 @@ class AsyncFileStorageI(ABC):
     @abstractmethod
     async def list(self, prefix: str = "", *, recursive: bool = True) -> Iterable[str]: ...
 
+    async def read_or_none(self, key: str) -> Optional[Json]:
+        """Прочитать ключ или вернуть None, если его нет (без отдельного exists)."""
+        try:
+            return await self.read(key)
+        except (FileNotFoundError, KeyError):
+            return None
+
+    # ---------- Пакетные операции (порядок результатов = порядок ключей) ----------
+
+    async def read_many(self, keys: Iterable[str]) -> List[Optional[Json]]:
+        """Прочитать ключи параллельно; None на месте отсутствующих."""
+        return await gather_bounded([partial(self.read_or_none, k) for k in keys], DEFAULT_BULK_CONCURRENCY)
+
+    async def exists_many(self, keys: Iterable[str]) -> List[bool]:
+        return await gather_bounded([partial(self.exists, k) for k in keys], DEFAULT_BULK_CONCURRENCY)
+
+    async def delete_many(self, keys: Iterable[str], *, missing_ok: bool = True) -> None:
+        await gather_bounded([partial(self.delete, k, missing_ok=missing_ok) for k in keys],
+                             DEFAULT_BULK_CONCURRENCY)
+
+    async def create_many(self, items: Iterable[Tuple[str, Json]], *, overwrite: bool = False) -> None:
+        await gather_bounded([partial(self.create, k, v, overwrite=overwrite) for k, v in items],
+                             DEFAULT_BULK_CONCURRENCY)
 
+    async def query(self, prefix: str, **equals: Any) -> List[Json]:
+        """
+        Документы непосредственно под prefix, у которых поля верхнего уровня равны equals,
+        в порядке ключей. Базовая версия читает все документы; реализации с индексами
+        (SQLite) отвечают на запрос по индексу.
+        """
+        docs = await self.read_many(sorted(await self.list(prefix, recursive=False)))
+        return [d for d in docs
+                if isinstance(d, dict) and all(d.get(f) == v for f, v in equals.items())]
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import ctypes
+import ctypes.util
+import hashlib
 import json
 import os
 import tempfile
+from collections import OrderedDict
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import Any, Awaitable, Callable, Iterable, Optional, Union, Dict
+from typing import Any, Awaitable, Callable, Iterable, List, Literal, Optional, Union, Dict, Tuple
 
 import aiofiles
 
-from src.infra.storage.interface import AsyncFileStorageI 
+try:
+    import fcntl
+except ImportError:  # не POSIX: остаётся только блокировка внутри процесса
+    fcntl = None
+
+from src.infra.storage.interface import AsyncFileStorageI, gather_bounded
 
 Json = Any
 PatchFn = Union[Callable[[Json], Json], Callable[[Json], Awaitable[Json]]]
@@ -23,82 +34,245 @@ class JsonFileStoreConfig:
     encoding: str = "utf-8"
     suffix: str = ".json"
     max_io_concurrency: int = 64  # ограничение параллелизма
+    cache_size: int = 0  # сколько документов держать в LRU-кэше чтения (0 — без кэша)
+    lock_stripes: int = 256  # lock-файлов в base_dir/.locks, между которыми делятся ключи
+    # раскладка "коллекция/ab/cd/имя.json": shard_depth уровней по shard_width hex-символов хэша имени
+    shard_depth: int = 0
+    shard_width: int = 2
+    # strict — fsync каждой записи; group_commit — один сброс ФС (syncfs) на все записи,
+    # пришедшие в пределах окна; relaxed — без fsync (атомарность rename остаётся, свежие записи может унести сбой питания)
+    durability: Literal["strict", "group_commit", "relaxed"] = "strict"
+    group_commit_window: float = 0.005  # секунд
+
+
+LAYOUT_MARKER = ".layout"
+
+
+def _load_syncfs() -> Optional[Callable[[int], int]]:
+    # syncfs(2) — один сброс всей ФС: дешевле, чем fsync на каждый файл пачки
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fn = libc.syncfs
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int]
+    return fn
+
+
+_syncfs = _load_syncfs()
+
+
+class _GroupCommit:
+    """
+    Копит записи, пришедшие в пределах окна, и делает им один сброс на диск:
+    syncfs(2) по файловой системе хранилища (Linux), иначе — параллельные fsync пачки,
+    которые журнал ФС объединяет в один коммит.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._pending: List[Tuple[int, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def fsync(self, fd: int) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        # свой дескриптор: если ждущего отменят и он закроет fd, номер не уйдёт чужому файлу
+        self._pending.append((os.dup(fd), fut))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        await fut
+
+    async def _flush(self) -> None:
+        # пока ждём окно или сбрасываем пачку, приходят новые записи — они попадут в следующий круг
+        while self._pending:
+            await asyncio.sleep(self.window)
+            batch, self._pending = self._pending, []
+            fds = [fd for fd, _ in batch]
+            try:
+                if _syncfs is not None:
+                    errors = await asyncio.to_thread(self._syncfs, fds)
+                else:
+                    errors = await asyncio.gather(*(asyncio.to_thread(self._fsync, fd) for fd in fds))
+            finally:
+                for fd in fds:
+                    os.close(fd)
+            for (_, fut), err in zip(batch, errors):
+                if fut.done():
+                    continue
+                if err is None:
+                    fut.set_result(None)
+                else:
+                    fut.set_exception(err)
+
+    @staticmethod
+    def _syncfs(fds: List[int]) -> List[Optional[OSError]]:
+        # все файлы пачки — в одном base_dir, значит на одной ФС
+        if _syncfs(fds[0]) != 0:
+            err = OSError(ctypes.get_errno(), "syncfs failed")
+            return [err] * len(fds)
+        return [None] * len(fds)
+
+    @staticmethod
+    def _fsync(fd: int) -> Optional[OSError]:
+        try:
+            os.fsync(fd)
+            return None
+        except OSError as e:
+            return e
+
+
+# (st_ino, st_mtime_ns, st_size): атомарная запись через os.replace всегда меняет inode
+_FileSig = Tuple[int, int, int]
+
+def _sig(st: os.stat_result) -> _FileSig:
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _shard_dirs(name: str, depth: int, width: int) -> List[str]:
+    # хэш, а не префикс имени: равномерно для любых ключей, не только uuid
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=16).hexdigest()
+    return [digest[i * width:(i + 1) * width] for i in range(depth)]
+
+
+def logical_key(rel: Path, shard_depth: int, shard_width: int) -> str:
+    """Ключ по пути файла относительно base_dir: каталоги шардов отбрасываются."""
+    parts = rel.parts
+    if shard_depth and len(parts) == shard_depth + 2 and all(len(d) == shard_width for d in parts[1:-1]):
+        return f"{parts[0]}/{parts[-1]}"
+    return "/".join(parts)
+
+
+def _copy_json(data: Json) -> Json:
+    """Копия JSON-документа: вызывающий код меняет прочитанные dict'ы на месте."""
+    if isinstance(data, dict):
+        return {k: _copy_json(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_copy_json(v) for v in data]
+    return data
 
 
 class AsyncLocalJsonFileStoreAiofiles(AsyncFileStorageI):
     """
     Реализация на локальной ФС:
     - Чтение/запись файлов через aiofiles.
-    - Атомарная запись: временный файл (+ fsync) → os.replace.
-    - Пер-файловые asyncio.Lock для сериализации конкурентных записей.
+    - Атомарная запись: временный файл (+ fsync по durability) → os.replace.
+    - Запись сериализуется блокировкой полосы (stripe) ключа: asyncio.Lock внутри
+      процесса + flock на .locks/{stripe}.lock между процессами (uvicorn --workers N).
     - Оптимистичная блокировка по mtime (if_match_mtime).
+    - Опциональный LRU-кэш чтения (cache_size > 0). Запись через этот экземпляр
+      обновляет кэш; запись извне (другой экземпляр, процесс) ловится сверкой
+      inode/mtime/size по stat перед отдачей из кэша.
+    - Опциональная раскладка по шардам (shard_depth > 0) для коллекций с миллионами
+      ключей. Пока migrate_layout() не отработал, файлы ищутся и по старому плоскому пути.
     """
 
     def __init__(self, config: JsonFileStoreConfig):
         self.cfg = config
         self._base_dir: Path = self.cfg.base_dir.resolve()
         self._base_dir.mkdir(parents=True, exist_ok=True)
-        self._locks: Dict[Path, asyncio.Lock] = {}
+        self._lock_dir = self._base_dir / ".locks"
+        self._lock_dir.mkdir(exist_ok=True)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._lock_fds: Dict[int, int] = {}
         self._locks_guard = asyncio.Lock()
         self._io_sem = asyncio.Semaphore(self.cfg.max_io_concurrency)
+        self._group_commit = _GroupCommit(self.cfg.group_commit_window)
+        self._cache: "OrderedDict[Path, Tuple[_FileSig, Json]]" = OrderedDict()
+        # плоский путь проверяем, пока метка раскладки не подтвердила завершённую миграцию
+        self._legacy_fallback = self.cfg.shard_depth > 0 and self._read_layout() != self._layout()
 
     # ---------- Публичные методы ----------
 
     async def create(self, key: str, data: Json, *, overwrite: bool = False) -> None:
         path = self._key_to_path(key)
-        if not overwrite and await self._exists(path):
-            raise FileExistsError(f"Key already exists: {key}")
-        await self._atomic_write(path, data)
+        # проверка и запись под блокировкой: из двух конкурентных create пройдёт один
+        async with self._locked(path):
+            if not overwrite and await self._existing_path(key) is not None:
+                raise FileExistsError(f"Key already exists: {key}")
+            await self._atomic_write(path, data)
+            await self._drop_legacy(key)
 
     async def read(self, key: str) -> Json:
         path = self._key_to_path(key)
+        legacy = self._legacy_path(key)
+        if legacy is None:
+            return await self._read_path(path)
+        try:
+            return await self._read_path(path)
+        except FileNotFoundError:
+            pass
+        try:
+            return await self._read_path(legacy)
+        except FileNotFoundError:
+            # migrate_layout мог перенести файл между двумя попытками
+            return await self._read_path(path)
+
+    async def _read_path(self, path: Path) -> Json:
+        cached = self._cache_get(path)
+        if cached is not None:
+            return cached
         async with self._io_sem:
             async with aiofiles.open(path, "r", encoding=self.cfg.encoding) as f:
+                # stat открытого файла: подпись точно соответствует прочитанному содержимому
+                sig = _sig(os.fstat(f.fileno())) if self.cfg.cache_size > 0 else None
                 text = await f.read()
-            return json.loads(text)
+            data = json.loads(text)
+        if sig is not None:
+            self._cache_put(path, sig, data)
+        return data
+
+    async def read_or_none(self, key: str) -> Optional[Json]:
+        try:
+            return await self.read(key)
+        except FileNotFoundError:
+            return None
 
     async def replace(
         self, key: str, data: Json, *, if_match_mtime: Optional[float] = None
     ) -> float:
         path = self._key_to_path(key)
-        lock = await self._lock_for(path)
-        async with lock:
+        async with self._locked(path):
             if if_match_mtime is not None:
-                current = await self._mtime_or_none(path)
-                if current is None or abs(current - if_match_mtime) > 1e-9:
-                    raise FileExistsError(f"Concurrent modification detected for {key}")
+                await self._check_mtime(key, if_match_mtime)
             await self._atomic_write(path, data)
+            await self._drop_legacy(key)
             return await self._mtime(path)
 
     async def update(
         self, key: str, patch: PatchFn, *, if_match_mtime: Optional[float] = None
     ) -> float:
         path = self._key_to_path(key)
-        lock = await self._lock_for(path)
-        async with lock:
+        async with self._locked(path):
             if if_match_mtime is not None:
-                current = await self._mtime_or_none(path)
-                if current is None or abs(current - if_match_mtime) > 1e-9:
-                    raise FileExistsError(f"Concurrent modification detected for {key}")
+                await self._check_mtime(key, if_match_mtime)
 
             data = await self.read(key)
             new_data = patch(data)
             if asyncio.iscoroutine(new_data):
                 new_data = await new_data
             await self._atomic_write(path, new_data)
+            await self._drop_legacy(key)
             return await self._mtime(path)
 
     async def delete(self, key: str, *, missing_ok: bool = False) -> None:
         path = self._key_to_path(key)
-        async with self._io_sem:
-            try:
-                await asyncio.to_thread(path.unlink)
-            except FileNotFoundError:
-                if not missing_ok:
-                    raise
+        async with self._locked(path):
+            deleted = False
+            for p in (path, self._legacy_path(key)):
+                if p is None:
+                    continue
+                self._cache.pop(p, None)
+                async with self._io_sem:
+                    try:
+                        await asyncio.to_thread(p.unlink)
+                        deleted = True
+                    except FileNotFoundError:
+                        pass
+            if not deleted and not missing_ok:
+                raise FileNotFoundError(f"Key not found: {key}")
 
     async def exists(self, key: str) -> bool:
-        return await self._exists(self._key_to_path(key))
+        return await self._existing_path(key) is not None
 
     async def list(self, prefix: str = "", *, recursive: bool = True) -> Iterable[str]:
         base = (self._base_dir / prefix).resolve()
@@ -107,31 +281,212 @@ class AsyncLocalJsonFileStoreAiofiles(AsyncFileStorageI):
             return []
         async with self._io_sem:
             def _scan():
-                it = base.rglob(f"*{self.cfg.suffix}") if recursive else base.glob(f"*{self.cfg.suffix}")
-                return [str(p.relative_to(self._base_dir)) for p in it if p.is_file()]
+                pattern = f"*{self.cfg.suffix}"
+                if recursive:
+                    it = base.rglob(pattern)
+                else:
+                    it = list(base.glob(pattern))
+                    if self.cfg.shard_depth:
+                        it += list(base.glob("/".join(["*"] * self.cfg.shard_depth + [pattern])))
+                # ключи — логические (без каталогов шардов); служебные .tmp_/.locks пропускаем
+                keys = (self._logical_key(p) for p in it
+                        if not p.name.startswith(".") and p.is_file())
+                return list(dict.fromkeys(keys))
             return await asyncio.to_thread(_scan)
 
+    async def migrate_layout(self) -> int:
+        """
+        Перенести файлы из плоской раскладки (коллекция/имя.json) в шарды.
+        Работает онлайн: каждый файл переносится под той же блокировкой, что и запись,
+        а чтение на время переноса смотрит оба пути. В конце пишет метку раскладки.
+        Смена shard_depth/shard_width у уже шардированного хранилища не поддерживается.
+
+        Returns:
+            Число перенесённых файлов
+        """
+        if not self.cfg.shard_depth:
+            return 0
+        moved = 0
+        collections = sorted(p for p in self._base_dir.iterdir() if p.is_dir() and not p.name.startswith("."))
+        for coll in collections:
+            flat = await asyncio.to_thread(
+                lambda: [p for p in coll.glob(f"*{self.cfg.suffix}") if p.is_file() and not p.name.startswith(".")]
+            )
+            for legacy in flat:
+                path = self._key_to_path(f"{coll.name}/{legacy.stem}")
+                async with self._locked(path):
+                    def _move():
+                        if not legacy.exists():
+                            return False
+                        if path.exists():
+                            # ключ уже перезаписан в новой раскладке — плоская копия устарела
+                            legacy.unlink()
+                            return False
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        os.replace(legacy, path)
+                        return True
+                    if await asyncio.to_thread(_move):
+                        moved += 1
+                    self._cache.pop(legacy, None)
+        await asyncio.to_thread(self._write_layout)
+        self._legacy_fallback = False
+        return moved
+
+    # ---------- Пакетные операции ----------
+    # Параллелизм ограничен max_io_concurrency; порядок результатов совпадает с порядком ключей.
+
+    async def read_many(self, keys: Iterable[str]) -> List[Optional[Json]]:
+        return await gather_bounded([partial(self.read_or_none, k) for k in keys], self.cfg.max_io_concurrency)
+
+    async def exists_many(self, keys: Iterable[str]) -> List[bool]:
+        return await gather_bounded([partial(self.exists, k) for k in keys], self.cfg.max_io_concurrency)
+
+    async def delete_many(self, keys: Iterable[str], *, missing_ok: bool = True) -> None:
+        await gather_bounded([partial(self.delete, k, missing_ok=missing_ok) for k in keys],
+                             self.cfg.max_io_concurrency)
+
+    async def create_many(self, items: Iterable[Tuple[str, Json]], *, overwrite: bool = False) -> None:
+        await gather_bounded([partial(self.create, k, v, overwrite=overwrite) for k, v in items],
+                             self.cfg.max_io_concurrency)
+
     # ---------- Внутреннее ----------
 
     def _key_to_path(self, key: str) -> Path:
+        """Путь ключа в текущей раскладке."""
+        flat = self._flat_path(key)
+        if not self.cfg.shard_depth:
+            return flat
+        rel = flat.relative_to(self._base_dir)
+        if len(rel.parts) != 2:
+            # шардируем только ключи вида "коллекция/имя"
+            return flat
+        dirs = _shard_dirs(flat.stem, self.cfg.shard_depth, self.cfg.shard_width)
+        return flat.parent.joinpath(*dirs, flat.name)
+
+    def _flat_path(self, key: str) -> Path:
         p = (self._base_dir / key).with_suffix(self.cfg.suffix)
         p = p.resolve()
         self._ensure_within_base(p)
         return p
 
+    def _legacy_path(self, key: str) -> Optional[Path]:
+        """Плоский путь ключа, если он ещё может быть занят немигрированным файлом."""
+        if not self._legacy_fallback:
+            return None
+        flat = self._flat_path(key)
+        return None if flat == self._key_to_path(key) else flat
+
+    def _logical_key(self, p: Path) -> str:
+        return logical_key(p.relative_to(self._base_dir), self.cfg.shard_depth, self.cfg.shard_width)
+
+    async def _existing_path(self, key: str) -> Optional[Path]:
+        for p in (self._key_to_path(key), self._legacy_path(key)):
+            if p is not None and await self._exists(p):
+                return p
+        return None
+
+    async def _drop_legacy(self, key: str) -> None:
+        """После записи в новую раскладку плоская копия ключа больше не нужна (вызывать под блокировкой)."""
+        legacy = self._legacy_path(key)
+        if legacy is None:
+            return
+        self._cache.pop(legacy, None)
+        try:
+            await asyncio.to_thread(legacy.unlink)
+        except FileNotFoundError:
+            pass
+
+    async def _check_mtime(self, key: str, if_match_mtime: float) -> None:
+        existing = await self._existing_path(key)
+        current = await self._mtime_or_none(existing) if existing is not None else None
+        if current is None or abs(current - if_match_mtime) > 1e-9:
+            raise FileExistsError(f"Concurrent modification detected for {key}")
+
+    def _layout(self) -> Dict[str, int]:
+        return {"shard_depth": self.cfg.shard_depth, "shard_width": self.cfg.shard_width}
+
+    def _read_layout(self) -> Optional[Dict[str, int]]:
+        try:
+            return json.loads((self._base_dir / LAYOUT_MARKER).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_layout(self) -> None:
+        tmp = self._base_dir / f"{LAYOUT_MARKER}.tmp"
+        tmp.write_text(json.dumps(self._layout()), encoding="utf-8")
+        os.replace(tmp, self._base_dir / LAYOUT_MARKER)
+
     def _ensure_within_base(self, p: Path) -> None:
         base = self._base_dir.resolve()
         if not str(p).startswith(str(base) + os.sep) and p != base:
             raise ValueError(f"Path escapes base_dir: {p}")
 
-    async def _lock_for(self, p: Path) -> asyncio.Lock:
+    def _cache_get(self, p: Path) -> Optional[Json]:
+        entry = self._cache.get(p)
+        if entry is None:
+            return None
+        # stat без to_thread: это один системный вызов, дешевле, чем прыжок в пул потоков
+        try:
+            current = _sig(os.stat(p))
+        except FileNotFoundError:
+            current = None
+        sig, data = entry
+        if current != sig:
+            # файл изменили или удалили в обход этого экземпляра
+            self._cache.pop(p, None)
+            return None
+        self._cache.move_to_end(p)
+        return _copy_json(data)
+
+    def _cache_put(self, p: Path, sig: _FileSig, data: Json) -> None:
+        self._cache[p] = (sig, _copy_json(data))
+        self._cache.move_to_end(p)
+        while len(self._cache) > self.cfg.cache_size:
+            self._cache.popitem(last=False)
+
+    def _stripe(self, p: Path) -> int:
+        # стабильный между процессами хэш (hash() для str рандомизирован)
+        digest = hashlib.blake2b(str(p).encode("utf-8"), digest_size=4).digest()
+        return int.from_bytes(digest, "big") % max(1, self.cfg.lock_stripes)
+
+    async def _lock_for(self, stripe: int) -> asyncio.Lock:
         async with self._locks_guard:
-            lock = self._locks.get(p)
+            lock = self._locks.get(stripe)
             if lock is None:
                 lock = asyncio.Lock()
-                self._locks[p] = lock
+                self._locks[stripe] = lock
             return lock
 
+    def _lock_fd(self, stripe: int) -> int:
+        fd = self._lock_fds.get(stripe)
+        if fd is None:
+            fd = os.open(self._lock_dir / f"{stripe:04x}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_fds[stripe] = fd
+        return fd
+
+    @contextlib.asynccontextmanager
+    async def _locked(self, p: Path):
+        """Эксклюзивная блокировка ключа для этого процесса и для остальных воркеров."""
+        stripe = self._stripe(p)
+        async with await self._lock_for(stripe):
+            if fcntl is None:
+                yield
+                return
+            fd = self._lock_fd(stripe)
+            # LOCK_NB + опрос: не занимаем поток пула ожиданием и корректно снимаемся при отмене
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
     async def _mtime(self, p: Path) -> float:
         async with self._io_sem:
             return await asyncio.to_thread(lambda: p.stat().st_mtime)
@@ -167,11 +522,19 @@ class AsyncLocalJsonFileStoreAiofiles(AsyncFileStorageI):
                     text = json.dumps(data, ensure_ascii=False, indent=self.cfg.indent)
                     await tmp.write(text)
                     await tmp.flush()
-                    # fsync — в отдельном потоке (не блокируем loop)
-                    await asyncio.to_thread(os.fsync, tmp.fileno())
+            # fsync — в отдельном потоке (не блокируем loop) и вне семафора: group commit ждёт окно
+            if self.cfg.durability == "strict":
+                await asyncio.to_thread(os.fsync, fd)
+            elif self.cfg.durability == "group_commit":
+                await self._group_commit.fsync(fd)
+            # подпись до rename: inode и mtime переезжают вместе с файлом
+            sig = _sig(os.fstat(fd))
 
             # Атомарная замена — тоже в отдельном потоке
+            self._cache.pop(path, None)
             await asyncio.to_thread(os.replace, tmp_name, path)
+            if self.cfg.cache_size > 0:
+                self._cache_put(path, sig, data)
         except Exception:
             # Чистим временный файл
             try:
@@ -0,0 +1,74 @@
+"""
+Перенос JSON-хранилища (файл на ключ) в SQLite.
+
+    python -m src.infra.storage.migrate [--src var/data/store] [--dst var/data/store.sqlite3]
+
+Идемпотентен: повторный запуск перезаписывает ключи актуальными версиями файлов.
+Исходные файлы не удаляются — откат на STORE_BACKEND=json остаётся возможным.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+from src.core.configs import configs
+from src.infra.storage.local_storage import logical_key
+from src.infra.storage.sqlite_storage import index_columns, init_schema
+
+
+def migrate(src: Path, dst: Path, *, suffix: str = ".json", batch: int = 1000,
+            shard_depth: int = 0, shard_width: int = 2) -> int:
+    """Скопировать все документы из src в базу dst; вернуть число перенесённых ключей."""
+    src = src.resolve()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(dst, isolation_level=None)
+    init_schema(conn)
+
+    count = 0
+    rows = []
+
+    def _flush():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR REPLACE INTO docs (key, data, mtime, group_uuid, original_name, status) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute("COMMIT")
+        rows.clear()
+
+    for path in sorted(src.rglob(f"*{suffix}")):
+        if not path.is_file() or path.name.startswith("."):
+            continue
+        key = logical_key(path.relative_to(src).with_suffix(""), shard_depth, shard_width)
+        try:
+            text = path.read_text(encoding="utf-8")
+            data = json.loads(text)
+        except (OSError, ValueError) as e:
+            print(f"skip {path}: {e}", file=sys.stderr)
+            continue
+        rows.append((key, json.dumps(data, ensure_ascii=False), path.stat().st_mtime, *index_columns(data)))
+        count += 1
+        if len(rows) >= batch:
+            _flush()
+    if rows:
+        _flush()
+    conn.close()
+    return count
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Migrate the JSON file store to SQLite")
+    parser.add_argument("--src", type=Path, default=configs.dirs.store)
+    parser.add_argument("--dst", type=Path, default=configs.store.sqlite_path)
+    args = parser.parse_args(argv)
+
+    n = migrate(args.src, args.dst, shard_depth=configs.store.shard_depth, shard_width=configs.store.shard_width)
+    print(f"migrated {n} keys from {args.src} to {args.dst}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""
+Перенос JSON-хранилища из плоской раскладки (files/{uuid}.json) в шарды (files/ab/cd/{uuid}.json).
+
+    python -m src.infra.storage.reshard [--base var/data/store] [--depth 2] [--width 2]
+
+Онлайн: сервис может работать во время переноса, если у него те же STORE_SHARD_DEPTH/STORE_SHARD_WIDTH —
+каждый файл переносится под той же блокировкой, что и запись, а чтение смотрит оба пути.
+Повторный запуск безопасен: уже перенесённые ключи пропускаются.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from src.core.configs import configs
+from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Move the JSON file store to the sharded layout")
+    parser.add_argument("--base", type=Path, default=configs.dirs.store)
+    parser.add_argument("--depth", type=int, default=configs.store.shard_depth or 2)
+    parser.add_argument("--width", type=int, default=configs.store.shard_width)
+    args = parser.parse_args(argv)
+
+    if args.depth <= 0:
+        parser.error("--depth must be positive")
+    store = AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(
+        base_dir=args.base,
+        shard_depth=args.depth,
+        shard_width=args.width,
+    ))
+    n = asyncio.run(store.migrate_layout())
+    print(f"moved {n} keys in {args.base} to {args.depth}x{args.width} shards")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.infra.storage.interface import AsyncFileStorageI, Json, PatchFn
+
+
+_IN_CHUNK = 500  # ключей в одном WHERE key IN (...)
+
+# Поля документов, вынесенные в отдельные индексируемые колонки
+INDEXED_FIELDS = ("group_uuid", "original_name", "status")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    key           TEXT PRIMARY KEY,
+    data          TEXT NOT NULL,
+    mtime         REAL NOT NULL,
+    group_uuid    TEXT,
+    original_name TEXT,
+    status        TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS docs_group_status ON docs(group_uuid, status);
+CREATE INDEX IF NOT EXISTS docs_original_name ON docs(original_name);
+CREATE INDEX IF NOT EXISTS docs_status ON docs(status);
+"""
+
+
+@dataclass(frozen=True)
+class SqliteStoreConfig:
+    path: Path
+    readers: int = 4              # потоков-читателей, у каждого своё соединение
+    busy_timeout_ms: int = 5000
+    synchronous: str = "FULL"     # как fsync у JSON-хранилища
+    max_write_batch: int = 256    # записей в одной транзакции писателя
+    lock_stripes: int = 256       # asyncio-локов update, между которыми делятся ключи
+
+
+def _norm_key(key: str) -> str:
+    # list() отдаёт ключи с ".json", как файловое хранилище, — принимаем оба вида
+    key = key.strip("/")
+    return key[:-5] if key.endswith(".json") else key
+
+
+def _prefix_range(prefix: str) -> Tuple[str, str]:
+    """Диапазон ключей 'prefix/...' для поиска по первичному ключу."""
+    prefix = _norm_key(prefix)
+    if not prefix:
+        return "", "\uffff"
+    return prefix + "/", prefix + "0"  # '0' — следующий символ после '/'
+
+
+def index_columns(data: Json) -> Tuple[Optional[str], ...]:
+    if not isinstance(data, dict):
+        return (None,) * len(INDEXED_FIELDS)
+    return tuple(
+        data.get(f) if isinstance(data.get(f), str) else None
+        for f in INDEXED_FIELDS
+    )
+
+
+def init_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+
+
+class _Conflict(Exception):
+    """CAS по mtime не прошёл (внутренний сигнал update)."""
+
+
+class AsyncSqliteJsonStore(AsyncFileStorageI):
+    """
+    Реализация на SQLite:
+    - WAL: читатели не блокируют писателя и друг друга.
+    - Один поток-писатель: записи из очереди применяются пачками в одной транзакции.
+    - Пул потоков-читателей с собственными соединениями.
+    - Индексы по group_uuid, original_name, status — для query() без перебора документов.
+    - Оптимистичная блокировка по mtime (if_match_mtime), как у файлового хранилища.
+    """
+
+    indexed_fields = INDEXED_FIELDS
+
+    def __init__(self, config: SqliteStoreConfig):
+        self.cfg = config
+        self.cfg.path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.cfg.path) as conn:
+            init_schema(conn)
+        conn.close()
+
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(max_workers=self.cfg.readers, thread_name_prefix="sqlite-reader")
+        self._writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._writer_loop: Optional[asyncio.AbstractEventLoop] = None
+        # страйпы, а не лок на ключ: словарь не растёт с числом ключей
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    # ---------- Публичные методы ----------
+
+    async def create(self, key: str, data: Json, *, overwrite: bool = False) -> None:
+        await self._write(("create", _norm_key(key), data, overwrite))
+
+    async def read(self, key: str) -> Json:
+        data, _ = await self._read_with_mtime(_norm_key(key))
+        return data
+
+    async def read_or_none(self, key: str) -> Optional[Json]:
+        row = await self._run_reader(self._select_one, _norm_key(key))
+        return None if row is None else json.loads(row[0])
+
+    async def replace(
+        self, key: str, data: Json, *, if_match_mtime: Optional[float] = None
+    ) -> float:
+        key = _norm_key(key)
+        try:
+            return await self._write(("put", key, data, if_match_mtime))
+        except _Conflict:
+            raise FileExistsError(f"Concurrent modification detected for {key}")
+
+    async def update(
+        self, key: str, patch: PatchFn, *, if_match_mtime: Optional[float] = None
+    ) -> float:
+        key = _norm_key(key)
+        # лок только снимает гонку внутри процесса; между процессами выручает CAS по mtime
+        stripe = hash(key) % max(1, self.cfg.lock_stripes)
+        lock = self._locks.setdefault(stripe, asyncio.Lock())
+        async with lock:
+            while True:
+                data, mtime = await self._read_with_mtime(key)
+                if if_match_mtime is not None and abs(mtime - if_match_mtime) > 1e-9:
+                    raise FileExistsError(f"Concurrent modification detected for {key}")
+                new_data = patch(data)
+                if asyncio.iscoroutine(new_data):
+                    new_data = await new_data
+                try:
+                    # CAS по прочитанному mtime: запись другого процесса между чтением и записью не теряется
+                    return await self._write(("put", key, new_data, mtime))
+                except _Conflict:
+                    if if_match_mtime is not None:
+                        raise FileExistsError(f"Concurrent modification detected for {key}")
+
+    async def delete(self, key: str, *, missing_ok: bool = False) -> None:
+        await self._write(("delete", _norm_key(key), missing_ok))
+
+    async def exists(self, key: str) -> bool:
+        return await self._run_reader(self._select_exists, _norm_key(key))
+
+    async def list(self, prefix: str = "", *, recursive: bool = True) -> Iterable[str]:
+        lo, hi = _prefix_range(prefix)
+        keys = await self._run_reader(self._select_keys, lo, hi)
+        if not recursive:
+            depth = lo.count("/")
+            keys = [k for k in keys if k.count("/") == depth]
+        return [f"{k}.json" for k in keys]
+
+    async def query(self, prefix: str, **equals: Any) -> List[Json]:
+        if any(f not in INDEXED_FIELDS for f in equals):
+            return await super().query(prefix, **equals)
+        lo, hi = _prefix_range(prefix)
+        rows = await self._run_reader(self._select_where, lo, hi, equals)
+        return [json.loads(r[0]) for r in rows]
+
+    # ---------- Пакетные операции ----------
+
+    async def read_many(self, keys: Iterable[str]) -> List[Optional[Json]]:
+        keys = [_norm_key(k) for k in keys]
+        found = await self._run_reader(self._select_many, keys, "data")
+        return [json.loads(found[k]) if k in found else None for k in keys]
+
+    async def exists_many(self, keys: Iterable[str]) -> List[bool]:
+        keys = [_norm_key(k) for k in keys]
+        found = await self._run_reader(self._select_many, keys, "1")
+        return [k in found for k in keys]
+
+    async def delete_many(self, keys: Iterable[str], *, missing_ok: bool = True) -> None:
+        # писатель и так сложит их в одну транзакцию
+        await asyncio.gather(*(self._write(("delete", _norm_key(k), missing_ok)) for k in keys))
+
+    async def create_many(self, items: Iterable[Tuple[str, Json]], *, overwrite: bool = False) -> None:
+        await asyncio.gather(*(self._write(("create", _norm_key(k), v, overwrite)) for k, v in items))
+
+    async def close(self) -> None:
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        self._readers.shutdown(wait=False)
+        self._writer_pool.shutdown(wait=True)
+
+    # ---------- Чтение ----------
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.cfg.path, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout={int(self.cfg.busy_timeout_ms)}")
+            conn.execute(f"PRAGMA synchronous={self.cfg.synchronous}")
+            self._local.conn = conn
+        return conn
+
+    async def _run_reader(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, fn, *args)
+
+    async def _read_with_mtime(self, key: str) -> Tuple[Json, float]:
+        row = await self._run_reader(self._select_one, key)
+        if row is None:
+            raise FileNotFoundError(f"Key not found: {key}")
+        return json.loads(row[0]), row[1]
+
+    def _select_one(self, key: str):
+        return self._conn().execute("SELECT data, mtime FROM docs WHERE key = ?", (key,)).fetchone()
+
+    def _select_exists(self, key: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM docs WHERE key = ?", (key,)).fetchone() is not None
+
+    def _select_many(self, keys: List[str], column: str) -> Dict[str, Any]:
+        conn = self._conn()
+        found: Dict[str, Any] = {}
+        # лимит числа параметров SQLite — запрашиваем кусками
+        for i in range(0, len(keys), _IN_CHUNK):
+            chunk = keys[i:i + _IN_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for key, value in conn.execute(f"SELECT key, {column} FROM docs WHERE key IN ({marks})", chunk):
+                found[key] = value
+        return found
+
+    def _select_keys(self, lo: str, hi: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT key FROM docs WHERE key >= ? AND key < ? ORDER BY key", (lo, hi)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def _select_where(self, lo: str, hi: str, equals: Dict[str, Any]):
+        # имена колонок только из INDEXED_FIELDS — подстановка в SQL безопасна
+        where = "".join(f" AND {f} = ?" for f in equals)
+        return self._conn().execute(
+            f"SELECT data FROM docs WHERE key >= ? AND key < ?{where} ORDER BY key",
+            (lo, hi, *equals.values()),
+        ).fetchall()
+
+    # ---------- Запись ----------
+
+    async def _write(self, op: tuple):
+        loop = asyncio.get_running_loop()
+        if self._writer_task is None or self._writer_loop is not loop or self._writer_task.done():
+            self._write_queue = asyncio.Queue()
+            self._writer_loop = loop
+            self._writer_task = loop.create_task(self._writer())
+        fut = loop.create_future()
+        await self._write_queue.put((op, fut))
+        return await fut
+
+    async def _writer(self) -> None:
+        """Единственный писатель: всё, что накопилось в очереди, уходит одной транзакцией."""
+        queue = self._write_queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.cfg.max_write_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                results = await loop.run_in_executor(
+                    self._writer_pool, self._apply_batch, [op for op, _ in batch]
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, fut), res in zip(batch, results):
+                if fut.done():
+                    continue
+                if isinstance(res, BaseException):
+                    fut.set_exception(res)
+                else:
+                    fut.set_result(res)
+
+    def _apply_batch(self, ops: List[tuple]) -> List[Any]:
+        conn = self._conn()
+        results: List[Any] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op in ops:
+                try:
+                    results.append(self._apply(conn, op))
+                except Exception as e:
+                    # каждая операция — один оператор SQL: ошибка не оставляет частичных изменений
+                    results.append(e)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, op: tuple) -> Any:
+        kind, key = op[0], op[1]
+        if kind == "delete":
+            cur = conn.execute("DELETE FROM docs WHERE key = ?", (key,))
+            if cur.rowcount == 0 and not op[2]:
+                raise FileNotFoundError(f"Key not found: {key}")
+            return None
+
+        data = op[2]
+        text = json.dumps(data, ensure_ascii=False)
+        mtime = time.time()
+        cols = index_columns(data)
+        if kind == "create":
+            verb = "INSERT OR REPLACE" if op[3] else "INSERT"
+            try:
+                conn.execute(
+                    f"{verb} INTO docs (key, data, mtime, group_uuid, original_name, status) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, text, mtime, *cols),
+                )
+            except sqlite3.IntegrityError:
+                raise FileExistsError(f"Key already exists: {key}")
+            return None
+
+        # put: replace/update, при if_match — только если mtime не изменился
+        if_match = op[3]
+        if if_match is None:
+            conn.execute(
+                "INSERT OR REPLACE INTO docs (key, data, mtime, group_uuid, original_name, status) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, mtime, *cols),
+            )
+            return mtime
+        row = conn.execute("SELECT mtime FROM docs WHERE key = ?", (key,)).fetchone()
+        if row is None or abs(row[0] - if_match) > 1e-9:
+            raise _Conflict(key)
+        # mtime строго растёт, даже если часы не сдвинулись с прошлой записи
+        mtime = max(mtime, row[0] + 1e-6)
+        conn.execute(
+            "UPDATE docs SET data = ?, mtime = ?, group_uuid = ?, original_name = ?, status = ? WHERE key = ?",
+            (text, mtime, *cols, key),
+        )
+        return mtime
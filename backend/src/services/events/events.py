@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+# Шина изменений статусов файлов для SSE. События хранятся в памяти процесса:
+# по кольцевому буферу на группу для докачки по Last-Event-ID.
+# При uvicorn --workers N подписчик получает события только своего воркера.
+
+BUFFER_PER_GROUP = 2000
+SUBSCRIBER_QUEUE = 1000
+HEARTBEAT_SECONDS = 15.0
+
+
+@dataclass
+class StatusEvent:
+    id: int
+    group_uuid: str
+    type: str
+    data: Dict[str, Any]
+
+    def to_sse(self) -> str:
+        payload = json.dumps(self.data, ensure_ascii=False)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+@dataclass(eq=False)
+class _Subscriber:
+    queue: "asyncio.Queue[StatusEvent]" = field(default_factory=lambda: asyncio.Queue(SUBSCRIBER_QUEUE))
+    overflow: bool = False
+
+
+class StatusEventBus:
+    def __init__(self, buffer_size: int = BUFFER_PER_GROUP):
+        self.buffer_size = buffer_size
+        # id растут и между перезапусками: старт от текущего времени в мс
+        self._next_id = time.time_ns() // 1_000_000
+        self._start_id = self._next_id
+        self._buffers: Dict[str, Deque[StatusEvent]] = {}
+        self._evicted: Dict[str, int] = {}  # id последнего вытесненного из буфера события группы
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+
+    def publish(self, group_uuid: str, data: Dict[str, Any], *, type: str = "status") -> StatusEvent:
+        """Добавить событие группы и разослать подписчикам (без ожидания)."""
+        self._next_id += 1
+        event = StatusEvent(id=self._next_id, group_uuid=group_uuid, type=type, data=data)
+        buf = self._buffers.get(group_uuid)
+        if buf is None:
+            buf = self._buffers[group_uuid] = deque(maxlen=self.buffer_size)
+        if len(buf) == buf.maxlen:
+            self._evicted[group_uuid] = buf[0].id
+        buf.append(event)
+
+        for sub in self._subscribers.get(group_uuid, ()):
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # клиент не успевает — пусть перечитает список целиком
+                sub.overflow = True
+        return event
+
+    def forget(self, group_uuid: str) -> None:
+        """Группа удалена: буфер больше не нужен."""
+        self._buffers.pop(group_uuid, None)
+        self._evicted.pop(group_uuid, None)
+
+    def _replay(self, group_uuid: str, last_event_id: int) -> Optional[List[StatusEvent]]:
+        """События после last_event_id; None, если часть из них недоступна (вытеснены или был перезапуск)."""
+        if last_event_id < self._start_id or last_event_id > self._next_id:
+            return None
+        if last_event_id < self._evicted.get(group_uuid, 0):
+            return None
+        return [e for e in self._buffers.get(group_uuid, ()) if e.id > last_event_id]
+
+    async def stream(self, group_uuid: str, last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+        """SSE-поток группы: сначала пропущенные события, затем новые; периодический heartbeat."""
+        sub = _Subscriber()
+        self._subscribers.setdefault(group_uuid, set()).add(sub)
+        try:
+            # подписка до replay: ничего не теряем между ними
+            if last_event_id is not None:
+                missed = self._replay(group_uuid, last_event_id)
+                if missed is None:
+                    yield self._reset_event(group_uuid)
+                else:
+                    for event in missed:
+                        yield event.to_sse()
+                    last_event_id = missed[-1].id if missed else last_event_id
+            else:
+                yield "retry: 3000\n\n"
+
+            while True:
+                if sub.overflow:
+                    sub.overflow = False
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    yield self._reset_event(group_uuid)
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if last_event_id is not None and event.id <= last_event_id:
+                    continue  # уже отдали при replay
+                yield event.to_sse()
+        finally:
+            subs = self._subscribers.get(group_uuid)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    self._subscribers.pop(group_uuid, None)
+
+    def _reset_event(self, group_uuid: str) -> str:
+        # id текущий: после reset клиент продолжает с этой точки
+        return StatusEvent(id=self._next_id, group_uuid=group_uuid, type="reset",
+                           data={"group_uuid": group_uuid}).to_sse()
+
+
+status_events = StatusEventBus()
+
+
+def publish_file_status(meta: Dict[str, Any]) -> StatusEvent:
+    """Событие об изменении статуса файла (meta — документ files/{fid})."""
+    return status_events.publish(meta["group_uuid"], {
+        "file_uuid": meta.get("file_uuid"),
+        "group_uuid": meta["group_uuid"],
+        "filename": meta.get("original_name") or meta.get("filename", ""),
+        "status": meta.get("status"),
+        "stages": meta.get("stages", {}),
+    })
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # не POSIX: журнал группы пишет один процесс
+    fcntl = None
+
+from loguru import logger
+
+from src.core.configs import configs
+from src.utils.common import group_dir_status, now_iso, _group_file_metas
+
+# Журнал статусов группы: groups/{gid}/statuses/journal.ndjson — строка на событие, только дозапись.
+# Это источник истины для статусов в разрезе группы: список файлов строится из материализованного
+# в памяти состояния, а не чтением files/{fid} по одному.
+# - Дозаписи, пришедшие в пределах окна group commit, уходят одним write + fsync на группу.
+# - Каждые compact_every строк состояние сворачивается в snapshot.json, а сегмент журнала
+#   переезжает в history/ — история переходов для аудита остаётся. Проверку запускает дозапись
+#   (фоновой задачей), так что журнал не растёт и у групп, список которых никто не читает.
+# - uvicorn --workers N: дозапись под flock(LOCK_SH) (O_APPEND не перемешивает строки),
+#   компакция — под LOCK_EX; чужие дозаписи каждый процесс дочитывает со своего смещения.
+# - Порядок событий одного файла — по ts (meta["updated_at"]): запоздавшая строка
+#   с более старым ts состояние не откатывает, поэтому повторное применение безопасно.
+# - Группа, созданная до журнала, при первой дозаписи сначала получает события по всем своим
+#   метам из store — иначе журнал знал бы только файлы, у которых статус менялся после этого.
+#   Новые группы заводят пустой журнал сразу (create), им засев не нужен.
+# - Состояние в памяти держится для max_groups последних групп (LRU), остальное дочитывается с диска.
+# Границы: журнал — источник истины для статусов в разрезе группы (списки, фильтр по статусу),
+# но не для меты файла. files/{fid} (results, stages, updated_at) и агрегат group_progress/{gid}
+# по-прежнему переписываются на каждое событие, так что событие — это update меты, дозапись
+# и update агрегата, а не одна дозапись. Перенос статуса из files/{fid} в журнал потребовал бы
+# перевести на журнал всех читателей меты (GET /files, status:batch, отчёты, query по статусу в SQLite).
+
+JOURNAL = "journal.ndjson"
+SNAPSHOT = "snapshot.json"
+HISTORY = "history"
+LOCK = "journal.lock"
+
+
+@dataclass(eq=False)
+class _GroupState:
+    files: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    inode: Optional[int] = None  # сегмент журнала, который дочитываем
+    offset: int = 0
+    lines: int = 0               # строк в текущем сегменте
+    segments: int = 0            # сколько сегментов уже ушло в history/
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+def status_entry(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Событие журнала по meta файла (files/{fid})."""
+    return {
+        "ts": meta.get("updated_at") or meta.get("created_at") or now_iso(),
+        "file_uuid": meta["file_uuid"],
+        "status": meta.get("status", "progress"),
+        "filename": meta.get("original_name") or meta.get("filename", ""),
+    }
+
+
+def _apply(files: Dict[str, Dict[str, Any]], entry: Dict[str, Any]) -> None:
+    cur = files.get(entry["file_uuid"])
+    if cur is not None and entry["ts"] < cur["ts"]:
+        return
+    # номер файла в порядке появления — ключ курсора постраничной выдачи
+    entry["seq"] = cur["seq"] if cur is not None else len(files)
+    files[entry["file_uuid"]] = entry
+
+
+class StatusJournal:
+    def __init__(self, *, window: float = 0.0, fsync: bool = True, compact_every: int = 5000,
+                 max_groups: int = 1024):
+        self.window = window
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self.max_groups = max_groups
+        self._groups: "OrderedDict[str, _GroupState]" = OrderedDict()
+        self._pending: Dict[str, List[Tuple[bytes, asyncio.Future]]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        # строк, дописанных в группу с последней проверки компакции (оценка снизу: другие процессы тоже пишут)
+        self._unchecked: "OrderedDict[str, int]" = OrderedDict()
+        self._compactions: Dict[str, asyncio.Task] = {}
+        # группы, у которых журнал точно есть (засевать не нужно)
+        self._seeded: "OrderedDict[str, None]" = OrderedDict()
+
+    async def create(self, group_uuid: str) -> None:
+        """Завести пустой журнал новой группе (каталог statuses/ уже создан)."""
+        await asyncio.to_thread(self._touch_journal, group_uuid)
+        self._remember(self._seeded, group_uuid, None)
+
+    async def seed(self, group_uuid: str) -> None:
+        """Завести журнал группе, созданной до его появления, из мет store (если журнала нет)."""
+        await self.append(group_uuid, [])
+
+    async def append(self, group_uuid: str, metas: Iterable[Dict[str, Any]]) -> None:
+        """Дописать по событию на meta и дождаться, пока пачка с ними ляжет на диск."""
+        entries = await self._seed_entries(group_uuid) + [status_entry(m) for m in metas]
+        data = b"".join(json.dumps(e, ensure_ascii=False).encode("utf-8") + b"\n" for e in entries)
+        if not data:
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(group_uuid, []).append((data, fut))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        await fut
+
+    async def files(self, group_uuid: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Состояние файлов группы на конец журнала: {fid: {file_uuid, filename, status, ts, seq}}
+        в порядке появления файлов (seq — номер в этом порядке). None — у группы нет журнала. Записи не менять.
+        """
+        st = self._state(group_uuid)
+        async with st.lock:
+            if not await asyncio.to_thread(self._refresh, group_uuid, st):
+                self._groups.pop(group_uuid, None)
+                return None
+            await self._maybe_compact(group_uuid, st)
+            return dict(st.files)
+
+    def forget(self, group_uuid: str) -> None:
+        self._groups.pop(group_uuid, None)
+        self._unchecked.pop(group_uuid, None)
+        self._seeded.pop(group_uuid, None)
+
+    def _state(self, group_uuid: str) -> _GroupState:
+        st = self._groups.get(group_uuid)
+        if st is None:
+            st = _GroupState()
+        # вытесненное состояние у того, кто его сейчас держит, остаётся рабочим: это лишь кэш файла
+        self._remember(self._groups, group_uuid, st)
+        return st
+
+    def _remember(self, lru: OrderedDict, key: str, value: Any) -> None:
+        lru[key] = value
+        lru.move_to_end(key)
+        while len(lru) > self.max_groups:
+            lru.popitem(last=False)
+
+    async def _seed_entries(self, group_uuid: str) -> List[Dict[str, Any]]:
+        if group_uuid in self._seeded:
+            self._seeded.move_to_end(group_uuid)
+            return []
+        entries: List[Dict[str, Any]] = []
+        if not await asyncio.to_thread(self._has_journal, group_uuid):
+            # засев может случиться и в двух процессах сразу — повтор строк с тем же ts безвреден
+            entries = [status_entry(m) for m in await _group_file_metas(group_uuid)]
+            logger.info(f"status journal {group_uuid}: seeded {len(entries)} files from metas")
+        self._remember(self._seeded, group_uuid, None)
+        return entries
+
+    async def _maybe_compact(self, group_uuid: str, st: _GroupState) -> None:
+        """Свернуть сегмент, если он дорос до compact_every (вызывать под st.lock после _refresh)."""
+        self._remember(self._unchecked, group_uuid, st.lines)
+        if st.lines < self.compact_every:
+            return
+        try:
+            await asyncio.to_thread(self._compact, group_uuid, st)
+        except OSError as e:
+            logger.warning(f"status journal {group_uuid}: compaction failed: {e}")
+            return
+        self._remember(self._unchecked, group_uuid, st.lines)
+
+    def _note_appended(self, group_uuid: str, lines: int) -> None:
+        n = self._unchecked.get(group_uuid, 0) + lines
+        self._remember(self._unchecked, group_uuid, n)
+        task = self._compactions.get(group_uuid)
+        if n >= self.compact_every and (task is None or task.done()):
+            self._compactions[group_uuid] = asyncio.create_task(self._compact_in_background(group_uuid))
+
+    async def _compact_in_background(self, group_uuid: str) -> None:
+        st = self._state(group_uuid)
+        try:
+            async with st.lock:
+                if not await asyncio.to_thread(self._refresh, group_uuid, st):
+                    self._groups.pop(group_uuid, None)
+                    self._unchecked.pop(group_uuid, None)
+                    return
+                await self._maybe_compact(group_uuid, st)
+        except Exception as e:
+            logger.warning(f"status journal {group_uuid}: background compaction failed: {e}")
+        finally:
+            self._compactions.pop(group_uuid, None)
+
+    # ---------- дозапись ----------
+
+    async def _flush(self) -> None:
+        # пока ждём окно или пишем пачку, приходят новые события — они уйдут следующим кругом
+        while self._pending:
+            await asyncio.sleep(self.window)
+            batch, self._pending = self._pending, {}
+            errors = await asyncio.to_thread(self._write_batch, batch)
+            for gid, items in batch.items():
+                if gid not in errors:
+                    self._note_appended(gid, sum(data.count(b"\n") for data, _ in items))
+                for _, fut in items:
+                    if fut.done():
+                        continue
+                    if gid in errors:
+                        fut.set_exception(errors[gid])
+                    else:
+                        fut.set_result(None)
+
+    def _write_batch(self, batch: Dict[str, List[Tuple[bytes, asyncio.Future]]]) -> Dict[str, OSError]:
+        errors: Dict[str, OSError] = {}
+        for gid, items in batch.items():
+            try:
+                self._append_file(gid, b"".join(data for data, _ in items))
+            except OSError as e:
+                errors[gid] = e
+        return errors
+
+    def _append_file(self, group_uuid: str, data: bytes) -> None:
+        d = group_dir_status(group_uuid)
+        if not d.is_dir():
+            # группу удалили, пока события ждали в очереди, — не воскрешаем её каталог
+            return
+        with self._flock(d, fcntl.LOCK_SH if fcntl else 0):
+            fd = os.open(d / JOURNAL, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # одна запись на пачку: с O_APPEND строки разных процессов не перемешиваются
+                if os.write(fd, data) != len(data):
+                    raise OSError(f"short write to {d / JOURNAL}")
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _has_journal(group_uuid: str) -> bool:
+        d = group_dir_status(group_uuid)
+        # каталога нет — группу удалили, засевать нечего
+        return not d.is_dir() or (d / JOURNAL).exists() or (d / SNAPSHOT).exists()
+
+    @staticmethod
+    def _touch_journal(group_uuid: str) -> None:
+        d = group_dir_status(group_uuid)
+        if d.is_dir():
+            os.close(os.open(d / JOURNAL, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644))
+
+    # ---------- чтение и компакция (в потоке) ----------
+
+    def _refresh(self, group_uuid: str, st: _GroupState) -> bool:
+        d = group_dir_status(group_uuid)
+        try:
+            f = open(d / JOURNAL, "rb")
+        except FileNotFoundError:
+            f = None
+        if f is None or os.fstat(f.fileno()).st_ino != st.inode:
+            # первое чтение или сегмент сменила компакция (в том числе в другом процессе)
+            if f is not None:
+                f.close()
+            if not d.is_dir():
+                return False
+            with self._flock(d, fcntl.LOCK_SH if fcntl else 0):
+                return self._load(group_uuid, st)
+        with f:
+            self._tail(f, st)
+        return True
+
+    def _load(self, group_uuid: str, st: _GroupState) -> bool:
+        """Снапшот + текущий сегмент целиком (вызывать под flock)."""
+        d = group_dir_status(group_uuid)
+        try:
+            snap = json.loads((d / SNAPSHOT).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            snap = None
+        try:
+            f = open(d / JOURNAL, "rb")
+        except FileNotFoundError:
+            f = None
+        if snap is None and f is None:
+            return False
+        st.files = dict(snap["files"]) if snap else {}
+        for seq, entry in enumerate(st.files.values()):
+            entry.setdefault("seq", seq)  # снапшот, записанный до появления seq
+        st.segments = snap.get("segments", 0) if snap else 0
+        st.inode, st.offset, st.lines = None, 0, 0
+        if f is not None:
+            with f:
+                st.inode = os.fstat(f.fileno()).st_ino
+                self._tail(f, st)
+        return True
+
+    @staticmethod
+    def _tail(f, st: _GroupState) -> None:
+        f.seek(st.offset)
+        chunk = f.read()
+        # недописанную строку (дозапись идёт прямо сейчас) оставляем до следующего раза
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            st.lines += 1
+            try:
+                _apply(st.files, json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"status journal: skip broken line: {e}")
+        st.offset += end
+
+    def _compact(self, group_uuid: str, st: _GroupState) -> None:
+        d = group_dir_status(group_uuid)
+        with self._flock(d, fcntl.LOCK_EX if fcntl else 0):
+            # под LOCK_EX никто не дописывает: перечитываем всё и сворачиваем
+            if not self._load(group_uuid, st) or st.lines < self.compact_every:
+                return  # другой процесс уже свернул сегмент
+            snapshot = {"files": st.files, "segments": st.segments + 1, "compacted_at": now_iso()}
+            tmp = d / f".{SNAPSHOT}.tmp"
+            with open(tmp, "w", encoding="utf-8") as out:
+                json.dump(snapshot, out, ensure_ascii=False)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, d / SNAPSHOT)
+            # сбой до этой строки безопасен: журнал поверх снапшота применяется повторно без изменений
+            history = d / HISTORY
+            history.mkdir(exist_ok=True)
+            os.replace(d / JOURNAL, history / f"{st.segments:06d}.ndjson")
+            fd = os.open(d / JOURNAL, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                st.inode = os.fstat(fd).st_ino
+            finally:
+                os.close(fd)
+            st.segments += 1
+            st.offset, st.lines = 0, 0
+        logger.info(f"status journal {group_uuid}: compacted {len(st.files)} files into snapshot")
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _flock(d, op: int):
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(d / LOCK, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, op)
+            yield
+        finally:
+            os.close(fd)  # закрытие снимает flock
+
+
+status_journal = StatusJournal(
+    # strict — без окна, но конкурентные события всё равно делят один fsync
+    window=configs.store.group_commit_ms / 1000 if configs.store.durability == "group_commit" else 0.0,
+    fsync=configs.store.durability != "relaxed",
+    compact_every=configs.store.journal_compact_every,
+    max_groups=configs.store.journal_max_groups,
+)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from src.api.v1.schemas.file_schemas import FileStatus
+from src.infra.storage.factory import get_store
+from src.infra.storage.interface import AsyncFileStorageI
+from src.utils.common import now_iso
+
+# Прогресс группы: агрегат в store/group_progress/{gid}, обновляется за O(1) на каждый переход статуса.
+# У файла в meta["stages"] лежит время входа в каждую стадию (progress → upgrading → done).
+
+STAGES = [s.value for s in FileStatus]
+
+store = get_store()
+
+
+def _key(group_uuid: str) -> str:
+    return f"group_progress/{group_uuid}"
+
+
+def _empty(group_uuid: str) -> Dict[str, Any]:
+    now = now_iso()
+    return {
+        "group_uuid": group_uuid,
+        "total": 0,
+        "counts": {s: 0 for s in STAGES},     # файлов сейчас в стадии
+        "reached": {s: 0 for s in STAGES},    # файлов, хоть раз дошедших до стадии
+        "first_at": {},                       # первый/последний вход файла в стадию
+        "last_at": {},
+        "started_at": now,
+        "updated_at": now,
+    }
+
+
+def _parse(ts: Optional[str]) -> Optional[datetime]:
+    if not ts:
+        return None
+    try:
+        return datetime.fromisoformat(ts)
+    except ValueError:
+        return None
+
+
+def stamp_stage(meta: Dict[str, Any], status: str) -> bool:
+    """Отметить в meta время входа в стадию; True, если файл попал в неё впервые."""
+    stages = meta.setdefault("stages", {})
+    first_time = status not in stages
+    if first_time:
+        stages[status] = now_iso()
+    return first_time
+
+
+class GroupProgressTracker:
+    """Агрегированный прогресс групп (единственный писатель group_progress/*)."""
+
+    def __init__(self, store: AsyncFileStorageI):
+        self.store = store
+
+    async def create(self, group_uuid: str) -> None:
+        """Пустой агрегат новой группы: без него первое обновление пересчитало бы его по метам."""
+        try:
+            await self.store.create(_key(group_uuid), _empty(group_uuid))
+        except FileExistsError:
+            pass
+
+    async def add_files(self, group_uuid: str, count: int) -> None:
+        """Новые файлы группы (в стадии progress)."""
+        if count <= 0:
+            return
+        now = now_iso()
+
+        def _patch(doc):
+            doc["total"] += count
+            doc["counts"]["progress"] = doc["counts"].get("progress", 0) + count
+            doc["reached"]["progress"] = doc["reached"].get("progress", 0) + count
+            doc["first_at"].setdefault("progress", now)
+            doc["last_at"]["progress"] = now
+            doc["updated_at"] = now
+            return doc
+
+        await self._update(group_uuid, _patch)
+
+    async def record_transition(self, group_uuid: str, old_status: Optional[str], new_status: str,
+                                first_time: bool) -> None:
+        """Файл перешёл из old_status в new_status (first_time — впервые дошёл до new_status)."""
+        if old_status == new_status and not first_time:
+            return
+        now = now_iso()
+
+        def _patch(doc):
+            counts = doc["counts"]
+            if old_status != new_status:
+                if old_status in counts and counts[old_status] > 0:
+                    counts[old_status] -= 1
+                counts[new_status] = counts.get(new_status, 0) + 1
+            if first_time:
+                doc["reached"][new_status] = doc["reached"].get(new_status, 0) + 1
+                doc["first_at"].setdefault(new_status, now)
+                doc["last_at"][new_status] = now
+            doc["updated_at"] = now
+            return doc
+
+        await self._update(group_uuid, _patch)
+
+    async def delete(self, group_uuid: str) -> None:
+        await self.store.delete(_key(group_uuid), missing_ok=True)
+
+    async def get(self, group_uuid: str) -> Optional[Dict[str, Any]]:
+        """Прогресс группы с пропускной способностью и ETA; None, если группы нет."""
+        doc = await self.store.read_or_none(_key(group_uuid))
+        if doc is None:
+            doc = await self.rebuild(group_uuid)
+            if doc is None:
+                return None
+        return self._summary(doc)
+
+    async def rebuild(self, group_uuid: str) -> Optional[Dict[str, Any]]:
+        """Пересчитать агрегат по файлам группы (для групп, созданных до появления агрегата)."""
+        doc, _ = await self._rebuild(group_uuid)
+        return doc
+
+    async def _rebuild(self, group_uuid: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Агрегат по метам группы и признак, что записал его этот вызов."""
+        idx_key = f"group_index/{group_uuid}"
+        idx = await self.store.read_or_none(idx_key)
+        if idx is None:
+            return None, False
+        doc = _empty(group_uuid)
+        for fid in idx.get("files", []):
+            meta = await self.store.read_or_none(f"files/{fid}")
+            if meta is None:
+                continue
+            status = meta.get("status", "progress")
+            doc["total"] += 1
+            doc["counts"][status] = doc["counts"].get(status, 0) + 1
+            # без истории считаем, что файл прошёл все стадии до текущей
+            stages = meta.get("stages")
+            if not stages:
+                passed = STAGES[:STAGES.index(status) + 1] if status in STAGES else [status]
+                stages = {s: meta.get("created_at") for s in passed}
+            for stage, ts in stages.items():
+                doc["reached"][stage] = doc["reached"].get(stage, 0) + 1
+                if ts:
+                    if stage not in doc["first_at"] or ts < doc["first_at"][stage]:
+                        doc["first_at"][stage] = ts
+                    if ts > doc["last_at"].get(stage, ""):
+                        doc["last_at"][stage] = ts
+        if doc["first_at"].get("progress"):
+            doc["started_at"] = doc["first_at"]["progress"]
+        try:
+            await self.store.create(_key(group_uuid), doc)
+        except FileExistsError:
+            # агрегат уже создал другой запрос или воркер — он и актуальнее
+            return await self.store.read(_key(group_uuid)), False
+        return doc, True
+
+    async def _update(self, group_uuid: str, patch) -> None:
+        key = _key(group_uuid)
+        if not await self.store.exists(key):
+            # агрегата нет — группа старше него: считаем по метам, а не с нуля (иначе в нём
+            # окажутся только файлы, сменившие статус после этого). Меты и индекс к этому моменту
+            # уже записаны вместе с переходом, поэтому свежепересчитанный агрегат patch не применяет.
+            _, created = await self._rebuild(group_uuid)
+            if created:
+                return
+            # create без overwrite атомарен и между воркерами: проигравший просто получит FileExistsError
+            try:
+                await self.store.create(key, _empty(group_uuid))
+            except FileExistsError:
+                pass
+        await self.store.update(key, patch)
+
+    @staticmethod
+    def _summary(doc: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        started = _parse(doc.get("started_at")) or now
+        total = doc.get("total", 0)
+
+        stages: Dict[str, Any] = {}
+        for stage in STAGES:
+            reached = doc["reached"].get(stage, 0)
+            last = _parse(doc["last_at"].get(stage))
+            elapsed = (last - started).total_seconds() if last else 0
+            stages[stage] = {
+                "reached": reached,
+                "first_at": doc["first_at"].get(stage),
+                "last_at": doc["last_at"].get(stage),
+                # файлов в минуту с начала обработки группы
+                "throughput_per_min": round(reached / elapsed * 60, 3) if elapsed > 0 and reached else None,
+            }
+
+        done = doc["reached"].get("done", 0)
+        remaining = max(total - done, 0)
+        eta_seconds = None
+        rate = stages["done"]["throughput_per_min"] or stages["upgrading"]["throughput_per_min"]
+        if remaining == 0:
+            eta_seconds = 0
+        elif rate:
+            eta_seconds = round(remaining / rate * 60, 1)
+
+        return {
+            "group_uuid": doc["group_uuid"],
+            "total": total,
+            "counts": doc["counts"],
+            "percent_done": round(done / total * 100, 1) if total else 0.0,
+            "stages": stages,
+            "started_at": doc.get("started_at"),
+            "updated_at": doc.get("updated_at"),
+            "elapsed_seconds": round((now - started).total_seconds(), 1),
+            "eta_seconds": eta_seconds,
+        }
+
+
+progress_tracker = GroupProgressTracker(store)
@@ -8,13 +8,12 @@ from typing import Iterable, Dict, Any, List, Optional
 
 from openpyxl import Workbook  
 
-from src.utils.common import group_dir_process, group_dir_final
-from src.core.configs import configs
-from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
+from src.utils.common import group_dir_process, group_dir_final, _group_file_metas
+from src.infra.storage.factory import get_store
 
 from collections import OrderedDict
 
-store = AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(base_dir=configs.dirs.store))
+store = get_store()
 
 _norm_result_suffix = re.compile(r"(?:_result)?$", re.IGNORECASE)
 _norm_idx_suffix    = re.compile(r"_(\d{3,})$")
@@ -157,30 +156,15 @@ class ReportBuilder:
     ):
         # 1) метаданные группы
         gkey = f"groups/{group_uuid}"
-        if not await store.exists(gkey):
+        grp = await store.read_or_none(gkey)
+        if grp is None:
             raise HTTPException(http.HTTP_404_NOT_FOUND, "group not found")
-        grp = await store.read(gkey)
         fond = grp.get("fond") or ""
         opis = grp.get("opis") or ""
         delo = grp.get("delo") or ""
 
         # 2) список файлов группы (для номеров сканов и имён)
-        file_ids: List[str] = []
-        idx_key = f"group_index/{group_uuid}"
-        if await store.exists(idx_key):
-            idx = await store.read(idx_key)
-            file_ids = list(idx.get("files", []))
-        else:
-            for key in await store.list("files"):
-                rec = await store.read(key)
-                if rec.get("group_uuid") == group_uuid:
-                    file_ids.append(rec["file_uuid"])
-
-        metas: List[Dict[str, Any]] = []
-        for fid in file_ids:
-            m = await store.read(f"files/{fid}")
-            m.setdefault("file_uuid", fid)
-            metas.append(m)
+        metas: List[Dict[str, Any]] = await _group_file_metas(group_uuid)
         metas.sort(key=lambda m: (m.get("filename") or m.get("original_name") or "").lower())
 
         # 3) stage-директория
@@ -297,9 +281,9 @@ class FileReportBuilder:
     ):
         # 1) мета файла
         fkey = f"files/{file_uuid}"
-        if not await store.exists(fkey):
+        fmeta = await store.read_or_none(fkey)
+        if fmeta is None:
             raise HTTPException(http.HTTP_404_NOT_FOUND, "file not found")
-        fmeta = await store.read(fkey)
 
         group_uuid = fmeta.get("group_uuid")
         if not group_uuid:
@@ -308,29 +292,14 @@ class FileReportBuilder:
         # 2) метаданные группы (fond/opis/delo)
         gkey = f"groups/{group_uuid}"
         fond = opis = delo = ""
-        if await store.exists(gkey):
-            grp = await store.read(gkey)
+        grp = await store.read_or_none(gkey)
+        if grp is not None:
             fond = grp.get("fond") or ""
             opis = grp.get("opis") or ""
             delo = grp.get("delo") or ""
 
         # 3) вычислим scan_no так же, как в групповом отчёте
-        file_ids: List[str] = []
-        idx_key = f"group_index/{group_uuid}"
-        if await store.exists(idx_key):
-            idx = await store.read(idx_key)
-            file_ids = list(idx.get("files", []))
-        else:
-            for key in await store.list("files"):
-                rec = await store.read(key)
-                if rec.get("group_uuid") == group_uuid:
-                    file_ids.append(rec["file_uuid"])
-
-        metas: List[Dict[str, Any]] = []
-        for fid in file_ids:
-            m = await store.read(f"files/{fid}")
-            m.setdefault("file_uuid", fid)
-            metas.append(m)
+        metas: List[Dict[str, Any]] = await _group_file_metas(group_uuid)
         metas.sort(key=lambda m: (m.get("filename") or m.get("original_name") or "").lower())
 
         # позиция текущего файла в отсортированном списке (как в групповом отчёте)
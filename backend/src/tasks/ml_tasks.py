@@ -49,3 +49,48 @@ def start_ml_pipeline(group_uuid: str):
                 raise
             time.sleep(backoff)
             backoff = min(backoff * 2, 8)
+
+
+@dramatiq.actor(max_retries=5, min_backoff=1000, max_backoff=8000, time_limit=60_000)
+def cancel_group_processing(group_uuid: str):
+    """Остановить обработку удалённой группы в ml-pipeline и postprocessing."""
+    targets = [
+        configs.ml_pipeline.url.rstrip("/") + "/cancel",
+        configs.postprocessing_url.rstrip("/") + "/cancel",
+    ]
+    failed = []
+    with httpx.Client(timeout=10) as client:
+        for url in targets:
+            try:
+                r = client.post(url, params={"group_uuid": group_uuid})
+                r.raise_for_status()
+            except Exception:
+                failed.append(url)
+    if failed:
+        # повтор dramatiq'ом; отмена идемпотентна
+        raise RuntimeError(f"cancel failed for {failed}")
+
+
+def enqueue_ml_scan(group_uuid: str, raw_relpath: str, index: int = 0) -> None:
+    """
+    Поставить один скан в очередь ml-pipeline (режим queue).
+    Актор объявлен только в ml-pipeline, поэтому сообщение собираем вручную:
+    воркер backend эту очередь не слушает. index — номер файла в группе,
+    из него ml-pipeline строит scan_id и имя результата.
+    """
+    callback = f"{configs.backend_base_url.rstrip('/')}{configs.ml_pipeline.callback_path_ocr}"
+    message = dramatiq.Message(
+        queue_name=configs.ml_pipeline.scan_queue,
+        actor_name="process_scan",
+        args=(),
+        kwargs={
+            "group_uuid": group_uuid,
+            "source":  f"/out/var/data/groups/{group_uuid}/raw_data/{raw_relpath}",
+            "dst":     f"/out/var/data/groups/{group_uuid}/process/",
+            "callback": callback,
+            "index": index,
+        },
+        options={},
+    )
+    broker.declare_queue(message.queue_name)
+    broker.enqueue(message)
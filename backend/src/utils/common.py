@@ -15,11 +15,11 @@ from fastapi import UploadFile
 
 from src.core.configs import configs
 
-from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
+from src.infra.storage.factory import get_store
 from src.core.configs import configs
 
 
-store = AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(base_dir=configs.dirs.store))
+store = get_store()
 
 # --------- ID/время ---------
 
@@ -61,6 +61,10 @@ def ensure_group_dirs(group_uuid: str) -> None:
 def stage_dir(group_uuid: str, stage: str) -> Path:
     return group_dir_final(group_uuid) if stage == "done" else group_dir_process(group_uuid)
 
+def stage_key(stage: str) -> str:
+    """Каталог стадии (process|final): ключ в meta["results"] с именем JSON-результата."""
+    return "final" if stage == "done" else "process"
+
 # --------- macOS-мусор и фильтры ---------
 
 def _is_trash_member(name: str) -> bool:
@@ -157,24 +161,98 @@ def _normalize_to_stem(name: str) -> str:
     return stem.casefold()
 
 
+async def _group_file_metas(group_uuid: str, file_ids: Optional[List[str]] = None) -> List[dict]:
+    """
+    Меты файлов группы в порядке group_index (удалённые пропускаются).
+    Хранилище с индексом по group_uuid отдаёт их одним запросом, иначе читаем по одной.
+    """
+    if file_ids is None:
+        idx = await store.read_or_none(f"group_index/{group_uuid}")
+        if idx is None:
+            # группа без индекса (старые данные) — перебор всех мет
+            return await store.query("files", group_uuid=group_uuid)
+        file_ids = idx.get("files", [])
+
+    if "group_uuid" in store.indexed_fields:
+        by_id = {m.get("file_uuid"): m for m in await store.query("files", group_uuid=group_uuid)}
+        return [by_id[fid] for fid in file_ids if fid in by_id]
+
+    metas = []
+    for fid, meta in zip(file_ids, await store.read_many([f"files/{fid}" for fid in file_ids])):
+        if meta is not None:
+            meta.setdefault("file_uuid", fid)
+            metas.append(meta)
+    return metas
+
+
+# --- Индекс стем → file_uuid для callback'ов ---
+# store/group_stems/{gid} = {"stems": {stem: fid}}; пополняется при загрузке,
+# поэтому callback находит файл одним чтением, а не перебором всех мет группы.
+
+def _stem_map_key(group_uuid: str) -> str:
+    return f"group_stems/{group_uuid}"
+
+
+def _stems_of(metas: List[dict]) -> dict:
+    stems: dict = {}
+    for meta in metas:
+        name = (meta.get("filename") or meta.get("original_name") or "").strip()
+        stem = _normalize_to_stem(name) if name else ""
+        if stem and meta.get("file_uuid"):
+            # при совпадении стемов побеждает первый файл — как при прежнем переборе
+            stems.setdefault(stem, meta["file_uuid"])
+    return stems
+
+
+async def _add_to_stem_map(group_uuid: str, metas: List[dict]) -> None:
+    new = _stems_of(metas)
+    if not new:
+        return
+
+    def _patch(doc):
+        stems = doc.setdefault("stems", {})
+        for stem, fid in new.items():
+            stems.setdefault(stem, fid)
+        return doc
+
+    key = _stem_map_key(group_uuid)
+    try:
+        await store.create(key, {"stems": new})
+    except FileExistsError:
+        await store.update(key, _patch)
+
+
+async def _rebuild_stem_map(group_uuid: str) -> dict:
+    """Пересобрать индекс по метам группы (старые группы или потерянная запись)."""
+    idx = await store.read_or_none(f"group_index/{group_uuid}")
+    if idx is None:
+        # группы нет (удалена) — нечего индексировать
+        return {}
+    stems = _stems_of(await _group_file_metas(group_uuid, idx.get("files", [])))
+    await store.create(_stem_map_key(group_uuid), {"stems": stems}, overwrite=True)
+    return stems
+
+
+def _match_stem(stems: dict, target_stem: str) -> Optional[str]:
+    fid = stems.get(target_stem)
+    if fid:
+        return fid
+    # "результат" начинается со стема исходника или наоборот
+    for stem, fid in stems.items():
+        if target_stem.startswith(stem) or stem.startswith(target_stem):
+            return fid
+    return None
+
+
 async def _resolve_fid_by_filename(group_uuid: str, filename: str) -> Optional[str]:
-    idx_key = f"group_index/{group_uuid}"
     target_stem = _normalize_to_stem(filename)
+    if not target_stem:
+        return None
 
-    if await store.exists(idx_key):
-        idx = await store.read(idx_key)
-        candidates = idx.get("files", [])
-    else:
-        candidates = []
-
-    # Обходим все файл-меты группы
-    for fid in candidates:
-        meta = await store.read(f"files/{fid}")
-        src_name = (meta.get("filename") or meta.get("original_name") or "").strip()
-        if not src_name:
-            continue
-        meta_stem = _normalize_to_stem(src_name)
-        # точное совпадение стемов или "результат" начинается со стема исходника
-        if target_stem == meta_stem or target_stem.startswith(meta_stem) or meta_stem.startswith(target_stem):
+    doc = await store.read_or_none(_stem_map_key(group_uuid))
+    if doc is not None:
+        fid = _match_stem(doc.get("stems", {}), target_stem)
+        if fid:
             return fid
-    return None
+    # индекса нет или в нём нет файла — один раз пересобираем по метам
+    return _match_stem(await _rebuild_stem_map(group_uuid), target_stem)
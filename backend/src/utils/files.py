@@ -77,3 +77,85 @@ async def _find_source_image(meta: dict, base_stem: str, group_uuid: str | None)
 
     return None
 
+
+
+# --------- формат результата ml-pipeline ---------
+# v2 (ML_RESULT_FORMAT=v2) — компактная запись: кроп строки [min_x, min_y, max_x, max_y, padding],
+# полигон строки плоским массивом, без cropped_images и производных полей.
+# Фронт работает с v1, поэтому при отдаче разворачиваем обратно.
+
+_REGION_PADDING_KEYS = ("min_x", "min_y", "max_x", "max_y", "padding")
+
+
+def _result_version(data) -> int:
+    return int(data.get("format_version", 1)) if isinstance(data, dict) else 1
+
+
+def _box_to_dict(box) -> dict:
+    if not box:
+        return {}
+    d = dict(zip(_REGION_PADDING_KEYS, box))
+    d.setdefault("padding", 0)
+    d["width"] = d["max_x"] - d["min_x"]
+    d["height"] = d["max_y"] - d["min_y"]
+    return d
+
+
+def _polygon_to_str(polygon) -> str:
+    if isinstance(polygon, str):
+        return polygon
+    return " ".join(f"{polygon[i]},{polygon[i + 1]}" for i in range(0, len(polygon or []) - 1, 2))
+
+
+def _expand_result_v2(data: dict) -> dict:
+    """Развернуть результат v2 в структуру v1; v1 возвращается как есть."""
+    if _result_version(data) != 2:
+        return data
+
+    out = {k: v for k, v in data.items() if k not in ("format_version", "regions")}
+    out["regions"] = []
+    out["cropped_images"] = []
+
+    for r_idx, region in enumerate(data.get("regions", [])):
+        lines_v2 = region.get("lines", [])
+        region_v1 = {k: v for k, v in region.items() if k not in ("bbox", "statistics", "lines")}
+        region_v1["index"] = r_idx
+
+        coords = _box_to_dict(region.get("bbox"))
+        if coords:
+            coords["total_lines"] = sum(1 for line in lines_v2 if line.get("crop"))
+            coords["bounding_box"] = {
+                "top_left": {"x": coords["min_x"], "y": coords["min_y"]},
+                "top_right": {"x": coords["max_x"], "y": coords["min_y"]},
+                "bottom_left": {"x": coords["min_x"], "y": coords["max_y"]},
+                "bottom_right": {"x": coords["max_x"], "y": coords["max_y"]},
+            }
+        region_v1["coordinates"] = coords
+        region_v1["statistics"] = {**region.get("statistics", {}), "total_lines": len(lines_v2)}
+        region_v1["lines"] = []
+
+        for l_idx, line in enumerate(lines_v2):
+            crop = _box_to_dict(line.get("crop"))
+            filename = f"region_{r_idx:03d}_{l_idx:03d}.jpg"
+            line_v1 = {k: v for k, v in line.items() if k not in ("polygon", "crop", "image")}
+            line_v1.update({
+                "index": l_idx,
+                "coordinates": {
+                    "original": _polygon_to_str(line.get("polygon")),
+                    "crop": {k: crop.get(k, 0) for k in ("min_x", "max_x", "min_y", "max_y", "width", "height", "padding")},
+                },
+                "cropped_image": {"filename": filename, "path": line.get("image", "")},
+            })
+            region_v1["lines"].append(line_v1)
+
+            if crop:
+                out["cropped_images"].append({
+                    "filename": filename,
+                    "region_id": region.get("id"),
+                    "line_id": line.get("id"),
+                    "coordinates_on_scan": {k: crop[k] for k in ("min_x", "max_x", "min_y", "max_y", "width", "height")},
+                })
+
+        out["regions"].append(region_v1)
+
+    return out
@@ -1,24 +1,28 @@
 from __future__ import annotations
 
 import os
+import shutil
 import asyncio
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
 
 from fastapi import UploadFile, File as FAFile, Form, HTTPException
 from fastapi import status as http
 
 from src.api.v1.schemas.group_schemas import GroupOut
 from src.api.v1.schemas.file_schemas import FileOut, FileStatus
-from src.infra.storage.local_storage import AsyncLocalJsonFileStoreAiofiles, JsonFileStoreConfig
+from src.infra.storage.factory import get_store
 from src.core.configs import configs
+from src.tasks.ml_tasks import start_ml_pipeline, enqueue_ml_scan
 from src.utils.common import (
     _gid, _fid, now_iso,
-    ensure_group_dirs, group_dir_raw, group_dir_status,
-    atomic_write_json, _is_allowed_ext, _is_trash_member,
+    ensure_group_dirs, group_dir_raw, group_root,
+    _is_allowed_ext, _is_trash_member, _add_to_stem_map, _group_file_metas,
 )
+from src.services.journal.journal import status_journal, status_entry
 
-store = AsyncLocalJsonFileStoreAiofiles(JsonFileStoreConfig(base_dir=configs.dirs.store))
+store = get_store()
 
 
 async def _save_upload_to_path(dst_path: Path, uf: UploadFile) -> None:
@@ -48,15 +52,90 @@ async def _save_upload_to_path(dst_path: Path, uf: UploadFile) -> None:
         except OSError: pass
 
 
-async def _append_group_index(group_uuid: str, file_ids: List[str]) -> None:
+def _staging_dir(group_uuid: str) -> Path:
+    """
+    Скрытый каталог загрузки рядом с raw_data/. В raw_data/ файлы переезжают, когда меты
+    и индекс стем уже записаны: ml-pipeline в режиме watch берёт файл сразу после появления,
+    и его callback должен найти файл.
+    """
+    return group_root(group_uuid) / f".staging_{uuid4().hex}"
+
+
+async def _publish_staged(staging: Path, moves: List[Tuple[Path, Path]]) -> None:
+    """Перенести загруженные файлы из staging в raw_data/ (rename в пределах группы) и убрать staging."""
+    def _move():
+        for src, dst in moves:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(src, dst)
+        shutil.rmtree(staging, ignore_errors=True)
+    await asyncio.to_thread(_move)
+
+
+async def _append_group_index(group_uuid: str, file_ids: List[str]) -> int:
+    """Дописать файлы в индекс группы; вернуть, сколько файлов в ней было до этого."""
     idx_key = f"group_index/{group_uuid}"
-    if await store.exists(idx_key):
-        idx = await store.read(idx_key)
+    before = 0
+
+    def _patch(idx):
+        nonlocal before
         cur = set(idx.get("files", []))
+        before = len(cur)
         cur.update(file_ids)
-        await store.create(idx_key, {"files": sorted(cur)}, overwrite=True)
-    else:
-        await store.create(idx_key, {"files": file_ids}, overwrite=True)
+        return {"files": sorted(cur)}
+
+    # read-modify-write только через update: параллельные загрузки (и воркеры) не теряют файлы
+    try:
+        await store.create(idx_key, {"files": file_ids})
+    except FileExistsError:
+        await store.update(idx_key, _patch)
+    return before
+
+
+async def _group_status_view(group_uuid: str) -> Optional[Dict[str, dict]]:
+    """
+    Статусы файлов группы из журнала: {fid: {file_uuid, filename, status, ts, seq}}; None — группы нет.
+    Группе, созданной до появления журнала, он заводится из мет store при первом обращении
+    (или при первой дозаписи — см. StatusJournal.seed).
+    """
+    files = await status_journal.files(group_uuid)
+    if files is not None:
+        return files
+    idx = await store.read_or_none(f"group_index/{group_uuid}")
+    if idx is None:
+        return None
+    await status_journal.seed(group_uuid)
+    files = await status_journal.files(group_uuid)
+    if files is None:
+        # пустая группа или нет каталога statuses/ — журнал не завёлся, отдаём по метам
+        metas = await _group_file_metas(group_uuid, idx.get("files", []))
+        files = {m["file_uuid"]: dict(status_entry(m), seq=seq) for seq, m in enumerate(metas)}
+    return files
+
+
+async def _write_file_metas(group_uuid: str, metas: List[dict]) -> None:
+    """
+    store/files/{fid} для пачки новых файлов одной пачкой, события в журнал статусов группы
+    и индекс стем → fid для callback'ов.
+    """
+    await asyncio.gather(
+        store.create_many([(f"files/{m['file_uuid']}", m) for m in metas], overwrite=True),
+        status_journal.append(group_uuid, metas),
+    )
+    await _add_to_stem_map(group_uuid, metas)
+
+
+def _dispatch_ml_pipeline(group_uuid: str, raw_path: Path, index: int = 0) -> None:
+    """
+    Запустить ML-обработку файла (в режиме watch ml-pipeline находит файлы сам).
+    index — номер файла в группе: в режиме queue из него ml-pipeline строит scan_id.
+    """
+    mode = configs.ml_pipeline.ingest_mode
+    if mode == "watch":
+        return
+    if mode == "queue":
+        enqueue_ml_scan(group_uuid, raw_path.relative_to(group_dir_raw(group_uuid)).as_posix(), index)
+        return
+    start_ml_pipeline.send(group_uuid)
 
 
 def _should_accept(filename: str) -> bool:
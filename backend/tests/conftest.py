@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# тесты запускаются из backend/: python -m pytest tests
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# configs читаются при импорте src: данные тестов — во временном каталоге,
+# ML-обработку загрузки не запускаем (в режиме watch ml-pipeline находит файлы сам)
+_DATA = Path(tempfile.mkdtemp(prefix="backend-tests-"))
+os.environ.setdefault("DIR_FOR_DATA", str(_DATA))
+os.environ.setdefault("DIR_FOR_STORE", str(_DATA / "store"))
+os.environ.setdefault("ML_INGEST_MODE", "watch")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Приложение целиком; один клиент на сессию — asyncio-локи store привязаны к его циклу."""
+    from fastapi.testclient import TestClient
+    from main import application
+
+    with TestClient(application) as c:
+        yield c
+
+
+@pytest.fixture
+def legacy_group():
+    """Группа из времён до журнала статусов и агрегата прогресса: только меты и индекс в store."""
+    import asyncio
+    from uuid import uuid4
+    from src.utils.common import ensure_group_dirs, now_iso, store
+
+    def make(count: int = 3):
+        gid = str(uuid4())
+        ensure_group_dirs(gid)
+        metas = [{
+            "file_uuid": str(uuid4()),
+            "group_uuid": gid,
+            "original_name": f"page{i}.jpg",
+            "status": "progress",
+            "created_at": now_iso(),
+        } for i in range(count)]
+
+        async def write():
+            await store.create(f"groups/{gid}", {"group_uuid": gid, "created_at": now_iso()})
+            for m in metas:
+                await store.create(f"files/{m['file_uuid']}", m)
+            await store.create(f"group_index/{gid}", {"files": [m["file_uuid"] for m in metas]})
+
+        asyncio.run(write())
+        return gid, metas
+
+    return make
@@ -0,0 +1,62 @@
+"""Постраничная выдача файлов группы: курсор X-Next-Cursor."""
+
+
+def _page(client, gid, **params):
+    r = client.get(f"/api/v1/groups/{gid}/files", params=params)
+    assert r.status_code == 200, r.text
+    return [f["file_uuid"] for f in r.json()], r.headers.get("X-Next-Cursor")
+
+
+def test_cursor_walks_all_pages_in_upload_order(client, legacy_group):
+    gid, _ = legacy_group(5)
+    everything, cursor = _page(client, gid)
+    assert len(everything) == 5 and cursor is None
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        page, cursor = _page(client, gid, **params)
+        pages.append(page)
+        if cursor is None:
+            break
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert sum(pages, []) == everything
+
+
+def test_status_change_between_pages_does_not_shift_cursor(client, legacy_group):
+    gid, metas = legacy_group(4)
+    everything, _ = _page(client, gid)
+    first, cursor = _page(client, gid, limit=2)
+    assert first == everything[:2]
+
+    name = {m["file_uuid"]: m["original_name"] for m in metas}
+    r = client.post("/api/v1/pipeline/callback_ocr", json={
+        "group_uuid": gid, "file_uuid": first[0], "filename": name[first[0]], "status": "done",
+    })
+    assert r.status_code == 200, r.text
+
+    second, cursor = _page(client, gid, limit=2, cursor=cursor)
+    assert second == everything[2:]
+    assert cursor is None
+
+
+def test_cursor_with_status_filter(client, legacy_group):
+    gid, metas = legacy_group(4)
+    everything, _ = _page(client, gid)
+    name = {m["file_uuid"]: m["original_name"] for m in metas}
+    for fid in (everything[0], everything[2]):
+        r = client.post("/api/v1/pipeline/callback_ocr", json={
+            "group_uuid": gid, "file_uuid": fid, "filename": name[fid], "status": "done",
+        })
+        assert r.status_code == 200, r.text
+
+    page, cursor = _page(client, gid, status="progress", limit=1)
+    assert page == [everything[1]]
+    page, cursor = _page(client, gid, status="progress", limit=1, cursor=cursor)
+    assert page == [everything[3]]
+
+
+def test_malformed_cursor_is_rejected(client, legacy_group):
+    gid, _ = legacy_group(1)
+    r = client.get(f"/api/v1/groups/{gid}/files", params={"limit": 1, "cursor": "not-a-seq"})
+    assert r.status_code == 422
@@ -0,0 +1,34 @@
+"""Callback'и ml-pipeline: пачка статусов и ошибки по отдельным файлам."""
+
+
+def test_bulk_applies_good_items_and_reports_failed_ones(client, legacy_group):
+    gid, metas = legacy_group(2)
+
+    r = client.post("/api/v1/pipeline/callback_ocr/bulk", json={"items": [
+        {"group_uuid": gid, "filename": "page0_000_result.json", "status": "done"},
+        {"group_uuid": gid, "file_uuid": metas[1]["file_uuid"], "filename": "page1.jpg", "status": "done"},
+        {"group_uuid": gid, "filename": "ghost_000_result.json", "status": "done"},
+        {"group_uuid": gid, "filename": "page1.jpg", "status": "bogus"},
+        {"group_uuid": gid, "status": "done"},
+    ]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+
+    assert {(f["file_uuid"], f["status"]) for f in body["updated"]} == {
+        (metas[0]["file_uuid"], "done"), (metas[1]["file_uuid"], "done"),
+    }
+    assert [(f["filename"], f["status_code"]) for f in body["failed"]] == [
+        ("ghost_000_result.json", 404), ("page1.jpg", 400), (None, 400),
+    ]
+
+    statuses = {f["file_uuid"]: f["status"] for f in client.get(f"/api/v1/groups/{gid}/files").json()}
+    assert statuses == {m["file_uuid"]: "done" for m in metas}
+    assert client.get(f"/api/v1/groups/{gid}/progress").json()["counts"]["done"] == 2
+
+
+def test_single_callback_for_unknown_file_is_404(client, legacy_group):
+    gid, _ = legacy_group(1)
+    r = client.post("/api/v1/pipeline/callback_ocr", json={
+        "group_uuid": gid, "filename": "missing.jpg", "status": "done",
+    })
+    assert r.status_code == 404
@@ -0,0 +1,40 @@
+"""Результат ml-pipeline в формате v2: запись на стороне ml, разворот в v1 при отдаче."""
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+from src.utils.files import _expand_result_v2
+
+_ML = Path(__file__).resolve().parents[2] / "ml"
+
+
+@pytest.fixture(scope="module")
+def result_format():
+    path = _ML / "result_format.py"
+    if not path.exists():
+        pytest.skip("ml/ рядом с backend нет")
+    spec = importlib.util.spec_from_file_location("ml_result_format", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def result_v1():
+    return json.loads((_ML / "result-test3.json").read_text(encoding="utf-8"))
+
+
+def test_v2_round_trip_restores_v1(result_format, result_v1):
+    data = result_format.dumps_result(result_v1, result_format.FORMAT_V2)
+    v2 = json.loads(data)
+    assert v2["format_version"] == 2
+    assert "cropped_images" not in v2
+    assert len(data) < len(result_format.dumps_result(result_v1))
+
+    assert _expand_result_v2(v2) == result_v1
+
+
+def test_v1_is_served_as_is(result_v1):
+    assert _expand_result_v2(result_v1) is result_v1
@@ -0,0 +1,55 @@
+"""status:batch: статусы пачки файлов, неизвестные id и меты с чужим статусом."""
+import asyncio
+from uuid import uuid4
+
+from src.utils.common import store
+
+
+def _set_meta(fid: str, **fields) -> None:
+    async def patch():
+        await store.update(f"files/{fid}", lambda rec: {**rec, **fields})
+    asyncio.run(patch())
+
+
+def test_known_files_are_returned_in_request_order(client, legacy_group):
+    gid, metas = legacy_group(2)
+    _set_meta(metas[1]["file_uuid"], status="done", results={"final": "page1_001_result.json"})
+
+    fids = [metas[1]["file_uuid"], metas[0]["file_uuid"]]
+    r = client.post("/api/v1/files/status:batch", json={"file_uuids": fids})
+    assert r.status_code == 200, r.text
+    body = r.json()
+
+    assert [(f["file_uuid"], f["group_uuid"], f["filename"], f["status"]) for f in body["files"]] == [
+        (fids[0], gid, "page1.jpg", "done"), (fids[1], gid, "page0.jpg", "progress"),
+    ]
+    done, progress = body["files"]
+    assert done["result_filename"] == "page1_001_result.json"
+    assert done["content_url"] == (
+        f"/api/v1/files/{fids[0]}/content?stage=done&filename=page1_001_result.json")
+    assert progress["result_filename"] is None and progress["content_url"] is None
+    assert body["missing"] == [] and body["invalid"] == []
+
+
+def test_unknown_ids_are_missing_and_duplicates_collapsed(client, legacy_group):
+    _, metas = legacy_group(1)
+    fid, ghost = metas[0]["file_uuid"], str(uuid4())
+
+    r = client.post("/api/v1/files/status:batch", json={"file_uuids": [ghost, fid, ghost, fid]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert [f["file_uuid"] for f in body["files"]] == [fid]
+    assert body["missing"] == [ghost]
+
+
+def test_unknown_status_does_not_fail_the_batch(client, legacy_group):
+    _, metas = legacy_group(2)
+    broken = metas[0]["file_uuid"]
+    _set_meta(broken, status="archived")
+
+    r = client.post("/api/v1/files/status:batch",
+                    json={"file_uuids": [m["file_uuid"] for m in metas]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["invalid"] == [broken]
+    assert [f["file_uuid"] for f in body["files"]] == [metas[1]["file_uuid"]]
@@ -0,0 +1,25 @@
+"""Журнал статусов группы: засев старых групп из мет store."""
+
+
+def test_legacy_group_lists_all_files_after_first_callback(client, legacy_group):
+    gid, metas = legacy_group(3)
+    first = metas[0]
+
+    r = client.post("/api/v1/pipeline/callback_ocr", json={
+        "group_uuid": gid, "file_uuid": first["file_uuid"], "filename": first["original_name"], "status": "done",
+    })
+    assert r.status_code == 200, r.text
+
+    r = client.get(f"/api/v1/groups/{gid}/files")
+    assert r.status_code == 200, r.text
+    statuses = {f["file_uuid"]: f["status"] for f in r.json()}
+    assert statuses == {
+        first["file_uuid"]: "done",
+        metas[1]["file_uuid"]: "progress",
+        metas[2]["file_uuid"]: "progress",
+    }
+
+    progress = client.get(f"/api/v1/groups/{gid}/progress").json()
+    assert progress["total"] == 3
+    assert progress["counts"]["done"] == 1
+    assert progress["counts"]["progress"] == 2
@@ -0,0 +1,67 @@
+"""Журнал статусов: компакция в снапшот и чтение состояния после неё."""
+import asyncio
+from uuid import uuid4
+
+from src.services.journal.journal import HISTORY, JOURNAL, SNAPSHOT, StatusJournal
+from src.utils.common import ensure_group_dirs, group_dir_status
+
+
+def _meta(fid, status, second, name="page.jpg"):
+    return {"file_uuid": fid, "status": status, "original_name": name,
+            "updated_at": f"2025-01-01T00:00:{second:02d}"}
+
+
+def _new_group():
+    gid = str(uuid4())
+    ensure_group_dirs(gid)
+    return gid
+
+
+def test_state_survives_compaction_and_is_replayed_by_a_fresh_reader():
+    gid = _new_group()
+    a, b, c = (str(uuid4()) for _ in range(3))
+
+    async def scenario():
+        journal = StatusJournal(fsync=False, compact_every=4)
+        await journal.create(gid)
+        await journal.append(gid, [_meta(a, "progress", 1, "a.jpg"), _meta(b, "progress", 2, "b.jpg")])
+        await journal.append(gid, [_meta(a, "upgrading", 3, "a.jpg"), _meta(a, "done", 4, "a.jpg")])
+        before = await journal.files(gid)  # дочитывает и сворачивает сегмент
+        # события после компакции — в новом сегменте поверх снапшота
+        await journal.append(gid, [_meta(c, "progress", 5, "c.jpg"), _meta(b, "failed", 6, "b.jpg")])
+        after = await journal.files(gid)
+        # другой процесс: только снапшот + текущий сегмент с диска
+        replayed = await StatusJournal(fsync=False, compact_every=4).files(gid)
+        return before, after, replayed
+
+    before, after, replayed = asyncio.run(scenario())
+
+    d = group_dir_status(gid)
+    assert (d / SNAPSHOT).exists()
+    assert [p.name for p in (d / HISTORY).iterdir()] == ["000000.ndjson"]
+    assert len((d / JOURNAL).read_text().splitlines()) == 2
+
+    assert {fid: e["status"] for fid, e in before.items()} == {a: "done", b: "progress"}
+    assert replayed == after
+    assert list(replayed) == [a, b, c]
+    assert [e["seq"] for e in replayed.values()] == [0, 1, 2]
+    assert {fid: e["status"] for fid, e in replayed.items()} == {a: "done", b: "failed", c: "progress"}
+
+
+def test_late_event_does_not_roll_back_status():
+    gid = _new_group()
+    fid = str(uuid4())
+
+    async def scenario():
+        journal = StatusJournal(fsync=False)
+        await journal.create(gid)
+        await journal.append(gid, [_meta(fid, "done", 9)])
+        await journal.append(gid, [_meta(fid, "progress", 1)])
+        return await journal.files(gid)
+
+    assert asyncio.run(scenario())[fid]["status"] == "done"
+
+
+def test_group_without_journal_has_no_state():
+    gid = str(uuid4())
+    assert asyncio.run(StatusJournal(fsync=False).files(gid)) is None
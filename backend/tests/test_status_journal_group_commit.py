@@ -0,0 +1,94 @@
+"""Журнал статусов: group commit — дозаписи в пределах окна уходят одной записью на группу."""
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from src.services.journal.journal import JOURNAL, StatusJournal
+from src.utils.common import ensure_group_dirs, group_dir_status
+
+
+def _meta(fid, status="progress"):
+    return {"file_uuid": fid, "status": status, "original_name": f"{fid[:8]}.jpg",
+            "updated_at": "2025-01-01T00:00:00"}
+
+
+def _new_group():
+    gid = str(uuid4())
+    ensure_group_dirs(gid)
+    return gid
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """Записи в файлы журнала: [(gid, строк в записи)]."""
+    calls = []
+    append_file = StatusJournal._append_file
+
+    def recording(self, group_uuid, data):
+        calls.append((group_uuid, data.count(b"\n")))
+        append_file(self, group_uuid, data)
+
+    monkeypatch.setattr(StatusJournal, "_append_file", recording)
+    return calls
+
+
+def test_appends_within_window_share_one_write_per_group(writes):
+    g1, g2 = _new_group(), _new_group()
+    fids = [str(uuid4()) for _ in range(5)]
+
+    async def scenario():
+        journal = StatusJournal(window=0.05, fsync=False)
+        await journal.create(g1)
+        await journal.create(g2)
+        await asyncio.gather(*(journal.append(g1, [_meta(f)]) for f in fids),
+                             journal.append(g2, [_meta(fids[0])]))
+        return await journal.files(g1)
+
+    state = asyncio.run(scenario())
+    assert sorted(writes) == sorted([(g1, 5), (g2, 1)])
+    assert list(state) == fids
+    assert len((group_dir_status(g1) / JOURNAL).read_text().splitlines()) == 5
+
+
+def test_append_waits_for_its_batch_and_later_ones_go_next_round(writes):
+    gid = _new_group()
+    a, b = str(uuid4()), str(uuid4())
+
+    async def scenario():
+        journal = StatusJournal(window=0.02, fsync=False)
+        await journal.create(gid)
+        await journal.append(gid, [_meta(a)])
+        # append вернулся — строка уже в файле, без ожидания следующих событий
+        on_disk = (group_dir_status(gid) / JOURNAL).read_text().splitlines()
+        await journal.append(gid, [_meta(b)])
+        return on_disk
+
+    assert len(asyncio.run(scenario())) == 1
+    assert writes == [(gid, 1), (gid, 1)]
+
+
+def test_write_error_fails_only_its_group(monkeypatch):
+    good, bad = _new_group(), _new_group()
+    append_file = StatusJournal._append_file
+
+    def failing(self, group_uuid, data):
+        if group_uuid == bad:
+            raise OSError("disk full")
+        append_file(self, group_uuid, data)
+
+    monkeypatch.setattr(StatusJournal, "_append_file", failing)
+
+    async def scenario():
+        journal = StatusJournal(window=0.05, fsync=False)
+        await journal.create(good)
+        await journal.create(bad)
+        return await asyncio.gather(journal.append(good, [_meta(str(uuid4()))]),
+                                    journal.append(bad, [_meta(str(uuid4()))]),
+                                    return_exceptions=True)
+
+    ok, err = asyncio.run(scenario())
+    assert ok is None
+    assert isinstance(err, OSError)
+    assert len((group_dir_status(good) / JOURNAL).read_text().splitlines()) == 1
+    assert (group_dir_status(bad) / JOURNAL).read_text() == ""
@@ -0,0 +1,64 @@
+"""Индекс стем → file_uuid: поиск файла по имени результата ml-pipeline."""
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from src.utils.common import (
+    _add_to_stem_map, _normalize_to_stem, _resolve_fid_by_filename, _stem_map_key, store,
+)
+
+
+@pytest.mark.parametrize("name, stem", [
+    ("photo_2025-09-26_19-16-37_000_result.json", "photo_2025-09-26_19-16-37"),
+    ("Page1_012_result.json", "page1"),
+    ("page1.jpg", "page1"),
+    ("scan_0012.png", "scan"),
+    ("scan_12.png", "scan_12"),
+])
+def test_normalize_to_stem(name, stem):
+    assert _normalize_to_stem(name) == stem
+
+
+def test_legacy_group_map_is_rebuilt_on_first_lookup(legacy_group):
+    gid, metas = legacy_group(3)
+
+    async def scenario():
+        assert await store.read_or_none(_stem_map_key(gid)) is None
+        fid = await _resolve_fid_by_filename(gid, "page2_002_result.json")
+        return fid, await store.read(_stem_map_key(gid))
+
+    fid, doc = asyncio.run(scenario())
+    assert fid == metas[2]["file_uuid"]
+    assert doc["stems"] == {f"page{i}": m["file_uuid"] for i, m in enumerate(metas)}
+
+
+def test_file_missing_from_map_is_found_by_rebuild(legacy_group):
+    gid, metas = legacy_group(2)
+
+    async def scenario():
+        # индекс знает только первый файл (например, запись второго потерялась)
+        await _add_to_stem_map(gid, metas[:1])
+        return (await _resolve_fid_by_filename(gid, "page0_000_result.json"),
+                await _resolve_fid_by_filename(gid, "page1_001_result.json"))
+
+    assert asyncio.run(scenario()) == (metas[0]["file_uuid"], metas[1]["file_uuid"])
+
+
+def test_first_file_wins_on_stem_collision(legacy_group):
+    gid, metas = legacy_group(1)
+    later = {"file_uuid": str(uuid4()), "original_name": "page0.png"}
+
+    async def scenario():
+        await _add_to_stem_map(gid, metas)
+        await _add_to_stem_map(gid, [later])
+        return await _resolve_fid_by_filename(gid, "page0_000_result.json")
+
+    assert asyncio.run(scenario()) == metas[0]["file_uuid"]
+
+
+def test_unknown_group_and_name_resolve_to_none(legacy_group):
+    gid, _ = legacy_group(1)
+    assert asyncio.run(_resolve_fid_by_filename(str(uuid4()), "page0_000_result.json")) is None
+    assert asyncio.run(_resolve_fid_by_filename(gid, "other_000_result.json")) is None
+    assert asyncio.run(_resolve_fid_by_filename(gid, "")) is None
@@ -0,0 +1,361 @@
+"""
+Asynchronous status callbacks to the backend.
+Scan workers only enqueue an update; a background thread coalesces updates
+into bulk requests over a pooled HTTP session and retries failures, so a slow
+backend never stalls OCR. A caller that must know the outcome (the queue
+consumer acks a message only after its callback is applied) waits on the
+receipt returned by submit().
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+BULK_SUFFIX = "/bulk"
+
+
+def _update_key(payload: Dict[str, Any]) -> Tuple[Any, Any]:
+    return payload.get("group_uuid"), payload.get("file_uuid") or payload.get("filename")
+
+
+class CallbackReceipt:
+    """Outcome of a submitted update: delivered, or dropped after retries."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.delivered = False
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the update to be applied by the backend.
+
+        Args:
+            timeout: Seconds to wait (None — until resolved)
+
+        Returns:
+            True if the backend applied it (or a newer update of the same file)
+        """
+        return self._done.wait(timeout) and self.delivered
+
+    def _resolve(self, delivered: bool):
+        if not self._done.is_set():
+            self.delivered = delivered
+            self._done.set()
+
+
+class CallbackDispatcher:
+    """Background sender of scan status callbacks."""
+
+    def __init__(self, max_batch: int = 100, flush_interval: float = 0.5,
+                 max_backoff: float = 30.0, max_pending: int = 100_000,
+                 max_not_found_retries: int = 20):
+        """
+        Initialize dispatcher.
+
+        Args:
+            max_batch: Maximum number of updates per bulk request
+            flush_interval: How long to wait for more updates before sending
+            max_backoff: Upper bound of the retry delay in seconds
+            max_pending: Updates kept while the backend is unavailable; the oldest are dropped beyond that
+            max_not_found_retries: How many times an update answered with 404 is retried (with backoff)
+                before it is dropped; covers callbacks that outrun the upload registering the file
+        """
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        self.max_not_found_retries = max_not_found_retries
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any], CallbackReceipt]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # callback_url -> поддерживает ли backend /bulk (None — ещё не знаем)
+        self._bulk_supported: Dict[str, Optional[bool]] = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed_requests = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls) -> "CallbackDispatcher":
+        """Dispatcher configured by ML_CALLBACK_MAX_BATCH / ML_CALLBACK_FLUSH_INTERVAL."""
+        return cls(
+            max_batch=int(os.getenv("ML_CALLBACK_MAX_BATCH", "100")),
+            flush_interval=float(os.getenv("ML_CALLBACK_FLUSH_INTERVAL", "0.5")),
+        )
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="callback-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the thread after trying to deliver what is queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def submit(self, callback_url: str, payload: Dict[str, Any]) -> Optional[CallbackReceipt]:
+        """
+        Queue a status update; never blocks.
+
+        Args:
+            callback_url: Backend callback URL (bulk requests go to callback_url + "/bulk")
+            payload: Callback body, e.g. {"group_uuid", "filename", "status"}
+
+        Returns:
+            Receipt resolved once the update is delivered or dropped; None without callback_url
+        """
+        if not callback_url:
+            return None
+        self.start()
+        receipt = CallbackReceipt()
+        self._queue.put((callback_url, payload, receipt))
+        return receipt
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for /metrics."""
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "sent_total": self.sent,
+                "failed_requests_total": self.failed_requests,
+                "dropped_total": self.dropped,
+            }
+
+    def _run(self):
+        # неотправленные обновления по URL; последнее обновление файла замещает предыдущие
+        pending: "OrderedDict[str, OrderedDict[Tuple[Any, Any], Dict[str, Any]]]" = OrderedDict()
+        # обновления, на которые backend ответил 404: (повторов, не раньше чем) — у каждого свой backoff,
+        # чтобы файл, который ещё регистрируется, не задерживал остальные
+        not_found: Dict[Tuple[str, Tuple[Any, Any]], Tuple[int, float]] = {}
+        # кто ждёт исхода обновления файла: (callback_url, key) -> квитанции
+        waiting: Dict[Tuple[str, Tuple[Any, Any]], List[CallbackReceipt]] = {}
+        try:
+            self._loop(pending, not_found, waiting)
+        finally:
+            # остановка: недоставленное уже не уйдёт
+            for receipts in waiting.values():
+                for receipt in receipts:
+                    receipt._resolve(False)
+
+    def _loop(self, pending, not_found, waiting):
+        backoff = 0.5
+        retry_at = 0.0
+
+        def resolve(callback_url: str, key, delivered: bool):
+            for receipt in waiting.pop((callback_url, key), ()):
+                receipt._resolve(delivered)
+
+        while True:
+            stopping = self._stop.is_set()
+            self._collect(pending, waiting, block=not any(pending.values()) and not stopping)
+            if not any(pending.values()):
+                if stopping:
+                    return
+                continue
+            now = time.monotonic()
+            if now < retry_at and not stopping:
+                time.sleep(min(0.1, retry_at - now))
+                continue
+
+            ok = True
+            attempted = False
+            for callback_url, updates in list(pending.items()):
+                due = [k for k in updates if not_found.get((callback_url, k), (0, 0.0))[1] <= now]
+                for start in range(0, len(due), self.max_batch):
+                    keys = due[start:start + self.max_batch]
+                    batch = [updates.pop(k) for k in keys]
+                    again, dropped = self._send(callback_url, batch)
+                    attempted = True
+
+                    retry_keys = {_update_key(p) for p, _ in again}
+                    dropped_keys = {_update_key(p) for p in dropped}
+                    for k in keys:
+                        if k not in retry_keys:
+                            not_found.pop((callback_url, k), None)
+                            resolve(callback_url, k, k not in dropped_keys)
+                    for payload, is_404 in again:
+                        key = _update_key(payload)
+                        if is_404:
+                            n = not_found.get((callback_url, key), (0, 0.0))[0] + 1
+                            if n > self.max_not_found_retries:
+                                print(f"[callback] giving up on {key}: file still not found after {n - 1} retries")
+                                not_found.pop((callback_url, key), None)
+                                self._count_dropped(1)
+                                resolve(callback_url, key, False)
+                                continue
+                            not_found[(callback_url, key)] = (n, now + min(0.5 * 2 ** n, self.max_backoff))
+                        else:
+                            ok = False
+                        updates[key] = payload
+                    if len(again) == len(batch) and not any(is_404 for _, is_404 in again):
+                        # backend недоступен — остальное подождёт следующей попытки
+                        break
+                if not updates:
+                    pending.pop(callback_url, None)
+
+            if not ok:
+                if stopping:
+                    return
+                retry_at = time.monotonic() + backoff
+                backoff = min(backoff * 2, self.max_backoff)
+                for key in self._trim(pending):
+                    not_found.pop(key, None)
+                    resolve(key[0], key[1], False)
+            else:
+                backoff = 0.5
+                if not attempted and stopping:
+                    # остались только ждущие повтора 404 — при остановке их не дождаться
+                    return
+
+    def _collect(self, pending, waiting, block: bool):
+        """Move queued updates into pending, waiting up to flush_interval for more."""
+        deadline = time.monotonic() + self.flush_interval
+        count = 0
+        while count < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and count == 0:
+                    item = self._queue.get(timeout=1.0)
+                    deadline = time.monotonic() + self.flush_interval
+                elif timeout > 0:
+                    item = self._queue.get(timeout=timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                if block and count == 0 and not self._stop.is_set():
+                    continue
+                return
+            callback_url, payload, receipt = item
+            key = _update_key(payload)
+            # новое обновление замещает старое, поэтому и ждущие старого узнают исход нового
+            waiting.setdefault((callback_url, key), []).append(receipt)
+            updates = pending.setdefault(callback_url, OrderedDict())
+            updates.pop(key, None)
+            updates[key] = payload
+            count += 1
+
+    def _trim(self, pending) -> List[Tuple[str, Tuple[Any, Any]]]:
+        """Drop the oldest updates beyond max_pending; returns their (callback_url, key)."""
+        dropped = []
+        total = sum(len(u) for u in pending.values())
+        while total > self.max_pending:
+            for callback_url, updates in pending.items():
+                if updates:
+                    key, _ = updates.popitem(last=False)
+                    dropped.append((callback_url, key))
+                    total -= 1
+                    break
+        self._count_dropped(len(dropped))
+        return dropped
+
+    def _send(self, callback_url: str, batch: List[Dict[str, Any]]
+              ) -> Tuple[List[Tuple[Dict[str, Any], bool]], List[Dict[str, Any]]]:
+        """
+        Deliver a batch.
+
+        Returns:
+            Updates to retry, each with a flag telling whether the backend answered 404
+            (the file is not registered yet, e.g. a callback raced the upload),
+            and updates the backend rejected for good; the rest were applied
+        """
+        if self._bulk_supported.get(callback_url) is not False:
+            try:
+                r = self.session.post(callback_url.rstrip("/") + BULK_SUFFIX, json={"items": batch}, timeout=10)
+            except requests.RequestException as e:
+                print(f"[callback] bulk failed, will retry: {e}")
+                self._count_failed()
+                return [(p, False) for p in batch], []
+            if r.status_code in (404, 405):
+                # старый backend без bulk-эндпоинта
+                self._bulk_supported[callback_url] = False
+            elif r.status_code >= 500:
+                print(f"[callback] bulk {len(batch)} -> {r.status_code}, will retry")
+                self._count_failed()
+                return [(p, False) for p in batch], []
+            elif r.status_code >= 400:
+                # пачку целиком не приняли (например, 422) — повтор того же тела не поможет
+                print(f"[callback] bulk {len(batch)} -> {r.status_code} {r.text[:120]}, dropped")
+                self._count_dropped(len(batch))
+                return [], batch
+            else:
+                self._bulk_supported[callback_url] = True
+                return self._bulk_retries(batch, r)
+
+        retry: List[Tuple[Dict[str, Any], bool]] = []
+        dropped: List[Dict[str, Any]] = []
+        for i, payload in enumerate(batch):
+            try:
+                r = self.session.post(callback_url, json=payload, timeout=10)
+            except requests.RequestException as e:
+                print(f"[callback] failed, will retry: {e}")
+                self._count_failed()
+                return retry + [(p, False) for p in batch[i:]], dropped
+            print(f"[callback] POST {callback_url} -> {r.status_code} {r.text[:120]}")
+            if r.status_code >= 500:
+                self._count_failed()
+                return retry + [(p, False) for p in batch[i:]], dropped
+            if r.status_code == 404:
+                retry.append((payload, True))
+            elif r.status_code >= 400:
+                self._count_dropped(1)
+                dropped.append(payload)
+            else:
+                self._count_sent(1)
+        return retry, dropped
+
+    def _bulk_retries(self, batch: List[Dict[str, Any]], r
+                      ) -> Tuple[List[Tuple[Dict[str, Any], bool]], List[Dict[str, Any]]]:
+        """Split CallbackBulkOut.failed into updates to retry (404 and 5xx) and rejected ones."""
+        try:
+            failed = r.json().get("failed") or []
+        except ValueError:
+            failed = []
+        by_name = {(p.get("group_uuid"), p.get("filename")): p for p in batch}
+        retry = []
+        dropped = []
+        for item in failed:
+            code = item.get("status_code") or 500
+            payload = by_name.pop((item.get("group_uuid"), item.get("filename")), None)
+            if payload is None:
+                continue
+            if code == 404 or code >= 500:
+                retry.append((payload, code == 404))
+            else:
+                print(f"[callback] {item.get('filename')} -> {code} {item.get('detail')}, dropped")
+                self._count_dropped(1)
+                dropped.append(payload)
+        print(f"[callback] bulk {len(batch)} -> {r.status_code}, {len(retry)} to retry")
+        self._count_sent(len(batch) - len(failed))
+        return retry, dropped
+
+    def _count_sent(self, n: int):
+        with self._lock:
+            self.sent += n
+
+    def _count_dropped(self, n: int):
+        with self._lock:
+            self.dropped += n
+
+    def _count_failed(self):
+        with self._lock:
+            self.failed_requests += 1
+
+
+# Shared by all scan workers of the process
+callback_dispatcher = CallbackDispatcher.from_env()
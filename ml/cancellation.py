@@ -0,0 +1,79 @@
+"""
+Cancellation of queued and in-flight scans.
+The backend cancels a group when it is deleted; workers check a token at
+every stage boundary and stop, releasing CPU for live jobs.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+
+class ScanCancelled(Exception):
+    """Raised at a stage boundary when the scan's group was cancelled."""
+
+
+class CancelToken:
+    """Cancellation state of one scan."""
+
+    def __init__(self, registry: "CancellationRegistry", group_uuid: Optional[str],
+                 required_paths: Iterable[str] = ()):
+        """
+        Initialize token.
+
+        Args:
+            registry: Registry with cancelled groups
+            group_uuid: Group the scan belongs to
+            required_paths: Paths whose disappearance also cancels the scan
+                (the group directory is removed on delete, even if the
+                cancel request went to another replica)
+        """
+        self.registry = registry
+        self.group_uuid = group_uuid
+        self.required_paths = list(required_paths)
+
+    @property
+    def cancelled(self) -> bool:
+        if self.group_uuid and self.registry.is_cancelled(self.group_uuid):
+            return True
+        return any(not os.path.exists(p) for p in self.required_paths)
+
+    def raise_if_cancelled(self, stage: str = ""):
+        if self.cancelled:
+            raise ScanCancelled(f"group {self.group_uuid} cancelled before {stage or 'next stage'}")
+
+
+class CancellationRegistry:
+    """Thread-safe set of cancelled groups; entries expire after a TTL."""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._cancelled: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def cancel(self, group_uuid: str):
+        with self._lock:
+            self._cancelled[group_uuid] = time.time()
+            self._expire()
+
+    def is_cancelled(self, group_uuid: str) -> bool:
+        with self._lock:
+            cancelled_at = self._cancelled.get(group_uuid)
+            return cancelled_at is not None and time.time() - cancelled_at <= self.ttl_seconds
+
+    def token(self, group_uuid: Optional[str], required_paths: Iterable[str] = ()) -> CancelToken:
+        return CancelToken(self, group_uuid, required_paths)
+
+    def _expire(self):
+        """Drop expired entries (caller holds the lock)."""
+        deadline = time.time() - self.ttl_seconds
+        for group_uuid in [g for g, t in self._cancelled.items() if t < deadline]:
+            del self._cancelled[group_uuid]
+
+
+# Shared by the HTTP handlers and all scan workers of the process
+cancellations = CancellationRegistry()
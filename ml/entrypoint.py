@@ -1,15 +1,36 @@
 # ml/entrypoint.py
 import os
+import atexit
 import argparse
+import math
 from threading import Thread
-import json
 from pathlib import Path
-from typing import List, Dict, Any
-import requests
+from typing import List, Dict, Any, Optional
 from aiohttp import web
 
-from storage_manager import LocalStorageManager
+from storage_manager import LocalStorageManager, claim_replica_storage
 from pipeline_processor import PipelineProcessor
+from pipeline_metrics import metrics as pipeline_metrics
+from ocr_cache import line_cache
+from retention import StorageRetention
+from watcher import RawDataWatcher
+from scheduler import FairScanScheduler
+from cancellation import CancelToken, ScanCancelled, cancellations
+from callback_dispatcher import CallbackReceipt, callback_dispatcher
+from result_format import configured_format, dumps_result
+
+# Один менеджер хранилища на процесс: общий учёт занятого места и кэш результатов.
+# Реплики на общем томе получают каждая свою папку replica-N
+storage_manager = LocalStorageManager(str(claim_replica_storage(os.getenv("ML_STORAGE_ROOT", "./local_storage"))))
+atexit.register(storage_manager.flush_index)
+atexit.register(callback_dispatcher.stop)
+
+# Общая очередь сканов: группы обслуживаются по кругу, маленькие — вне очереди
+scheduler = FairScanScheduler()
+SCAN_WORKERS = int(os.getenv("ML_SCAN_WORKERS", "1"))
+RESULT_FORMAT = configured_format()
+# режим очереди: сколько ждать доставки колбэка перед ack (404 повторяются с backoff до ~10 минут)
+QUEUE_CALLBACK_TIMEOUT = float(os.getenv("ML_QUEUE_CALLBACK_TIMEOUT", "900"))
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='ML Pipeline Docker Container')
@@ -28,15 +49,15 @@ def find_image_files(source_dir: str) -> List[str]:
     return sorted(map(str, files))
 
 def process_single_image(image_path: str, scan_id: str, storage_manager: LocalStorageManager,
-                         pipeline_processor: PipelineProcessor) -> Dict[str, Any]:
-    return pipeline_processor.process_scan(image_path, scan_id, storage_manager)
+                         pipeline_processor: PipelineProcessor, cancel_token: CancelToken = None) -> Dict[str, Any]:
+    return pipeline_processor.process_scan(image_path, scan_id, storage_manager, cancel_token=cancel_token)
 
 def save_result_to_destination(result: Dict[str, Any], scan_id: str, destination_dir: str) -> str:
     dest = Path(destination_dir)
     dest.mkdir(parents=True, exist_ok=True)
     out = dest / f"{scan_id}_result.json"
-    with open(out, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    with open(out, 'wb') as f:
+        f.write(dumps_result(result, RESULT_FORMAT))  # v1 или компактный v2 (ML_RESULT_FORMAT)
         f.flush(); os.fsync(f.fileno())
     return str(out)
 
@@ -48,23 +69,47 @@ def _extract_group_uuid_from_path(p: Path) -> str:
             return parts[i + 1]
     return None
 
-def _post_callback(callback_url: str, group_uuid: str, filename: str) -> None:
-    if not callback_url:
-        return
+def _post_callback(callback_url: str, group_uuid: str, filename: str,
+                   result_filename: str = "") -> Optional[CallbackReceipt]:
+    # не блокирует обработку: отправка пачками в фоне, с повторами
     payload = {"group_uuid": group_uuid, "filename": filename, "status": "upgrading"}
-    # несколько попыток, чтобы не терять событие из-за сетевой загрузки
-    backoff = 0.5
-    for _ in range(5):
-        try:
-            r = requests.post(callback_url, json=payload, timeout=10)
-            print(f"[callback] POST {callback_url} -> {r.status_code} {r.text[:120]}")
-            r.raise_for_status()
-            return
-        except Exception as e:
-            import time
-            print(f"[callback] retry after error: {e}")
-            time.sleep(backoff)
-            backoff = min(backoff * 2, 8)
+    if result_filename:
+        # backend запоминает имя результата и отдаёт контент без поиска по каталогу
+        payload["result_filename"] = result_filename
+    return callback_dispatcher.submit(callback_url, payload)
+
+def process_to_destination(image_path: str, scan_id: str, dst: str, group_uuid: str, callback_url: str,
+                           pipeline_processor: PipelineProcessor) -> Optional[CallbackReceipt]:
+    image_filename = Path(image_path).name           # ← имя исходника в raw_data
+    # отмена: группу удалили (запрос /cancel или исчез исходник вместе с папкой группы)
+    cancel_token = cancellations.token(group_uuid, required_paths=[image_path])
+    # scan_id ({stem}_NNN) уникален только внутри группы — в хранилище добавляем группу;
+    # имя результата остаётся {stem}_NNN_result.json, backend сопоставляет его по stem
+    storage_id = f"{group_uuid}_{scan_id}" if group_uuid else scan_id
+
+    try:
+        with storage_manager.scan_in_use(storage_id):
+            result = process_single_image(image_path, storage_id, storage_manager, pipeline_processor, cancel_token)
+            cancel_token.raise_if_cancelled("save")
+            result_path = save_result_to_destination(result, scan_id, dst) # ← твой JSON пишет здесь
+    except ScanCancelled:
+        # промежуточные файлы отменённого скана больше не нужны — если их не держит
+        # параллельная обработка того же скана (повторная доставка сообщения)
+        if not storage_manager.is_scan_in_use(storage_id):
+            storage_manager.cleanup_scan(storage_id)
+        raise
+
+    # Сразу уведомляем backend: он поменяет статус на "upgrading"
+    return _post_callback(callback_url, group_uuid, image_filename, Path(result_path).name)
+
+def process_and_report(image_path: str, scan_id: str, dst: str, group_uuid: str, callback_url: str,
+                       pipeline_processor: PipelineProcessor) -> None:
+    try:
+        process_to_destination(image_path, scan_id, dst, group_uuid, callback_url, pipeline_processor)
+    except ScanCancelled as e:
+        print(f"Cancelled {image_path}: {e}")
+    except Exception as e:
+        print(f"Failed to process {image_path}: {e}")
 
 def start_image_processing(source: str, dst: str, callback_url: str):
     image_files = find_image_files(source)
@@ -72,24 +117,86 @@ def start_image_processing(source: str, dst: str, callback_url: str):
         print(f"No image files found in {source}")
         return
 
-    storage_manager = LocalStorageManager()
-    pipeline_processor = PipelineProcessor()
-
     group_uuid = _extract_group_uuid_from_path(Path(source))
+    if group_uuid and cancellations.is_cancelled(group_uuid):
+        print(f"Group {group_uuid} was cancelled, skipping {source}")
+        return
 
-    for i, image_path in enumerate(image_files):
+    queued = sum(scheduler.submit(group_uuid, image_path, dst, callback_url) for image_path in image_files)
+    print(f"Queued {queued} of {len(image_files)} images from {source}")
+
+def scan_worker():
+    pipeline_processor = PipelineProcessor()
+    while True:
+        job = scheduler.get()
         try:
-            image_filename = Path(image_path).name           # ← имя исходника в raw_data
-            scan_id = f"{Path(image_path).stem}_{i:03d}"
+            process_and_report(job.image_path, job.scan_id, job.dst, job.group_uuid, job.callback_url,
+                               pipeline_processor)
+        finally:
+            scheduler.task_done(job)
+        if not scheduler.stats()["pending"]:
+            storage_manager.flush_index()
 
-            result = process_single_image(image_path, scan_id, storage_manager, pipeline_processor)
-            save_result_to_destination(result, scan_id, dst) # ← твой JSON пишет здесь
+def start_scan_workers(count: int):
+    for i in range(count):
+        Thread(target=scan_worker, name=f"scan-worker-{i}", daemon=True).start()
 
-            # Сразу уведомляем backend: он поменяет статус на "upgrading"
-            _post_callback(callback_url, group_uuid, image_filename)
+def start_watch_ingestion(watch_root: str, callback_url: str) -> RawDataWatcher:
+    """
+    Streaming mode: process images from <watch_root>/<group_uuid>/raw_data/
+    as soon as they are fully written, results go to <group_uuid>/process/.
+    """
+    def enqueue(group_uuid: str, image_path: str):
+        if cancellations.is_cancelled(group_uuid):
+            return
+        dst = str(Path(watch_root) / group_uuid / "process")
+        if scheduler.submit(group_uuid, image_path, dst, callback_url):
+            print(f"[watch] queued {image_path}")
+
+    watcher = RawDataWatcher(
+        watch_root, enqueue,
+        mode=os.getenv("ML_WATCH_MODE", "auto"),
+        poll_interval=float(os.getenv("ML_WATCH_POLL_INTERVAL", "2")),
+        process_existing=os.getenv("ML_WATCH_PROCESS_EXISTING", "0") == "1",
+    )
+    watcher.start()
+    return watcher
+
+def start_queue_ingestion(amqp_url: str):
+    """
+    Pull mode: take one scan at a time from the shared RabbitMQ queue,
+    the message is acked only after the result is written and the backend
+    has applied its callback.
+    """
+    from queue_consumer import start_scan_consumer  # dramatiq нужен только в этом режиме
+
+    processors: List[PipelineProcessor] = []  # создаём лениво, в потоке воркера
 
-        except Exception as e:
-            print(f"Failed to process {image_path}: {e}")
+    def handle_scan(group_uuid: str, source: str, dst: str, callback: str, index: int = 0):
+        if not Path(source).is_file() or cancellations.is_cancelled(group_uuid):
+            # группу могли удалить, пока сообщение ждало в очереди
+            print(f"[queue] skip cancelled or missing {source}")
+            return
+        if not processors:
+            processors.append(PipelineProcessor())
+        pipeline_processor = processors[0]
+        # номер файла в загрузке приходит от backend: одинаковые stem в группе не столкнутся
+        scan_id = f"{Path(source).stem}_{index:03d}"
+        # исключение не глушим: сообщение уйдёт на повтор (кроме отмены — её подтверждаем)
+        try:
+            receipt = process_to_destination(source, scan_id, dst, group_uuid, callback, pipeline_processor)
+        except ScanCancelled as e:
+            print(f"[queue] cancelled {source}: {e}")
+            receipt = None
+        storage_manager.flush_index()
+        # ack только после доставки колбэка: иначе при падении реплики статус файла так и не сменится;
+        # повтор сообщения возьмёт результат из кэша и отправит колбэк заново
+        if receipt is not None and not receipt.wait(QUEUE_CALLBACK_TIMEOUT):
+            raise RuntimeError(f"callback for {source} was not delivered, message will be retried")
+
+    worker = start_scan_consumer(amqp_url, handle_scan)
+    atexit.register(worker.stop)
+    return worker
 
 def main(request):
     try:
@@ -105,7 +212,62 @@ def main(request):
         print(f"Fatal error: {str(e)}")
         return web.json_response({"error": str(e)}, status=500)
 
+def cancel_handler(request):
+    group_uuid = request.query.get('group_uuid')
+    if not group_uuid:
+        return web.json_response({"error": "group_uuid is required"}, status=400)
+    cancellations.cancel(group_uuid)
+    dropped = scheduler.cancel_group(group_uuid)
+    print(f"[cancel] group {group_uuid}: dropped {dropped} queued scans")
+    return web.json_response({"group_uuid": group_uuid, "dropped": dropped})
+
+def queue_handler(request):
+    group_uuid = request.query.get('group_uuid')
+    if not group_uuid:
+        return web.json_response(scheduler.stats())
+
+    position = scheduler.queue_position(group_uuid)
+    # ETA: сколько сканов обработается до последнего скана группы, при средней длительности скана
+    avg_scan_seconds = pipeline_metrics.scan_value_mean("wall_seconds")
+    eta_seconds = None
+    if avg_scan_seconds is not None:
+        if position["scans_before_last"] is not None:
+            rounds = math.ceil((position["scans_before_last"] + 1 + position["busy"]) / SCAN_WORKERS)
+            eta_seconds = round(rounds * avg_scan_seconds, 1)
+        elif position["in_progress"]:
+            eta_seconds = round(avg_scan_seconds, 1)
+    position["avg_scan_seconds"] = avg_scan_seconds
+    position["eta_seconds"] = eta_seconds
+    return web.json_response(position)
+
+def metrics_handler(request):
+    # Prometheus text exposition format
+    return web.Response(text=pipeline_metrics.render_prometheus(),
+                        content_type="text/plain", charset="utf-8")
+
 if __name__ == "__main__":
+    retention = StorageRetention(storage_manager)
+    retention.start()
+
+    pipeline_metrics.register_gauges("ocr_line_cache", line_cache.stats)
+    pipeline_metrics.register_gauges("result_cache", storage_manager.get_result_cache_stats)
+    pipeline_metrics.register_gauges("storage", retention.stats)
+    pipeline_metrics.register_gauges("scheduler", scheduler.stats)
+    pipeline_metrics.register_gauges("callbacks", callback_dispatcher.stats)
+
+    start_scan_workers(SCAN_WORKERS)
+
+    # Потоковый режим: следим за groups/*/raw_data вместо запросов от backend
+    watch_root = os.getenv("ML_WATCH_ROOT")
+    if watch_root:
+        start_watch_ingestion(watch_root, os.getenv("ML_CALLBACK_URL", ""))
+
+    # Режим очереди: забираем сканы из RabbitMQ сами, реплик может быть несколько
+    amqp_url = os.getenv("ML_QUEUE_AMQP_URL")
+    if amqp_url:
+        start_queue_ingestion(amqp_url)
+
     app = web.Application()
-    app.add_routes([web.get('/', main)])
+    app.add_routes([web.get('/', main), web.get('/queue', queue_handler),
+                    web.post('/cancel', cancel_handler), web.get('/metrics', metrics_handler)])
     web.run_app(app, port=int(os.getenv("PORT", "8080")))
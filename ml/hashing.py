@@ -0,0 +1,81 @@
+"""
+Content hashing helpers for the ML pipeline.
+Used to build cache keys from image bytes and model weights.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+
+_CHUNK_SIZE = 1 << 20
+
+# file_digest is also called for every input scan, so the memo is an LRU
+_FILE_DIGESTS_MAX = int(os.getenv("ML_FILE_DIGEST_CACHE_SIZE", "4096"))
+
+_file_digests: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+_file_digests_lock = threading.Lock()
+
+
+def bytes_digest(data: bytes) -> str:
+    """
+    Hash a bytes buffer.
+
+    Args:
+        data: Raw bytes
+
+    Returns:
+        Hex digest
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def fast_digest(data: bytes) -> str:
+    """
+    Short 128-bit digest for hot paths (per-line cache keys).
+
+    Args:
+        data: Raw bytes
+
+    Returns:
+        Hex digest (32 characters)
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """
+    Hash a file's content. Results are memoized by (size, mtime) in a
+    bounded LRU, so large model weights are only read once per process.
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        Hex digest
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    with _file_digests_lock:
+        cached = _file_digests.get(path)
+        if cached is not None:
+            _file_digests.move_to_end(path)
+    if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    if _FILE_DIGESTS_MAX <= 0:
+        return digest
+    with _file_digests_lock:
+        _file_digests[path] = (st.st_size, st.st_mtime_ns, digest)
+        _file_digests.move_to_end(path)
+        while len(_file_digests) > _FILE_DIGESTS_MAX:
+            _file_digests.popitem(last=False)
+    return digest
@@ -14,6 +14,9 @@ from torchvision.models import resnet50, ResNet50_Weights
 import torchvision.transforms as transforms
 from PIL import Image
 
+from hashing import file_digest
+from ocr_cache import LineResultCache, line_cache as shared_line_cache
+
 
 class ModelParameters:
     def __init__(self):
@@ -132,11 +135,12 @@ class TransformerModel(nn.Module):
 
 
 class OCRPredictor:
-    def __init__(self, checkpoint_path=None):
+    def __init__(self, checkpoint_path=None, line_cache: LineResultCache = None):
         if checkpoint_path is None:
             # Определяем путь относительно этого файла
             current_dir = os.path.dirname(os.path.abspath(__file__))
             checkpoint_path = os.path.join(current_dir, "models", "best.pt")
+        self.checkpoint_path = checkpoint_path
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.params = ModelParameters()
         
@@ -183,6 +187,13 @@ class OCRPredictor:
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
 
+        # Сколько токенов было декодировано последним вызовом predict() (для метрик)
+        self.last_decoded_tokens = 0
+
+        # Кэш результатов по строкам: ключ = хэш входного тензора + идентичность checkpoint'а
+        self.line_cache = line_cache if line_cache is not None else shared_line_cache
+        self.model_id = file_digest(checkpoint_path) if self.line_cache.enabled else ""
+
     def preprocess_image(self, img):
         """ТОЧНАЯ предобработка как в TextLoader (dataset.py)."""
         # Конвертируем grayscale в 3-канальное
@@ -207,11 +218,23 @@ class OCRPredictor:
         self.model.eval()
         predictions = []
         confidences = []
+        self.last_decoded_tokens = 0
         
         with torch.no_grad():
             for img in images:
                 # Предобработка изображения
                 img_tensor = self.preprocess_image(img)
+
+                # Кэш: одинаковый нормализованный тензор -> тот же результат, пропускаем encoder и декодирование
+                cache_key = None
+                if self.line_cache.enabled:
+                    cache_key = self.line_cache.key(img_tensor.numpy().tobytes(), self.model_id)
+                    cached = self.line_cache.get(cache_key)
+                    if cached is not None:
+                        predictions.append(cached[0])
+                        confidences.append(cached[1])
+                        continue
+
                 src = img_tensor.unsqueeze(0).to(self.device)  # (1, 3, H, W)
                 
                 # ТОЧНАЯ логика inference из validate()
@@ -249,9 +272,12 @@ class OCRPredictor:
                     out_p_indices = out_indexes[b_idx][1:]
                     out_p_indices = [idx for idx in out_p_indices if idx != end_token]
                     out_p = labels_to_text(out_p_indices, self.idx2p)
+                    self.last_decoded_tokens += len(out_indexes[b_idx]) - 1
                     
                     predictions.append(out_p)
                     confidences.append(1.0)  # Placeholder
+                    if cache_key is not None:
+                        self.line_cache.put(cache_key, out_p, 1.0)
         
         return predictions, confidences
 
@@ -0,0 +1,207 @@
+"""
+Line-level OCR result cache.
+Memoizes recognized text per line crop, keyed by the normalized model input
+tensor and the checkpoint identity, with an in-memory LRU and an optional
+on-disk tier (also LRU, bounded by entry count).
+"""
+
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from hashing import fast_digest
+
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_DISK_MAX_ENTRIES = 200_000
+
+
+class LineResultCache:
+    """Two-tier (memory LRU + optional disk) cache of OCR line results."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, disk_path: Optional[str] = None,
+                 disk_max_entries: int = DEFAULT_DISK_MAX_ENTRIES):
+        """
+        Initialize line cache.
+
+        Args:
+            max_entries: Capacity of the in-memory LRU (0 disables the cache)
+            disk_path: Directory of the on-disk tier, or None to keep it in memory only
+            disk_max_entries: Capacity of the on-disk tier; least recently used
+                entries are deleted beyond it (0 disables the disk tier)
+        """
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.disk_path = Path(disk_path) if disk_path and disk_max_entries > 0 else None
+        if self.disk_path is not None:
+            self.disk_path.mkdir(parents=True, exist_ok=True)
+
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # LRU index of the disk tier, built from file mtimes on first use
+        self._disk_index: "Optional[OrderedDict[str, None]]" = None
+        self._lock = threading.Lock()
+        self._hits_memory = 0
+        self._hits_disk = 0
+        self._misses = 0
+
+    @classmethod
+    def from_env(cls) -> "LineResultCache":
+        """Create a cache configured by ML_OCR_LINE_CACHE_SIZE / ML_OCR_LINE_CACHE_DIR / ML_OCR_LINE_CACHE_DISK_SIZE."""
+        return cls(
+            max_entries=int(os.getenv("ML_OCR_LINE_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+            disk_path=os.getenv("ML_OCR_LINE_CACHE_DIR") or None,
+            disk_max_entries=int(os.getenv("ML_OCR_LINE_CACHE_DISK_SIZE", DEFAULT_DISK_MAX_ENTRIES)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, input_bytes: bytes, model_id: str) -> str:
+        """
+        Build a cache key.
+
+        Args:
+            input_bytes: Bytes of the normalized model input tensor
+            model_id: Checkpoint identity
+
+        Returns:
+            Cache key
+        """
+        return fast_digest(model_id.encode('utf-8') + b'\0' + input_bytes)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        Look up a line result.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            (text, confidence) or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits_memory += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits_disk += 1
+            self._remember(key, entry)
+            index = self._load_disk_index()
+            index[key] = None
+            index.move_to_end(key)
+        return entry
+
+    def put(self, key: str, text: str, confidence: float):
+        """
+        Store a line result.
+
+        Args:
+            key: Cache key
+            text: Recognized text
+            confidence: Recognition confidence
+        """
+        entry = (text, float(confidence))
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with hit/miss counters, hit rate and size
+        """
+        with self._lock:
+            hits = self._hits_memory + self._hits_disk
+            lookups = hits + self._misses
+            return {
+                "hits_memory": self._hits_memory,
+                "hits_disk": self._hits_disk,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "disk_entries": len(self._disk_index) if self._disk_index is not None else 0,
+            }
+
+    def _remember(self, key: str, entry: Tuple[str, float]):
+        """Insert into the memory LRU (caller holds the lock)."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_file(self, key: str) -> Path:
+        return self.disk_path / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[Tuple[str, float]]:
+        if self.disk_path is None:
+            return None
+        source = self._disk_file(key)
+        try:
+            with open(source, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            os.utime(source)  # mtime — порядок LRU при следующем запуске
+            return data["text"], float(data["confidence"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key: str, entry: Tuple[str, float]):
+        if self.disk_path is None:
+            return
+        destination = self._disk_file(key)
+        try:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=destination.parent, prefix=".tmp_", suffix=".json")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"text": entry[0], "confidence": entry[1]}, f, ensure_ascii=False)
+            os.replace(tmp_name, destination)
+        except OSError as e:
+            print(f"Warning: Could not write OCR line cache entry: {e}")
+            return
+
+        with self._lock:
+            index = self._load_disk_index()
+            index[key] = None
+            index.move_to_end(key)
+            evicted = []
+            while len(index) > self.disk_max_entries:
+                evicted.append(index.popitem(last=False)[0])
+        for old_key in evicted:
+            try:
+                self._disk_file(old_key).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Warning: Could not evict OCR line cache entry: {e}")
+
+    def _load_disk_index(self) -> "OrderedDict[str, None]":
+        """Build the disk LRU index from disk on first use (caller holds the lock)."""
+        if self._disk_index is None:
+            entries = []
+            for path in self.disk_path.glob("*/*.json"):
+                if path.name.startswith(".tmp_"):
+                    continue
+                try:
+                    entries.append((path.stat().st_mtime, path.stem))
+                except FileNotFoundError:
+                    continue
+            entries.sort()
+            self._disk_index = OrderedDict((key, None) for _, key in entries)
+        return self._disk_index
+
+
+# Shared across OCRPredictor instances: the checkpoint identity is part of the key
+line_cache = LineResultCache.from_env()
@@ -0,0 +1,252 @@
+"""
+Per-stage metrics for the ML pipeline.
+Collects wall/CPU time and memory per processing stage, emits structured
+log lines and renders everything in the Prometheus text exposition format.
+"""
+
+import json
+import os
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from cancellation import ScanCancelled
+
+
+QUANTILES = (0.5, 0.95)
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """Current resident set size of the process (Linux only)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_bytes() -> int:
+    """Peak resident set size of the process since start."""
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+class _Summary:
+    """Sliding-window summary: total sum/count plus quantiles over recent samples."""
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.total += value
+        self.count += 1
+
+    def quantiles(self) -> Dict[float, float]:
+        ordered = sorted(self.samples)
+        return {q: _quantile(ordered, q) for q in QUANTILES}
+
+
+class ScanRecord:
+    """Metrics gathered while processing a single scan."""
+
+    def __init__(self, scan_id: str):
+        self.scan_id = scan_id
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.values: Dict[str, float] = {}
+
+    def set(self, name: str, value: float):
+        self.values[name] = value
+
+    def add(self, name: str, value: float):
+        self.values[name] = self.values.get(name, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scan_id": self.scan_id,
+            "stages": self.stages,
+            **self.values,
+        }
+
+
+class PipelineMetrics:
+    """Thread-safe registry of pipeline metrics."""
+
+    def __init__(self, window: int = 1024, prefix: str = "ml_pipeline"):
+        """
+        Initialize metrics registry.
+
+        Args:
+            window: Number of recent samples used for quantiles
+            prefix: Prefix for exported metric names
+        """
+        self.window = window
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stage_wall: Dict[str, _Summary] = {}
+        self._stage_cpu: Dict[str, _Summary] = {}
+        self._scan_values: Dict[str, _Summary] = {}
+        self._counters: Dict[str, float] = {}
+        self._gauge_sources: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    @contextmanager
+    def scan(self, scan_id: str) -> Iterator[ScanRecord]:
+        """
+        Track a whole scan; emits a structured log line when the scan ends.
+
+        Args:
+            scan_id: Unique identifier for the scan
+        """
+        record = ScanRecord(scan_id)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield record
+        except ScanCancelled:
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            record.set("wall_seconds", round(time.perf_counter() - started, 6))
+            record.set("peak_rss_bytes", _peak_rss_bytes())
+            record.set("status", status)
+            self.observe_scan(record)
+
+    @contextmanager
+    def stage(self, name: str, record: Optional[ScanRecord] = None) -> Iterator[None]:
+        """
+        Time a pipeline stage.
+
+        Args:
+            name: Stage name (layout, extract, ocr, ...)
+            record: Scan record to attach stage timings to
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self.observe_stage(name, wall, cpu)
+            if record is not None:
+                record.stages[name] = {
+                    "wall_seconds": round(wall, 6),
+                    "cpu_seconds": round(cpu, 6),
+                    "rss_bytes": _current_rss_bytes() or 0,
+                }
+
+    def observe_stage(self, name: str, wall_seconds: float, cpu_seconds: float):
+        with self._lock:
+            self._stage_wall.setdefault(name, _Summary(self.window)).observe(wall_seconds)
+            self._stage_cpu.setdefault(name, _Summary(self.window)).observe(cpu_seconds)
+
+    def observe_scan(self, record: ScanRecord):
+        """Fold per-scan values into the registry and log them."""
+        counter = f"scans_{record.values.get('status', 'ok')}_total"
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + 1
+            for name, value in record.values.items():
+                if isinstance(value, (int, float)) and name != "peak_rss_bytes":
+                    self._scan_values.setdefault(name, _Summary(self.window)).observe(float(value))
+        print(f"[metrics] {json.dumps(record.to_dict(), ensure_ascii=False)}")
+
+    def inc(self, name: str, value: float = 1):
+        """Increment a monotonic counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_gauges(self, name: str, source: Callable[[], Dict[str, float]]):
+        """
+        Register a callable whose values are exported as gauges on every scrape.
+
+        Args:
+            name: Gauge group name, used as metric name infix
+            source: Callable returning a mapping of gauge name to value
+        """
+        with self._lock:
+            self._gauge_sources[name] = source
+
+    def stage_quantile(self, name: str, q: float) -> Optional[float]:
+        """Return a wall-time quantile for a stage, or None if no samples."""
+        with self._lock:
+            summary = self._stage_wall.get(name)
+            if summary is None or not summary.samples:
+                return None
+            return _quantile(sorted(summary.samples), q)
+
+    def scan_value_mean(self, name: str) -> Optional[float]:
+        """Return the mean of a per-scan value (e.g. wall_seconds), or None if no samples."""
+        with self._lock:
+            summary = self._scan_values.get(name)
+            if summary is None or not summary.samples:
+                return None
+            return sum(summary.samples) / len(summary.samples)
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        p = self.prefix
+        lines: List[str] = []
+        with self._lock:
+            for metric, summaries, help_text in (
+                (f"{p}_stage_wall_seconds", self._stage_wall, "Wall time per pipeline stage"),
+                (f"{p}_stage_cpu_seconds", self._stage_cpu, "Process CPU time per pipeline stage"),
+            ):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} summary")
+                for stage_name, summary in sorted(summaries.items()):
+                    for q, v in summary.quantiles().items():
+                        lines.append(f'{metric}{{stage="{stage_name}",quantile="{q}"}} {v:.6f}')
+                    lines.append(f'{metric}_sum{{stage="{stage_name}"}} {summary.total:.6f}')
+                    lines.append(f'{metric}_count{{stage="{stage_name}"}} {summary.count}')
+
+            for name, summary in sorted(self._scan_values.items()):
+                metric = f"{p}_scan_{name}"
+                lines.append(f"# TYPE {metric} summary")
+                for q, v in summary.quantiles().items():
+                    lines.append(f'{metric}{{quantile="{q}"}} {v:.6f}')
+                lines.append(f"{metric}_sum {summary.total:.6f}")
+                lines.append(f"{metric}_count {summary.count}")
+
+            for name, value in sorted(self._counters.items()):
+                metric = f"{p}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+
+            gauge_sources = list(self._gauge_sources.items())
+
+        for group, source in gauge_sources:
+            try:
+                values = source()
+            except Exception as e:
+                print(f"[metrics] gauge source {group} failed: {e}")
+                continue
+            for name, value in sorted(values.items()):
+                metric = f"{p}_{group}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+
+        lines.append(f"# TYPE {p}_process_resident_memory_bytes gauge")
+        lines.append(f"{p}_process_resident_memory_bytes {_current_rss_bytes() or 0}")
+        lines.append(f"# TYPE {p}_process_peak_resident_memory_bytes gauge")
+        lines.append(f"{p}_process_peak_resident_memory_bytes {_peak_rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry: every PipelineProcessor reports here, /metrics reads from here
+metrics = PipelineMetrics()
@@ -3,6 +3,7 @@ Pipeline processor for in-memory data transfer between components.
 Handles the flow of data through the ML pipeline without external dependencies.
 """
 
+import copy
 import cv2
 import numpy as np
 from typing import Dict, List, Any, Tuple, Optional
@@ -12,13 +13,29 @@ from p2pala import predict_layout
 from ocr import OCRPredictor
 from ocr_page import process_page_file_with_ocr
 from text_concatenator import TextConcatenator
+from pipeline_metrics import PipelineMetrics, ScanRecord, metrics as pipeline_metrics
+from hashing import bytes_digest, file_digest
+from cancellation import CancelToken
+
+
+# Bump when the result structure changes so stale cache entries are not reused
+RESULT_CACHE_VERSION = "1"
 
 
 class PipelineProcessor:
     """Handles in-memory data processing through the ML pipeline."""
     
-    def __init__(self):
-        """Initialize the pipeline processor."""
+    layout_weights_path = "models/weights.pth"
+    
+    def __init__(self, metrics: Optional[PipelineMetrics] = None):
+        """
+        Initialize the pipeline processor.
+        
+        Args:
+            metrics: Metrics registry (defaults to the shared process-wide one)
+        """
+        self.metrics = metrics or pipeline_metrics
+        self._model_fingerprint: Optional[str] = None
         self.ocr_predictor = None
         self.text_concatenator = TextConcatenator()
         self._initialize_components()
@@ -32,7 +49,8 @@ class PipelineProcessor:
             print(f"Warning: Could not initialize OCR predictor: {e}")
             self.ocr_predictor = None
     
-    def process_scan(self, image_path: str, scan_id: str, storage_manager=None) -> Dict[str, Any]:
+    def process_scan(self, image_path: str, scan_id: str, storage_manager=None,
+                     cancel_token: Optional[CancelToken] = None) -> Dict[str, Any]:
         """
         Process a single scan through the complete pipeline.
         
@@ -40,50 +58,178 @@ class PipelineProcessor:
             image_path: Path to the input scan image
             scan_id: Unique identifier for the scan
             storage_manager: Local storage manager instance
+            cancel_token: Checked between stages; raises ScanCancelled when set
         
         Returns:
             Dictionary with processing results
         """
         print(f"Processing scan: {scan_id}")
         
-        # Step 1: Load and prepare image
-        image_data = self._load_and_prepare_image(image_path)
-        if image_data is None:
-            raise ValueError(f"Could not load image: {image_path}")
+        cache_key = self._result_cache_key(image_path, storage_manager)
+        
+        with self.metrics.scan(scan_id) as record:
+            if cache_key is not None:
+                cached_result = storage_manager.load_cached_result(cache_key)
+                record.set("cache_hit", int(cached_result is not None))
+                if cached_result is not None:
+                    self.metrics.inc("result_cache_hits_total")
+                    print(f"Result cache hit for {scan_id}")
+                    with self.metrics.stage("rebind", record):
+                        return self._rebind_cached_result(cached_result, scan_id, image_path, storage_manager)
+                self.metrics.inc("result_cache_misses_total")
+            
+            # Step 1: Load and prepare image
+            with self.metrics.stage("load", record):
+                image_data = self._load_and_prepare_image(image_path)
+            if image_data is None:
+                raise ValueError(f"Could not load image: {image_path}")
+            
+            # Step 2: Layout detection
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled("layout")
+            print("Detecting layout...")
+            with self.metrics.stage("layout", record):
+                layout_data = self._detect_layout(image_data, image_path)
+            
+                # Save layout XML to local storage
+                if storage_manager:
+                    layout_xml_path = storage_manager.save_xml_intermediate(layout_data, scan_id, "layout")
+                    print(f"Layout XML saved to: {layout_xml_path}")
+            
+            # Step 3: Extract text regions
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled("extract")
+            print("Extracting text regions...")
+            with self.metrics.stage("extract", record):
+                try:
+                    text_regions = self._extract_text_regions(image_data, layout_data, scan_id, storage_manager)
+                finally:
+                    if storage_manager and hasattr(storage_manager, 'finalize_crops'):
+                        storage_manager.finalize_crops(scan_id)
+            record.set("regions", len(text_regions))
+            record.set("lines", sum(len(region['text_lines']) for region in text_regions))
+            
+            # Step 4: OCR processing
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled("ocr")
+            print("Processing OCR...")
+            with self.metrics.stage("ocr", record):
+                ocr_results = self._process_ocr(text_regions, record)
+            
+                # Save OCR XML to local storage
+                if storage_manager:
+                    # Create OCR XML from results
+                    ocr_xml = self._create_ocr_xml(ocr_results, scan_id)
+                    ocr_xml_path = storage_manager.save_xml_intermediate(ocr_xml, scan_id, "ocr")
+                    print(f"OCR XML saved to: {ocr_xml_path}")
+            
+            # Step 5: Text concatenation and line break handling
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled("concatenate")
+            print("Processing text concatenation...")
+            with self.metrics.stage("concatenate", record):
+                concatenated_result = self.text_concatenator.create_concatenated_json(ocr_results, scan_id)
+            
+            # Step 6: Combine results
+            print("Combining results...")
+            with self.metrics.stage("combine", record):
+                final_result = self._combine_results(scan_id, image_path, ocr_results, concatenated_result)
+        
+        # результат с упавшим OCR (пустой текст) не кэшируем — иначе он вернётся и при повторе
+        if cache_key is not None and not record.values.get("ocr_failed"):
+            storage_manager.save_cached_result(cache_key, final_result)
         
-        # Step 2: Layout detection
-        print("Detecting layout...")
-        layout_data = self._detect_layout(image_data, image_path)
+        return final_result
+    
+    def _get_model_fingerprint(self) -> Optional[str]:
+        """
+        Combined hash of layout weights and OCR checkpoint.
+        
+        Returns:
+            Fingerprint or None if the models are not available
+        """
+        if self._model_fingerprint is None:
+            if self.ocr_predictor is None:
+                return None
+            try:
+                layout_hash = file_digest(self.layout_weights_path)
+                ocr_hash = file_digest(self.ocr_predictor.checkpoint_path)
+            except OSError as e:
+                print(f"Warning: Could not fingerprint models, result cache disabled: {e}")
+                return None
+            self._model_fingerprint = bytes_digest(
+                f"{RESULT_CACHE_VERSION}:{layout_hash}:{ocr_hash}".encode('utf-8')
+            )
+        return self._model_fingerprint
+    
+    def _result_cache_key(self, image_path: str, storage_manager) -> Optional[str]:
+        """
+        Build the result cache key for a scan.
         
-        # Save layout XML to local storage
-        if storage_manager:
-            layout_xml_path = storage_manager.save_xml_intermediate(layout_data, scan_id, "layout")
-            print(f"Layout XML saved to: {layout_xml_path}")
+        Args:
+            image_path: Path to the input scan image
+            storage_manager: Local storage manager instance
         
-        # Step 3: Extract text regions
-        print("Extracting text regions...")
-        text_regions = self._extract_text_regions(image_data, layout_data, scan_id, storage_manager)
+        Returns:
+            Cache key or None if caching is not possible
+        """
+        if storage_manager is None or not hasattr(storage_manager, 'result_cache_key'):
+            return None
+        fingerprint = self._get_model_fingerprint()
+        if fingerprint is None:
+            return None
+        try:
+            return storage_manager.result_cache_key(image_path, fingerprint)
+        except OSError:
+            return None
+    
+    def _rebind_cached_result(self, cached_result: Dict[str, Any], scan_id: str, image_path: str,
+                              storage_manager) -> Dict[str, Any]:
+        """
+        Rewrite a cached result for a new scan.
+        Line crops are cut again from the new image by the cached crop
+        coordinates, so the result only references files of the new scan.
         
-        # Step 4: OCR processing
-        print("Processing OCR...")
-        ocr_results = self._process_ocr(text_regions)
+        Args:
+            cached_result: Result produced for an identical scan
+            scan_id: Unique identifier for the new scan
+            image_path: Path to the new input scan image
+            storage_manager: Local storage manager instance
         
-        # Save OCR XML to local storage
-        if storage_manager:
-            # Create OCR XML from results
-            ocr_xml = self._create_ocr_xml(ocr_results, scan_id)
-            ocr_xml_path = storage_manager.save_xml_intermediate(ocr_xml, scan_id, "ocr")
-            print(f"OCR XML saved to: {ocr_xml_path}")
+        Returns:
+            Result with scan identity and paths of the new scan
+        """
+        image = self._load_and_prepare_image(image_path)
+        if image is None:
+            raise ValueError(f"Could not load image: {image_path}")
         
-        # Step 5: Text concatenation and line break handling
-        print("Processing text concatenation...")
-        concatenated_result = self.text_concatenator.create_concatenated_json(ocr_results, scan_id)
+        result = copy.deepcopy(cached_result)
+        scan = result.setdefault("scan", {})
+        scan["id"] = scan_id
+        scan["image_path"] = image_path
+        scan["local_path"] = f"local_storage/input_scans/{scan_id}.jpg"
+        scan["processing_timestamp"] = self._get_timestamp()
         
-        # Step 6: Combine results
-        print("Combining results...")
-        final_result = self._combine_results(scan_id, image_path, ocr_results, concatenated_result)
+        try:
+            for region_idx, region in enumerate(result.get("regions", [])):
+                for line_idx, line in enumerate(region.get("lines", [])):
+                    cropped_image = line.get("cropped_image")
+                    if cropped_image is None:
+                        continue
+                    crop = line.get("coordinates", {}).get("crop", {})
+                    if crop.get("width", 0) > 0 and crop.get("height", 0) > 0:
+                        crop_img = image[crop["min_y"]:crop["max_y"], crop["min_x"]:crop["max_x"]]
+                    else:
+                        # строка без координат — кропом была вся страница
+                        crop_img = image
+                    cropped_image["path"] = storage_manager.save_cropped_image(
+                        crop_img, scan_id, f"{region_idx:03d}_{line_idx:03d}"
+                    )
+        finally:
+            if hasattr(storage_manager, 'finalize_crops'):
+                storage_manager.finalize_crops(scan_id)
         
-        return final_result
+        return result
     
     def _load_and_prepare_image(self, image_path: str) -> Optional[np.ndarray]:
         """
@@ -121,7 +267,7 @@ class PipelineProcessor:
         """
         try:
             image_basenames_to_images = OrderedDict({image_path: image})
-            layout_result = predict_layout(image_basenames_to_images)
+            layout_result = predict_layout(image_basenames_to_images, weights_path=self.layout_weights_path)
             # predict_layout returns a dict, we need the XML string for the image
             return layout_result[image_path]
         except Exception as e:
@@ -248,12 +394,13 @@ class PipelineProcessor:
         
         return image[min_y:max_y, min_x:max_x], crop_coords
     
-    def _process_ocr(self, text_regions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _process_ocr(self, text_regions: List[Dict[str, Any]], record: Optional[ScanRecord] = None) -> List[Dict[str, Any]]:
         """
         Process OCR on text regions.
         
         Args:
             text_regions: List of text region data
+            record: Scan metrics record to report decoded tokens to
         
         Returns:
             List of processed text regions with OCR results
@@ -274,6 +421,8 @@ class PipelineProcessor:
                             
                             # Run OCR
                             texts, confidences = self.ocr_predictor.predict([gray_img])
+                            if record is not None:
+                                record.add("ocr_tokens", getattr(self.ocr_predictor, 'last_decoded_tokens', 0))
                             
                             if texts and confidences:
                                 # Очищаем дублированный текст
@@ -293,6 +442,8 @@ class PipelineProcessor:
             return text_regions
         except Exception as e:
             print(f"Error in OCR processing: {e}")
+            if record is not None:
+                record.set("ocr_failed", 1)
             return text_regions
     
     def _clean_duplicated_text(self, text: str) -> str:
@@ -0,0 +1,52 @@
+"""
+RabbitMQ consumer for the ML pipeline.
+Each replica pulls per-scan messages from a shared queue one at a time
+(prefetch=1) and acks a message only after its result is written and the
+backend has applied the status callback, so an idle replica takes the next scan
+and a crashed one hands its scan back to the queue. A redelivered scan is
+served from the result cache and only repeats the callback.
+"""
+
+import os
+from typing import Callable
+
+import dramatiq
+from dramatiq import Worker
+from dramatiq.brokers.rabbitmq import RabbitmqBroker
+
+
+# Must match the message the backend enqueues (src/tasks/ml_tasks.py)
+SCAN_QUEUE = os.getenv("ML_SCAN_QUEUE", "ml_scans")
+SCAN_ACTOR = "process_scan"
+
+# OCR одной страницы может идти долго — лимит dramatiq по умолчанию (10 минут) мал
+SCAN_TIME_LIMIT_MS = int(os.getenv("ML_SCAN_TIME_LIMIT_MS", str(60 * 60 * 1000)))
+
+
+def start_scan_consumer(amqp_url: str, handle_scan: Callable[[str, str, str, str, int], None]) -> Worker:
+    """
+    Start consuming scan messages in background threads.
+
+    Args:
+        amqp_url: RabbitMQ URL (same broker as the backend)
+        handle_scan: Callable(group_uuid, source, dst, callback, index) processing one
+            image; it must raise on failure so the message is retried
+
+    Returns:
+        Running dramatiq worker (call stop() on shutdown)
+    """
+    broker = RabbitmqBroker(url=amqp_url)
+    dramatiq.set_broker(broker)
+
+    @dramatiq.actor(actor_name=SCAN_ACTOR, queue_name=SCAN_QUEUE, broker=broker,
+                    max_retries=3, min_backoff=5000, max_backoff=60000,
+                    time_limit=SCAN_TIME_LIMIT_MS)
+    def process_scan(group_uuid: str, source: str, dst: str, callback: str = "", index: int = 0):
+        handle_scan(group_uuid, source, dst, callback, index)
+
+    # один скан за раз: не забираем из очереди больше, чем можем обработать
+    worker = Worker(broker, queues={SCAN_QUEUE}, worker_threads=1)
+    worker.queue_prefetch = 1
+    worker.start()
+    print(f"[queue] consuming {SCAN_QUEUE} with prefetch=1")
+    return worker
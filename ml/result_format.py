@@ -0,0 +1,120 @@
+"""
+Result file formats.
+v1 is the verbose structure built by PipelineProcessor._combine_results.
+v2 is an opt-in compact form of the same data: crop boxes are stored once
+per line as integer arrays, derived fields (indices, file names, region
+bounding box details, the cropped_images list) are dropped, and the file is
+written without indentation. Readers detect v2 by "format_version": 2.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library
+    orjson = None
+
+
+FORMAT_V1 = "v1"
+FORMAT_V2 = "v2"
+V2_VERSION = 2
+
+
+def configured_format() -> str:
+    """Result format selected by ML_RESULT_FORMAT (v1 by default)."""
+    value = os.getenv("ML_RESULT_FORMAT", FORMAT_V1).strip().lower()
+    return FORMAT_V2 if value in (FORMAT_V2, "2", "compact") else FORMAT_V1
+
+
+def result_version(data: Dict[str, Any]) -> int:
+    """Schema version of a result document (1 if not marked)."""
+    return int(data.get("format_version", 1)) if isinstance(data, dict) else 1
+
+
+def _polygon(coords: Any) -> Any:
+    """"x1,y1 x2,y2 ..." -> [x1, y1, x2, y2, ...]; anything else is kept as is."""
+    if not isinstance(coords, str):
+        return coords
+    flat: List[int] = []
+    for pair in coords.split():
+        if ',' in pair:
+            x, y = pair.split(',', 1)
+            flat.extend((int(round(float(x))), int(round(float(y)))))
+    return flat
+
+
+def _box(coords: Dict[str, Any]) -> Optional[List[int]]:
+    """Crop/region dict -> [min_x, min_y, max_x, max_y, padding], None if empty."""
+    if not coords:
+        return None
+    return [int(coords.get("min_x", 0)), int(coords.get("min_y", 0)),
+            int(coords.get("max_x", 0)), int(coords.get("max_y", 0)),
+            int(coords.get("padding", 0))]
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a v1 result to the compact v2 structure.
+
+    Args:
+        result: Result as produced by PipelineProcessor.process_scan
+
+    Returns:
+        v2 result document
+    """
+    if result_version(result) == V2_VERSION:
+        return result
+
+    regions = []
+    for region in result.get("regions", []):
+        lines = []
+        for line in region.get("lines", []):
+            coordinates = line.get("coordinates", {})
+            crop = coordinates.get("crop", {})
+            # у строки без кропа в v1 все поля crop нулевые, а в cropped_images её нет
+            has_crop = any(crop.get(k) for k in ("min_x", "max_x", "min_y", "max_y", "width", "height"))
+            lines.append({
+                "id": line.get("id"),
+                "text": line.get("text", ""),
+                "confidence": line.get("confidence", 0.0),
+                "polygon": _polygon(coordinates.get("original", "")),
+                "crop": _box(crop) if has_crop else None,
+                "image": line.get("cropped_image", {}).get("path", ""),
+            })
+
+        compact_region = {k: v for k, v in region.items()
+                          if k not in ("index", "coordinates", "statistics", "lines")}
+        statistics = dict(region.get("statistics", {}))
+        statistics.pop("total_lines", None)
+        compact_region.update({
+            "bbox": _box(region.get("coordinates", {})),
+            "statistics": statistics,
+            "lines": lines,
+        })
+        regions.append(compact_region)
+
+    compact = {k: v for k, v in result.items() if k not in ("regions", "cropped_images")}
+    compact["format_version"] = V2_VERSION
+    compact["regions"] = regions
+    return compact
+
+
+def dumps_result(result: Dict[str, Any], fmt: str = FORMAT_V1) -> bytes:
+    """
+    Serialize a result for the destination directory.
+
+    Args:
+        result: v1 result
+        fmt: FORMAT_V1 (indented JSON, as before) or FORMAT_V2 (compact)
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    if fmt != FORMAT_V2:
+        return json.dumps(result, ensure_ascii=False, indent=2).encode('utf-8')
+    compact = compact_result(result)
+    if orjson is not None:
+        return orjson.dumps(compact, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(compact, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
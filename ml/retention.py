@@ -0,0 +1,120 @@
+"""
+Retention for the ML pipeline local storage.
+Evicts whole scans (input scan, crops, XML intermediates, results, logs)
+by age and, above a size cap, in least recently used order.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from storage_manager import LocalStorageManager
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    max_bytes: int = 0              # 0 — без ограничения по размеру
+    max_age_seconds: float = 0      # 0 — без ограничения по возрасту
+    interval_seconds: float = 60
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """Policy configured by ML_STORAGE_MAX_BYTES / ML_STORAGE_MAX_AGE_SECONDS / ML_STORAGE_RETENTION_INTERVAL."""
+        return cls(
+            max_bytes=int(os.getenv("ML_STORAGE_MAX_BYTES", "0")),
+            max_age_seconds=float(os.getenv("ML_STORAGE_MAX_AGE_SECONDS", "0")),
+            interval_seconds=float(os.getenv("ML_STORAGE_RETENTION_INTERVAL", "60")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self.max_age_seconds > 0
+
+
+class StorageRetention:
+    """Background worker that applies a RetentionPolicy to a LocalStorageManager."""
+
+    def __init__(self, storage_manager: LocalStorageManager, policy: Optional[RetentionPolicy] = None):
+        """
+        Initialize retention worker.
+
+        Args:
+            storage_manager: Local storage manager to evict from
+            policy: Retention policy (defaults to the one configured by environment)
+        """
+        self.storage_manager = storage_manager
+        self.policy = policy or RetentionPolicy.from_env()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.evicted_scans = 0
+        self.freed_bytes = 0
+
+    def start(self):
+        """Start the background thread (no-op if the policy is disabled)."""
+        if not self.policy.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="storage-retention", daemon=True)
+        self._thread.start()
+        print(f"[retention] started: max_bytes={self.policy.max_bytes} "
+              f"max_age_seconds={self.policy.max_age_seconds}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_once(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Apply the policy once.
+
+        Args:
+            now: Current unix time (for tests)
+
+        Returns:
+            Dictionary with evicted scan count and freed bytes
+        """
+        now = time.time() if now is None else now
+
+        evicted = 0
+        freed = 0
+        scans = self.storage_manager.get_scan_usage()  # least recently used first
+        total = sum(scan["bytes"] for scan in scans)
+
+        for scan in scans:
+            too_old = (self.policy.max_age_seconds > 0
+                       and now - scan["last_used"] > self.policy.max_age_seconds)
+            too_big = self.policy.max_bytes > 0 and total > self.policy.max_bytes
+            if not too_old and not too_big:
+                # дальше только более свежие сканы
+                break
+            if self.storage_manager.is_scan_in_use(scan["scan_id"]):
+                continue
+            released = self.storage_manager.cleanup_scan(scan["scan_id"])
+            total -= scan["bytes"]
+            freed += released
+            evicted += 1
+
+        self.evicted_scans += evicted
+        self.freed_bytes += freed
+        if evicted:
+            print(f"[retention] evicted {evicted} scans, freed {freed} bytes, usage {max(total, 0)} bytes")
+        return {"evicted_scans": evicted, "freed_bytes": freed}
+
+    def stats(self) -> Dict[str, float]:
+        """Retention counters and current usage for /metrics."""
+        return {
+            "usage_bytes": self.storage_manager.get_usage_bytes(),
+            "max_bytes": self.policy.max_bytes,
+            "evicted_scans_total": self.evicted_scans,
+            "freed_bytes_total": self.freed_bytes,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.policy.interval_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[retention] failed: {e}")
@@ -0,0 +1,228 @@
+"""
+Fair scheduling of scans across groups.
+Pending scans are kept per group and served round-robin, so a single-page
+upload is not stuck behind a 2,000-page archive. Groups with only a few scans
+go through a priority lane. Queue positions are exposed for ETA estimates.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Set
+
+
+DEFAULT_SMALL_GROUP_MAX = 3
+
+
+@dataclass
+class ScanJob:
+    group_uuid: str
+    image_path: str
+    scan_id: str
+    dst: str
+    callback_url: str
+    submitted_at: float = field(default_factory=time.time)
+
+
+class _GroupQueue:
+    """Pending scans of one group plus the size of its current batch."""
+
+    def __init__(self):
+        self.pending: Deque[ScanJob] = deque()
+        self.batch_size = 0      # сканов с момента, когда группа стала активной
+        self.in_progress = 0
+
+
+class FairScanScheduler:
+    """Thread-safe round-robin scan queue with a priority lane for small groups."""
+
+    def __init__(self, small_group_max: Optional[int] = None):
+        """
+        Initialize scheduler.
+
+        Args:
+            small_group_max: Groups whose current batch has at most this many scans
+                are served before larger ones (0 disables the priority lane;
+                defaults to ML_SMALL_GROUP_MAX)
+        """
+        if small_group_max is None:
+            small_group_max = int(os.getenv("ML_SMALL_GROUP_MAX", DEFAULT_SMALL_GROUP_MAX))
+        self.small_group_max = small_group_max
+
+        # порядок ключей — очередь обхода round-robin
+        self._groups: "OrderedDict[str, _GroupQueue]" = OrderedDict()
+        self._queued_paths: Set[str] = set()
+        # scan_id стабилен для пути, пока скан в очереди или в работе; записи уходят вместе со сканом
+        # и группой, нумерация новой партии группы начинается заново — как в режиме каталога
+        self._scan_ids: Dict[str, str] = {}
+        self._next_index: Dict[str, int] = {}
+        self._cond = threading.Condition()
+
+    def submit(self, group_uuid: str, image_path: str, dst: str, callback_url: str) -> bool:
+        """
+        Add a scan to its group's queue.
+
+        Args:
+            group_uuid: Group the scan belongs to
+            image_path: Path to the source image
+            dst: Destination directory for the result JSON
+            callback_url: Backend callback URL
+
+        Returns:
+            False if the same image is already queued or being processed
+        """
+        with self._cond:
+            if image_path in self._queued_paths:
+                return False
+            group = self._groups.get(group_uuid)
+            if group is None:
+                group = self._groups[group_uuid] = _GroupQueue()
+            group.batch_size += 1
+            group.pending.append(ScanJob(group_uuid, image_path, self._scan_id(group_uuid, image_path),
+                                         dst, callback_url))
+            self._queued_paths.add(image_path)
+            self._cond.notify()
+            return True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[ScanJob]:
+        """
+        Take the next scan, blocking until one is available.
+
+        Args:
+            timeout: Seconds to wait, None to wait forever
+
+        Returns:
+            Next scan or None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(self._has_pending, timeout=timeout):
+                return None
+            group_uuid = self._pick_group(self._groups)
+            group = self._groups[group_uuid]
+            job = group.pending.popleft()
+            group.in_progress += 1
+            # группа уходит в конец круга
+            self._groups.move_to_end(group_uuid)
+            return job
+
+    def task_done(self, job: ScanJob):
+        """Mark a scan taken with get() as finished (successfully or not)."""
+        with self._cond:
+            self._queued_paths.discard(job.image_path)
+            self._scan_ids.pop(job.image_path, None)
+            group = self._groups.get(job.group_uuid)
+            if group is None:
+                return
+            group.in_progress -= 1
+            if not group.pending and group.in_progress <= 0:
+                # партия закончилась: следующая загрузка снова может попасть в быструю полосу
+                self._forget_group(job.group_uuid)
+
+    def cancel_group(self, group_uuid: str) -> int:
+        """
+        Drop a group's pending scans (scans already taken by workers are
+        stopped by their cancel token).
+
+        Args:
+            group_uuid: Group to cancel
+
+        Returns:
+            Number of dropped scans
+        """
+        with self._cond:
+            group = self._groups.get(group_uuid)
+            if group is None:
+                return 0
+            dropped = len(group.pending)
+            for job in group.pending:
+                self._queued_paths.discard(job.image_path)
+                self._scan_ids.pop(job.image_path, None)
+            group.pending.clear()
+            if group.in_progress <= 0:
+                self._forget_group(group_uuid)
+            return dropped
+
+    def queue_position(self, group_uuid: str) -> Dict[str, Any]:
+        """
+        Where a group's scans are in the current schedule.
+
+        Args:
+            group_uuid: Group to look up
+
+        Returns:
+            Dictionary with pending/in-progress counts, the number of scans
+            served before the group's next and last scan, and total queue size
+        """
+        with self._cond:
+            order = self._simulate_order()
+            group = self._groups.get(group_uuid)
+            in_progress = group.in_progress if group else 0
+            busy = sum(g.in_progress for g in self._groups.values())
+
+        positions = [i for i, job in enumerate(order) if job.group_uuid == group_uuid]
+        return {
+            "group_uuid": group_uuid,
+            "pending": len(positions),
+            "in_progress": in_progress,
+            "scans_ahead": positions[0] if positions else None,
+            "scans_before_last": positions[-1] if positions else None,
+            "queue_size": len(order),
+            "busy": busy,
+        }
+
+    def stats(self) -> Dict[str, float]:
+        """Queue gauges for /metrics."""
+        with self._cond:
+            return {
+                "pending": sum(len(g.pending) for g in self._groups.values()),
+                "in_progress": sum(g.in_progress for g in self._groups.values()),
+                "active_groups": sum(1 for g in self._groups.values() if g.pending),
+            }
+
+    def _scan_id(self, group_uuid: str, image_path: str) -> str:
+        """Per-group numbered scan id, as produced by the directory mode (caller holds the lock)."""
+        scan_id = self._scan_ids.get(image_path)
+        if scan_id is None:
+            n = self._next_index.get(group_uuid, 0)
+            self._next_index[group_uuid] = n + 1
+            scan_id = self._scan_ids[image_path] = f"{Path(image_path).stem}_{n:03d}"
+        return scan_id
+
+    def _forget_group(self, group_uuid: str):
+        """Drop a finished or cancelled group with its scan numbering (caller holds the lock)."""
+        self._groups.pop(group_uuid, None)
+        self._next_index.pop(group_uuid, None)
+
+    def _has_pending(self) -> bool:
+        return any(g.pending for g in self._groups.values())
+
+    def _pick_group(self, groups: "OrderedDict[str, Any]") -> str:
+        """First group with pending scans in round-robin order, small batches first (caller holds the lock)."""
+        first = None
+        for group_uuid, group in groups.items():
+            if not group.pending:
+                continue
+            if self.small_group_max > 0 and group.batch_size <= self.small_group_max:
+                return group_uuid
+            if first is None:
+                first = group_uuid
+        return first
+
+    def _simulate_order(self) -> List[ScanJob]:
+        """Order in which the currently pending scans would be served (caller holds the lock)."""
+        shadow: "OrderedDict[str, _GroupQueue]" = OrderedDict()
+        for group_uuid, group in self._groups.items():
+            copy = _GroupQueue()
+            copy.pending = deque(group.pending)
+            copy.batch_size = group.batch_size
+            shadow[group_uuid] = copy
+
+        order: List[ScanJob] = []
+        while any(g.pending for g in shadow.values()):
+            group_uuid = self._pick_group(shadow)
+            order.append(shadow[group_uuid].pending.popleft())
+            shadow.move_to_end(group_uuid)
+        return order
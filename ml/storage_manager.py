@@ -4,23 +4,92 @@ Handles storage of input scans, cropped images, and final JSON results.
 """
 
 import os
+import fcntl
 import json
+import mmap
 import shutil
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
 import cv2
 import numpy as np
 
+from hashing import file_digest
+
+
+DEFAULT_RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Crop pack: magic | JPEG blobs... | JSON index {region_id: [offset, length]} | footer
+PACK_MAGIC = b"CPK1"
+PACK_FOOTER = struct.Struct("<QI4s")  # index offset, index length, magic
+PACK_SUFFIX = ".pack"
+
+# Один том local_storage на несколько реплик: у каждой своя папка replica-N
+REPLICA_PREFIX = "replica-"
+REPLICA_LOCK = ".replica.lock"
+# Что лежало в корне local_storage до разделения по репликам
+LEGACY_ENTRIES = ("input_scans", "cropped_images", "results", "xml_intermediate", "logs",
+                  "result_cache", ".storage_index.json")
+_replica_locks: List[int] = []
+
+
+def claim_replica_storage(root: str, max_replicas: int = 64) -> Path:
+    """
+    Claim a per-replica storage directory under a shared volume.
+
+    Replicas that mount the same volume must not share the storage index,
+    retention pins, result cache or pack files, so every process takes the
+    first free ``replica-N`` directory, locked with flock for its lifetime.
+    The lock is released by the OS when the process exits, so a restarted
+    replica takes its old directory (and cache) back.
+
+    Args:
+        root: Shared storage root (the mounted volume)
+        max_replicas: Number of slots to try
+
+    Returns:
+        Path of the claimed directory
+    """
+    root_path = Path(root)
+    root_path.mkdir(parents=True, exist_ok=True)
+    for slot in range(max_replicas):
+        slot_path = root_path / f"{REPLICA_PREFIX}{slot}"
+        created = not slot_path.exists()
+        slot_path.mkdir(exist_ok=True)
+        fd = os.open(slot_path / REPLICA_LOCK, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        # fd не закрываем: блокировка держится до конца процесса
+        _replica_locks.append(fd)
+        if slot == 0 and created:
+            # хранилище единственной реплики из старой раскладки переезжает в replica-0
+            for name in LEGACY_ENTRIES:
+                if (root_path / name).exists():
+                    os.replace(root_path / name, slot_path / name)
+        return slot_path
+    raise RuntimeError(f"No free storage slot in {root} (all {max_replicas} are in use)")
+
 
 class LocalStorageManager:
     """Manages local file storage for the ML pipeline."""
     
-    def __init__(self, base_path: str = "./local_storage"):
+    def __init__(self, base_path: str = "./local_storage", result_cache_max_bytes: Optional[int] = None,
+                 crop_storage: Optional[str] = None):
         """
         Initialize local storage manager.
         
         Args:
             base_path: Base directory for local storage
+            result_cache_max_bytes: Size cap of the result cache (0 disables it)
+            crop_storage: "files" (one JPEG per line) or "pack" (one pack file per scan)
         """
         self.base_path = Path(base_path)
         self.input_scans_path = self.base_path / "input_scans"
@@ -28,6 +97,38 @@ class LocalStorageManager:
         self.results_path = self.base_path / "results"
         self.xml_intermediate_path = self.base_path / "xml_intermediate"
         self.logs_path = self.base_path / "logs"
+        self.result_cache_path = self.base_path / "result_cache"
+        
+        if result_cache_max_bytes is None:
+            result_cache_max_bytes = int(os.getenv("ML_RESULT_CACHE_MAX_BYTES", DEFAULT_RESULT_CACHE_MAX_BYTES))
+        self.result_cache_max_bytes = result_cache_max_bytes
+        
+        self.crop_storage = crop_storage or os.getenv("ML_CROP_STORAGE", "files")
+        if self.crop_storage not in ("files", "pack"):
+            raise ValueError(f"Unknown crop storage: {self.crop_storage}")
+        # Pack files being written: scan_id -> {"file", "index", "offset", "previous_size"}
+        self._open_packs: Dict[str, Dict[str, Any]] = {}
+        self._pack_lock = threading.Lock()
+        # Parsed indexes of finished packs: path -> ((mtime_ns, size), index)
+        self._pack_indexes: OrderedDict = OrderedDict()
+        
+        # LRU index of the result cache: key -> size in bytes (oldest first)
+        self._result_cache_index: Optional[OrderedDict] = None
+        self._result_cache_lock = threading.Lock()
+        self._result_cache_hits = 0
+        self._result_cache_misses = 0
+        
+        # Storage accounting, persisted in index_path and updated on every save/cleanup:
+        # - per-category file counts and bytes (get_storage_info)
+        # - per-scan bytes and last use, least recently used first (retention)
+        self.index_path = self.base_path / ".storage_index.json"
+        self.index_flush_interval = 5.0
+        self._categories: Optional[Dict[str, Dict[str, int]]] = None
+        self._scan_usage: Optional[OrderedDict] = None
+        self._usage_lock = threading.RLock()
+        self._index_dirty = False
+        self._index_flushed_at = 0.0
+        self._pinned_scans: Dict[str, int] = {}
         
         # Create directories if they don't exist
         self._create_directories()
@@ -39,7 +140,8 @@ class LocalStorageManager:
             self.cropped_images_path,
             self.results_path,
             self.xml_intermediate_path,
-            self.logs_path
+            self.logs_path,
+            self.result_cache_path
         ]
         
         for directory in directories:
@@ -62,13 +164,17 @@ class LocalStorageManager:
         destination = self.input_scans_path / filename
         
         # Copy image to local storage
+        previous_size = self._size_before_write(destination)
         shutil.copy2(image_path, destination)
+        self._track_write(scan_id, destination, previous_size)
         
         return str(destination)
     
     def save_cropped_image(self, image: np.ndarray, scan_id: str, region_id: str) -> str:
         """
         Save cropped image to local storage.
+        In pack mode the crop is appended to the scan's pack file;
+        call finalize_crops() once all crops of the scan are saved.
         
         Args:
             image: Cropped image as numpy array
@@ -76,19 +182,92 @@ class LocalStorageManager:
             region_id: Unique identifier for the region
             
         Returns:
-            Path to saved cropped image
+            Path to saved cropped image ("<pack>#<region_id>" in pack mode)
         """
-        # Ensure IDs are properly formatted
-        scan_id = scan_id.replace(' ', '_').lower()
-        region_id = region_id.replace(' ', '_').lower()
-        filename = f"{scan_id}_region_{region_id}.jpg"
-        destination = self.cropped_images_path / filename
+        if self.crop_storage == "pack":
+            return self._append_to_pack(image, scan_id, region_id)
+        
+        destination = self.cropped_image_path(scan_id, region_id)
         
         # Save image
+        previous_size = self._size_before_write(destination)
         cv2.imwrite(str(destination), image)
+        self._track_write(scan_id, destination, previous_size)
+        
+        return str(destination)
+    
+    def cropped_image_ref(self, scan_id: str, region_id: str) -> str:
+        """
+        Build the reference of a cropped image as returned by save_cropped_image.
+        
+        Args:
+            scan_id: Unique identifier for the scan
+            region_id: Unique identifier for the region
+            
+        Returns:
+            File path, or "<pack>#<region_id>" in pack mode
+        """
+        if self.crop_storage == "pack":
+            return f"{self.crop_pack_path(scan_id)}#{self._normalize_region_id(region_id)}"
+        return str(self.cropped_image_path(scan_id, region_id))
+    
+    def crop_pack_path(self, scan_id: str) -> Path:
+        """
+        Build the storage path of a scan's crop pack.
+        
+        Args:
+            scan_id: Unique identifier for the scan
+            
+        Returns:
+            Path of the pack file
+        """
+        return self.cropped_images_path / f"{self._normalize_scan_id(scan_id)}{PACK_SUFFIX}"
+    
+    def finalize_crops(self, scan_id: str) -> Optional[str]:
+        """
+        Finish the scan's crop pack: write its index and footer.
+        No-op in files mode or when nothing was packed.
         
+        Args:
+            scan_id: Unique identifier for the scan
+            
+        Returns:
+            Path to the pack file or None
+        """
+        scan_id = self._normalize_scan_id(scan_id)
+        with self._pack_lock:
+            pack = self._open_packs.pop(scan_id, None)
+        if pack is None:
+            return None
+        
+        f = pack["file"]
+        try:
+            index_bytes = json.dumps(pack["index"]).encode('utf-8')
+            f.write(index_bytes)
+            f.write(PACK_FOOTER.pack(pack["offset"], len(index_bytes), PACK_MAGIC))
+        finally:
+            f.close()
+        
+        destination = self.crop_pack_path(scan_id)
+        self._track_write(scan_id, destination, pack["previous_size"])
         return str(destination)
     
+    def cropped_image_path(self, scan_id: str, region_id: str) -> Path:
+        """
+        Build the storage path of a cropped image.
+        
+        Args:
+            scan_id: Unique identifier for the scan
+            region_id: Unique identifier for the region
+            
+        Returns:
+            Path of the cropped image
+        """
+        # Ensure IDs are properly formatted
+        scan_id = self._normalize_scan_id(scan_id)
+        region_id = self._normalize_region_id(region_id)
+        return self.cropped_images_path / f"{scan_id}_region_{region_id}.jpg"
+    
     def save_xml_intermediate(self, xml_content: str, scan_id: str, stage: str) -> str:
         """
         Save XML intermediate result to local storage.
@@ -106,11 +285,13 @@ class LocalStorageManager:
         filename = f"{scan_id}_{stage}.xml"
         destination = self.xml_intermediate_path / filename
         
+        previous_size = self._size_before_write(destination)
         with open(destination, 'w', encoding='utf-8') as f:
             if isinstance(xml_content, bytes):
                 f.write(xml_content.decode('utf-8'))
             else:
                 f.write(xml_content)
+        self._track_write(scan_id, destination, previous_size)
         
         return str(destination)
     
@@ -128,8 +309,10 @@ class LocalStorageManager:
         filename = f"{scan_id}_result.json"
         destination = self.results_path / filename
         
+        previous_size = self._size_before_write(destination)
         with open(destination, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        self._track_write(scan_id, destination, previous_size)
         
         return str(destination)
     
@@ -149,6 +332,7 @@ class LocalStorageManager:
         if not source.exists():
             return None
         
+        self._touch(scan_id)
         return cv2.imread(str(source))
     
     def load_cropped_image(self, scan_id: str, region_id: str) -> Optional[np.ndarray]:
@@ -162,12 +346,20 @@ class LocalStorageManager:
         Returns:
             Loaded image as numpy array or None if not found
         """
-        filename = f"{scan_id}_{region_id}.jpg"
-        source = self.cropped_images_path / filename
+        pack_path = self.crop_pack_path(scan_id)
+        if pack_path.exists():
+            data = self._read_from_pack(pack_path, self._normalize_region_id(region_id))
+            if data is None:
+                return None
+            self._touch(scan_id)
+            return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        
+        source = self.cropped_image_path(scan_id, region_id)
         
         if not source.exists():
             return None
         
+        self._touch(scan_id)
         return cv2.imread(str(source))
     
     def load_xml_intermediate(self, scan_id: str, stage: str) -> Optional[str]:
@@ -219,32 +411,60 @@ class LocalStorageManager:
         scan_files = list(self.input_scans_path.glob("*.jpg"))
         return [f.stem for f in scan_files]
     
-    def cleanup_scan(self, scan_id: str):
+    def cleanup_scan(self, scan_id: str) -> int:
         """
         Clean up all files related to a specific scan.
         
         Args:
             scan_id: Unique identifier for the scan
+            
+        Returns:
+            Number of bytes freed
         """
-        # Remove input scan
-        input_file = self.input_scans_path / f"{scan_id}.jpg"
-        if input_file.exists():
-            input_file.unlink()
-        
-        # Remove cropped images
-        cropped_files = self.cropped_images_path.glob(f"{scan_id}_*.jpg")
-        for file in cropped_files:
-            file.unlink()
-        
-        # Remove XML intermediate files
-        xml_files = self.xml_intermediate_path.glob(f"{scan_id}_*.xml")
-        for file in xml_files:
-            file.unlink()
-        
-        # Remove final JSON
-        json_file = self.results_path / f"{scan_id}_result.json"
-        if json_file.exists():
-            json_file.unlink()
+        normalized_id = self._normalize_scan_id(scan_id)
+        with self._pack_lock:
+            pack = self._open_packs.pop(normalized_id, None)
+        if pack is not None:
+            pack["file"].close()
+        
+        files = self._scan_files(scan_id)
+        if normalized_id != scan_id:
+            files += self._scan_files(normalized_id)
+        
+        freed = 0
+        with self._usage_lock:
+            self._ensure_index()
+            for file in set(files):
+                try:
+                    size = file.stat().st_size
+                    file.unlink()
+                except FileNotFoundError:
+                    continue
+                freed += size
+                category = self._categories[file.parent.name]
+                category["count"] = max(0, category["count"] - 1)
+                category["bytes"] = max(0, category["bytes"] - size)
+            self._scan_usage.pop(normalized_id, None)
+            self._mark_index_dirty(force_flush=True)
+        
+        with self._pack_lock:
+            for file in files:
+                self._pack_indexes.pop(file, None)
+        
+        return freed
+    
+    def _scan_files(self, scan_id: str) -> List[Path]:
+        """List all files stored for a scan."""
+        files = [
+            self.input_scans_path / f"{scan_id}.jpg",
+            self.results_path / f"{scan_id}_result.json",
+            self.logs_path / f"{scan_id}.log",
+            self.cropped_images_path / f"{scan_id}{PACK_SUFFIX}",
+        ]
+        if self.crop_storage == "files":
+            files.extend(self.cropped_images_path.glob(f"{scan_id}_region_*.jpg"))
+        files.extend(self.xml_intermediate_path.glob(f"{scan_id}_*.xml"))
+        return files
     
     def save_log(self, log_content: str, scan_id: str) -> str:
         """
@@ -262,38 +482,402 @@ class LocalStorageManager:
         filename = f"{scan_id}.log"
         destination = self.logs_path / filename
         
+        previous_size = self._size_before_write(destination)
         with open(destination, 'w', encoding='utf-8') as f:
             f.write(log_content)
+        self._track_write(scan_id, destination, previous_size)
+        
+        return str(destination)
+    
+    def result_cache_key(self, image_path: str, model_fingerprint: str) -> str:
+        """
+        Build a content-addressed key for the result cache.
+        
+        Args:
+            image_path: Path to the input scan image
+            model_fingerprint: Combined hash of the model weights
+            
+        Returns:
+            Cache key
+        """
+        return f"{file_digest(image_path)[:32]}_{model_fingerprint[:32]}"
+    
+    def load_cached_result(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a pipeline result in the result cache.
+        
+        Args:
+            key: Cache key from result_cache_key()
+            
+        Returns:
+            Cached result or None on a miss
+        """
+        if self.result_cache_max_bytes <= 0:
+            return None
+        
+        source = self.result_cache_path / f"{key}.json"
+        try:
+            with open(source, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            os.utime(source)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._result_cache_lock:
+                self._result_cache_misses += 1
+            return None
+        
+        with self._result_cache_lock:
+            self._result_cache_hits += 1
+            index = self._load_result_cache_index()
+            if key in index:
+                index.move_to_end(key)
+        return data
+    
+    def save_cached_result(self, key: str, data: Dict[str, Any]) -> Optional[str]:
+        """
+        Store a pipeline result in the result cache, evicting least recently
+        used entries above the size cap.
+        
+        Args:
+            key: Cache key from result_cache_key()
+            data: Pipeline result
+            
+        Returns:
+            Path to the cache entry or None if caching is disabled
+        """
+        if self.result_cache_max_bytes <= 0:
+            return None
+        
+        destination = self.result_cache_path / f"{key}.json"
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        if len(payload) > self.result_cache_max_bytes:
+            return None
         
+        fd, tmp_name = tempfile.mkstemp(dir=self.result_cache_path, prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_name, destination)
+        except Exception:
+            try: os.remove(tmp_name)
+            except OSError: pass
+            raise
+        
+        with self._result_cache_lock:
+            index = self._load_result_cache_index()
+            index[key] = len(payload)
+            index.move_to_end(key)
+            self._evict_result_cache(index)
         return str(destination)
     
+    def get_result_cache_stats(self) -> Dict[str, Any]:
+        """
+        Get result cache statistics.
+        
+        Returns:
+            Dictionary with hit/miss counters and cache size
+        """
+        with self._result_cache_lock:
+            index = self._load_result_cache_index()
+            lookups = self._result_cache_hits + self._result_cache_misses
+            return {
+                "hits": self._result_cache_hits,
+                "misses": self._result_cache_misses,
+                "hit_rate": self._result_cache_hits / lookups if lookups else 0.0,
+                "entries": len(index),
+                "size_bytes": sum(index.values()),
+                "max_bytes": self.result_cache_max_bytes
+            }
+    
+    def _load_result_cache_index(self) -> OrderedDict:
+        """Build the LRU index from disk on first use (caller holds the lock)."""
+        if self._result_cache_index is None:
+            entries = []
+            for path in self.result_cache_path.glob("*.json"):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, path.stem, st.st_size))
+            entries.sort()
+            self._result_cache_index = OrderedDict((key, size) for _, key, size in entries)
+        return self._result_cache_index
+    
+    def _evict_result_cache(self, index: OrderedDict):
+        """Drop least recently used entries until the cache fits (caller holds the lock)."""
+        total = sum(index.values())
+        while index and total > self.result_cache_max_bytes:
+            key, size = index.popitem(last=False)
+            total -= size
+            try:
+                (self.result_cache_path / f"{key}.json").unlink()
+            except FileNotFoundError:
+                pass
+    
+    @contextmanager
+    def scan_in_use(self, scan_id: str) -> Iterator[None]:
+        """
+        Protect a scan from eviction while it is being processed.
+        
+        Args:
+            scan_id: Unique identifier for the scan
+        """
+        scan_id = self._normalize_scan_id(scan_id)
+        with self._usage_lock:
+            self._pinned_scans[scan_id] = self._pinned_scans.get(scan_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._usage_lock:
+                self._pinned_scans[scan_id] -= 1
+                if not self._pinned_scans[scan_id]:
+                    del self._pinned_scans[scan_id]
+    
+    def is_scan_in_use(self, scan_id: str) -> bool:
+        with self._usage_lock:
+            return self._normalize_scan_id(scan_id) in self._pinned_scans
+    
+    def get_scan_usage(self) -> List[Dict[str, Any]]:
+        """
+        Get per-scan disk usage, least recently used first.
+        
+        Returns:
+            List of dicts with scan_id, bytes and last_used (unix time)
+        """
+        with self._usage_lock:
+            self._ensure_index()
+            return [{"scan_id": scan_id, **entry} for scan_id, entry in self._scan_usage.items()]
+    
+    def get_usage_bytes(self) -> int:
+        """
+        Get total bytes held by scans (input scans, crops, XML, results, logs).
+        
+        Returns:
+            Total size in bytes
+        """
+        with self._usage_lock:
+            self._ensure_index()
+            return sum(category["bytes"] for category in self._categories.values())
+    
+    def rescan(self) -> Dict[str, Any]:
+        """
+        Rebuild storage accounting from the files on disk and persist it.
+        Use it to repair the index after a crash or external changes.
+        
+        Returns:
+            Storage information after the rescan
+        """
+        categories = {name: {"count": 0, "bytes": 0} for name in self._accounted_directories()}
+        usage: Dict[str, Dict[str, Any]] = {}
+        for name, (directory, patterns) in self._accounted_directories().items():
+            for path in (p for pattern in patterns for p in directory.glob(pattern)):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                categories[name]["count"] += 1
+                categories[name]["bytes"] += st.st_size
+                scan_id = self._normalize_scan_id(self._scan_id_from_path(directory, path))
+                entry = usage.setdefault(scan_id, {"bytes": 0, "last_used": 0.0})
+                entry["bytes"] += st.st_size
+                entry["last_used"] = max(entry["last_used"], st.st_mtime)
+        
+        with self._usage_lock:
+            self._categories = categories
+            self._scan_usage = OrderedDict(sorted(usage.items(), key=lambda item: item[1]["last_used"]))
+            self._mark_index_dirty(force_flush=True)
+        return self.get_storage_info()
+    
+    def flush_index(self):
+        """Persist storage accounting if it changed since the last flush."""
+        with self._usage_lock:
+            if not self._index_dirty or self._categories is None:
+                return
+            payload = json.dumps({
+                "version": 1,
+                "categories": self._categories,
+                "scans": [[scan_id, entry["bytes"], entry["last_used"]]
+                          for scan_id, entry in self._scan_usage.items()],
+            })
+            self._index_dirty = False
+            self._index_flushed_at = time.monotonic()
+        
+        fd, tmp_name = tempfile.mkstemp(dir=self.base_path, prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_name, self.index_path)
+        except OSError as e:
+            try: os.remove(tmp_name)
+            except OSError: pass
+            print(f"Warning: Could not persist storage index: {e}")
+    
+    def _accounted_directories(self) -> Dict[str, Any]:
+        """Directories covered by accounting: name -> (path, glob patterns)."""
+        return {
+            self.input_scans_path.name: (self.input_scans_path, ("*.jpg",)),
+            self.cropped_images_path.name: (self.cropped_images_path, ("*.jpg", f"*{PACK_SUFFIX}")),
+            self.xml_intermediate_path.name: (self.xml_intermediate_path, ("*.xml",)),
+            self.results_path.name: (self.results_path, ("*.json",)),
+            self.logs_path.name: (self.logs_path, ("*.log",)),
+        }
+    
+    @staticmethod
+    def _normalize_scan_id(scan_id: str) -> str:
+        return scan_id.replace(' ', '_').lower()
+    
+    @staticmethod
+    def _normalize_region_id(region_id: str) -> str:
+        return region_id.replace(' ', '_').lower()
+    
+    def _append_to_pack(self, image: np.ndarray, scan_id: str, region_id: str) -> str:
+        """Encode a crop and append it to the scan's open pack file."""
+        ok, encoded = cv2.imencode(".jpg", image)
+        if not ok:
+            raise ValueError(f"Could not encode crop {region_id} of scan {scan_id}")
+        data = encoded.tobytes()
+        
+        scan_id = self._normalize_scan_id(scan_id)
+        region_id = self._normalize_region_id(region_id)
+        with self._pack_lock:
+            pack = self._open_packs.get(scan_id)
+            if pack is None:
+                destination = self.crop_pack_path(scan_id)
+                previous_size = self._size_before_write(destination)
+                f = open(destination, 'wb')
+                f.write(PACK_MAGIC)
+                pack = {"file": f, "index": {}, "offset": len(PACK_MAGIC), "previous_size": previous_size}
+                self._open_packs[scan_id] = pack
+            pack["file"].write(data)
+            pack["index"][region_id] = [pack["offset"], len(data)]
+            pack["offset"] += len(data)
+        
+        return self.cropped_image_ref(scan_id, region_id)
+    
+    def _read_from_pack(self, pack_path: Path, region_id: str) -> Optional[bytes]:
+        """Random access to one crop of a finished pack via mmap."""
+        try:
+            with open(pack_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                # mtime грубый (тик ядра): пак, переписанный сразу же, отличаем ещё и по размеру
+                version = (st.st_mtime_ns, st.st_size)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with self._pack_lock:
+                        cached = self._pack_indexes.get(pack_path)
+                    if cached is not None and cached[0] == version:
+                        index = cached[1]
+                    else:
+                        if len(mm) < len(PACK_MAGIC) + PACK_FOOTER.size or mm[:len(PACK_MAGIC)] != PACK_MAGIC:
+                            return None
+                        index_offset, index_length, magic = PACK_FOOTER.unpack(mm[-PACK_FOOTER.size:])
+                        if magic != PACK_MAGIC:
+                            # pack is still being written or was truncated
+                            return None
+                        index = json.loads(mm[index_offset:index_offset + index_length])
+                        with self._pack_lock:
+                            self._pack_indexes[pack_path] = (version, index)
+                            while len(self._pack_indexes) > 64:
+                                self._pack_indexes.popitem(last=False)
+                    entry = index.get(region_id)
+                    if entry is None:
+                        return None
+                    offset, length = entry
+                    return mm[offset:offset + length]
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    @staticmethod
+    def _file_size(path: Path) -> Optional[int]:
+        try:
+            return path.stat().st_size
+        except FileNotFoundError:
+            return None
+    
+    def _size_before_write(self, path: Path) -> Optional[int]:
+        """Size of a file about to be (over)written, None if it is new; the index must be loaded before the write lands."""
+        with self._usage_lock:
+            self._ensure_index()
+        return self._file_size(path)
+    
+    def _track_write(self, scan_id: str, path: Path, previous_size: Optional[int]):
+        """Account a written file to its category and scan, and mark the scan as recently used."""
+        delta = (self._file_size(path) or 0) - (previous_size or 0)
+        scan_id = self._normalize_scan_id(scan_id)
+        with self._usage_lock:
+            self._ensure_index()
+            category = self._categories[path.parent.name]
+            category["bytes"] = max(0, category["bytes"] + delta)
+            if previous_size is None:
+                category["count"] += 1
+            entry = self._scan_usage.setdefault(scan_id, {"bytes": 0, "last_used": 0.0})
+            entry["bytes"] = max(0, entry["bytes"] + delta)
+            entry["last_used"] = time.time()
+            self._scan_usage.move_to_end(scan_id)
+            self._mark_index_dirty()
+    
+    def _touch(self, scan_id: str):
+        """Mark a scan as recently used."""
+        scan_id = self._normalize_scan_id(scan_id)
+        with self._usage_lock:
+            self._ensure_index()
+            if scan_id in self._scan_usage:
+                self._scan_usage[scan_id]["last_used"] = time.time()
+                self._scan_usage.move_to_end(scan_id)
+                self._mark_index_dirty()
+    
+    def _mark_index_dirty(self, force_flush: bool = False):
+        """Flag accounting as changed; flush it at most once per index_flush_interval (caller holds the lock)."""
+        self._index_dirty = True
+        if force_flush or time.monotonic() - self._index_flushed_at >= self.index_flush_interval:
+            self.flush_index()
+    
+    def _ensure_index(self):
+        """Load accounting from index_path, or rescan the directories if there is none (caller holds the lock)."""
+        if self._categories is not None:
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            categories = {name: {"count": int(data["categories"][name]["count"]),
+                                 "bytes": int(data["categories"][name]["bytes"])}
+                          for name in self._accounted_directories()}
+            scans = OrderedDict((scan_id, {"bytes": size, "last_used": last_used})
+                                for scan_id, size, last_used in data["scans"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.rescan()
+            return
+        self._categories = categories
+        self._scan_usage = scans
+    
+    def _scan_id_from_path(self, directory: Path, path: Path) -> str:
+        """Recover the scan id from a stored file name."""
+        stem = path.stem
+        if directory == self.cropped_images_path:
+            # {scan_id}_region_{r}_{l}.jpg or {scan_id}.pack
+            return stem.split("_region_", 1)[0]
+        if directory == self.xml_intermediate_path:
+            return stem.rsplit("_", 1)[0]
+        if directory == self.results_path and stem.endswith("_result"):
+            return stem[:-len("_result")]
+        return stem
+    
     def get_storage_info(self) -> Dict[str, Any]:
         """
         Get information about local storage usage.
+        Served from incrementally maintained counters; call rescan() to rebuild them.
         
         Returns:
             Dictionary with storage information
         """
-        def get_directory_size(path: Path) -> int:
-            """Calculate total size of directory in bytes."""
-            total_size = 0
-            for file_path in path.rglob('*'):
-                if file_path.is_file():
-                    total_size += file_path.stat().st_size
-            return total_size
+        with self._usage_lock:
+            self._ensure_index()
+            categories = {name: dict(values) for name, values in self._categories.items()}
         
         return {
             "base_path": str(self.base_path),
-            "input_scans_count": len(list(self.input_scans_path.glob("*.jpg"))),
-            "cropped_images_count": len(list(self.cropped_images_path.glob("*.jpg"))),
-            "xml_files_count": len(list(self.xml_intermediate_path.glob("*.xml"))),
-            "json_files_count": len(list(self.results_path.glob("*.json"))),
-            "log_files_count": len(list(self.logs_path.glob("*.log"))),
-            "total_size_bytes": sum([
-                get_directory_size(self.input_scans_path),
-                get_directory_size(self.cropped_images_path),
-                get_directory_size(self.xml_intermediate_path),
-                get_directory_size(self.results_path),
-                get_directory_size(self.logs_path)
-            ])
+            "input_scans_count": categories[self.input_scans_path.name]["count"],
+            "cropped_images_count": categories[self.cropped_images_path.name]["count"],
+            "xml_files_count": categories[self.xml_intermediate_path.name]["count"],
+            "json_files_count": categories[self.results_path.name]["count"],
+            "log_files_count": categories[self.logs_path.name]["count"],
+            "total_size_bytes": sum(values["bytes"] for values in categories.values())
         }
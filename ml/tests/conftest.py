@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# модули ml лежат плоско в корне: python -m pytest tests из ml/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# entrypoint создаёт хранилище при импорте — не в рабочем каталоге
+os.environ.setdefault("ML_STORAGE_ROOT", tempfile.mkdtemp(prefix="ml-tests-"))
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """Fresh LocalStorageManager in a temporary directory."""
+    from storage_manager import LocalStorageManager
+
+    manager = LocalStorageManager(str(tmp_path / "storage"))
+    yield manager
+    manager.flush_index()
@@ -0,0 +1,136 @@
+import threading
+
+import pytest
+
+from callback_dispatcher import BULK_SUFFIX, CallbackDispatcher
+
+URL = "http://backend/api/v1/pipeline/callback_ocr"
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.text = str(self._body)
+
+    def json(self):
+        return self._body
+
+
+class _Session:
+    """Stands in for requests.Session: answers with handler(url, json) and records the calls."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def post(self, url, json=None, timeout=None):
+        with self._lock:
+            self.calls.append((url, json))
+        return self.handler(url, json)
+
+
+@pytest.fixture
+def make_dispatcher():
+    dispatchers = []
+
+    def make(handler):
+        d = CallbackDispatcher(flush_interval=0.05, max_backoff=0.1)
+        d.session = _Session(handler)
+        dispatchers.append(d)
+        return d
+
+    yield make
+    for d in dispatchers:
+        d.stop(timeout=2)
+
+
+def _update(name, status="upgrading"):
+    return {"group_uuid": "g", "filename": name, "status": status}
+
+
+def test_updates_are_coalesced_into_one_bulk_request(make_dispatcher):
+    d = make_dispatcher(lambda url, body: _Response(200, {"failed": []}))
+    receipts = [d.submit(URL, _update(f"p{i}.jpg")) for i in range(3)]
+
+    assert all(r.wait(5) for r in receipts)
+    assert d.session.calls == [(URL + BULK_SUFFIX, {"items": [_update(f"p{i}.jpg") for i in range(3)]})]
+    assert d.stats()["sent_total"] == 3
+
+
+def test_newer_update_of_a_file_replaces_the_queued_one(make_dispatcher):
+    d = make_dispatcher(lambda url, body: _Response(200, {"failed": []}))
+    first = d.submit(URL, _update("p.jpg", "upgrading"))
+    second = d.submit(URL, _update("p.jpg", "done"))
+
+    assert first.wait(5) and second.wait(5)
+    sent = [item for _, body in d.session.calls for item in body["items"]]
+    assert sent == [_update("p.jpg", "done")]
+
+
+def test_old_backend_without_bulk_gets_single_callbacks(make_dispatcher):
+    def handler(url, body):
+        return _Response(404) if url.endswith(BULK_SUFFIX) else _Response(200)
+
+    d = make_dispatcher(handler)
+    assert d.submit(URL, _update("a.jpg")).wait(5)
+    assert d.submit(URL, _update("b.jpg")).wait(5)
+
+    bulk_calls = [url for url, _ in d.session.calls if url.endswith(BULK_SUFFIX)]
+    assert len(bulk_calls) == 1  # поддержка bulk проверяется один раз
+    assert [body for url, body in d.session.calls if url == URL] == [_update("a.jpg"), _update("b.jpg")]
+
+
+def test_bulk_failures_are_retried_or_dropped_per_item(make_dispatcher):
+    attempts = {"late.jpg": 0}
+
+    def handler(url, body):
+        failed = []
+        for item in body["items"]:
+            if item["filename"] == "late.jpg":
+                attempts["late.jpg"] += 1
+                if attempts["late.jpg"] < 3:
+                    # файл ещё регистрируется — backend отвечает 404
+                    failed.append({"group_uuid": "g", "filename": "late.jpg", "status_code": 404})
+            elif item["filename"] == "bad.jpg":
+                failed.append({"group_uuid": "g", "filename": "bad.jpg", "status_code": 422, "detail": "bad"})
+        return _Response(200, {"failed": failed})
+
+    d = make_dispatcher(handler)
+    ok, late, bad = (d.submit(URL, _update(n)) for n in ("ok.jpg", "late.jpg", "bad.jpg"))
+
+    assert ok.wait(5)
+    assert late.wait(5)
+    assert bad.wait(5) is False
+    assert attempts["late.jpg"] == 3
+    stats = d.stats()
+    assert (stats["sent_total"], stats["dropped_total"]) == (2, 1)
+
+
+def test_unavailable_backend_is_retried_with_backoff(make_dispatcher):
+    answers = iter([_Response(503), _Response(502)])
+
+    def handler(url, body):
+        return next(answers, _Response(200, {"failed": []}))
+
+    d = make_dispatcher(handler)
+    assert d.submit(URL, _update("p.jpg")).wait(5)
+    assert len(d.session.calls) == 3
+    assert d.stats()["failed_requests_total"] == 2
+
+
+def test_not_found_is_given_up_after_max_retries(make_dispatcher):
+    d = make_dispatcher(lambda url, body: _Response(
+        200, {"failed": [{"group_uuid": "g", "filename": "ghost.jpg", "status_code": 404}]}))
+    d.max_not_found_retries = 2
+
+    assert d.submit(URL, _update("ghost.jpg")).wait(5) is False
+    assert len(d.session.calls) == 3
+    assert d.stats()["dropped_total"] == 1
+
+
+def test_no_callback_url_means_no_receipt(make_dispatcher):
+    d = make_dispatcher(lambda url, body: _Response(200))
+    assert d.submit("", _update("p.jpg")) is None
+    assert d.session.calls == []
@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+import pytest
+
+from storage_manager import PACK_FOOTER, PACK_MAGIC, LocalStorageManager
+
+
+def _crop(value, width=40):
+    # однотонный кроп переживает JPEG почти без искажений
+    return np.full((12, width, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def packed(tmp_path):
+    return LocalStorageManager(str(tmp_path / "storage"), crop_storage="pack")
+
+
+def test_pack_layout_and_random_access(packed):
+    refs = [packed.save_cropped_image(_crop(40 * i, 20 + i), "page_000", f"000_{i:03d}") for i in range(3)]
+    assert packed.load_cropped_image("page_000", "000_000") is None  # пак ещё пишется
+    path = packed.finalize_crops("page_000")
+
+    assert refs == [f"{path}#000_{i:03d}" for i in range(3)]
+    data = open(path, "rb").read()
+    assert data[:len(PACK_MAGIC)] == PACK_MAGIC
+    index_offset, index_length, magic = PACK_FOOTER.unpack(data[-PACK_FOOTER.size:])
+    assert magic == PACK_MAGIC
+    assert index_offset + index_length + PACK_FOOTER.size == len(data)
+
+    for i in reversed(range(3)):
+        crop = packed.load_cropped_image("page_000", f"000_{i:03d}")
+        assert crop.shape == (12, 20 + i, 3)
+        assert abs(int(crop.mean()) - 40 * i) <= 2
+    assert packed.load_cropped_image("page_000", "missing") is None
+
+
+def test_pack_is_one_file_and_cleaned_up_with_the_scan(packed):
+    for i in range(5):
+        packed.save_cropped_image(_crop(i), "page_000", f"000_{i:03d}")
+    packed.finalize_crops("page_000")
+
+    info = packed.get_storage_info()
+    assert info["cropped_images_count"] == 1
+    assert info["total_size_bytes"] == packed.crop_pack_path("page_000").stat().st_size
+
+    assert packed.cleanup_scan("page_000") > 0
+    assert not packed.crop_pack_path("page_000").exists()
+    assert packed.get_storage_info()["cropped_images_count"] == 0
+
+
+def test_rewritten_pack_is_reread(packed):
+    packed.save_cropped_image(_crop(10), "page_000", "000_000")
+    packed.finalize_crops("page_000")
+    assert packed.load_cropped_image("page_000", "000_000") is not None
+
+    packed.save_cropped_image(_crop(200, 30), "page_000", "000_001")
+    packed.finalize_crops("page_000")
+    assert packed.load_cropped_image("page_000", "000_000") is None
+    assert packed.load_cropped_image("page_000", "000_001").shape == (12, 30, 3)
+    assert packed.get_storage_info()["cropped_images_count"] == 1
+
+
+def test_truncated_pack_is_not_read(packed):
+    packed.save_cropped_image(_crop(10), "page_000", "000_000")
+    path = packed.finalize_crops("page_000")
+    with open(path, "r+b") as f:
+        f.truncate(len(PACK_MAGIC) + 10)
+    assert packed.load_cropped_image("page_000", "000_000") is None
+
+
+def test_files_mode_reads_existing_packs(tmp_path, packed):
+    packed.save_cropped_image(_crop(10), "page_000", "000_000")
+    packed.finalize_crops("page_000")
+
+    files = LocalStorageManager(str(packed.base_path), crop_storage="files")
+    assert files.finalize_crops("page_000") is None
+    assert files.load_cropped_image("page_000", "000_000") is not None
+
+
+def test_unknown_crop_storage_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LocalStorageManager(str(tmp_path), crop_storage="zip")
@@ -0,0 +1,84 @@
+import pytest
+
+from cancellation import ScanCancelled
+from pipeline_metrics import PipelineMetrics, _quantile
+
+
+def _samples(text):
+    """Metric lines of the exposition as {name{labels}: value}, comments skipped."""
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            out[name] = float(value)
+    return out
+
+
+def test_quantile_picks_nearest_rank():
+    values = [float(v) for v in range(1, 11)]
+    assert _quantile(values, 0.5) == 5.0
+    assert _quantile(values, 0.95) == 10.0
+    assert _quantile([], 0.5) == 0.0
+
+
+def test_stage_summaries_are_rendered_per_stage():
+    m = PipelineMetrics(prefix="t")
+    for wall in (0.1, 0.2, 0.3):
+        m.observe_stage("ocr", wall, wall / 2)
+    m.observe_stage("layout", 1.0, 0.5)
+
+    s = _samples(m.render_prometheus())
+    assert s['t_stage_wall_seconds{stage="ocr",quantile="0.5"}'] == 0.2
+    assert s['t_stage_wall_seconds_sum{stage="ocr"}'] == pytest.approx(0.6)
+    assert s['t_stage_wall_seconds_count{stage="ocr"}'] == 3
+    assert s['t_stage_cpu_seconds_sum{stage="layout"}'] == 0.5
+    assert m.stage_quantile("ocr", 0.95) == 0.3
+    assert m.stage_quantile("missing", 0.5) is None
+
+
+def test_quantiles_follow_the_window_but_totals_do_not():
+    m = PipelineMetrics(window=2, prefix="t")
+    for wall in (100.0, 1.0, 1.0):
+        m.observe_stage("ocr", wall, 0.0)
+
+    s = _samples(m.render_prometheus())
+    assert s['t_stage_wall_seconds{stage="ocr",quantile="0.95"}'] == 1.0
+    assert s['t_stage_wall_seconds_sum{stage="ocr"}'] == 102.0
+    assert s['t_stage_wall_seconds_count{stage="ocr"}'] == 3
+
+
+def test_scan_outcomes_are_counted_and_stages_attached():
+    m = PipelineMetrics(prefix="t")
+    with m.scan("page_000") as record:
+        with m.stage("ocr", record):
+            pass
+        record.set("lines", 12)
+    with pytest.raises(ScanCancelled):
+        with m.scan("page_001"):
+            raise ScanCancelled()
+    with pytest.raises(RuntimeError):
+        with m.scan("page_002"):
+            raise RuntimeError("boom")
+
+    assert set(record.stages["ocr"]) == {"wall_seconds", "cpu_seconds", "rss_bytes"}
+    s = _samples(m.render_prometheus())
+    assert (s["t_scans_ok_total"], s["t_scans_cancelled_total"], s["t_scans_error_total"]) == (1, 1, 1)
+    assert s["t_scan_lines_count"] == 1
+    assert s["t_scan_wall_seconds_count"] == 3
+    assert m.scan_value_mean("lines") == 12
+    # пиковый RSS процесса — отдельный gauge, а не сводка по сканам
+    assert "t_scan_peak_rss_bytes_count" not in s
+    assert "t_process_peak_resident_memory_bytes" in s
+
+
+def test_gauge_sources_are_read_on_scrape_and_failures_skipped():
+    m = PipelineMetrics(prefix="t")
+    depth = {"queued": 3}
+    m.register_gauges("scheduler", lambda: dict(depth))
+    m.register_gauges("broken", lambda: 1 / 0)
+
+    assert _samples(m.render_prometheus())["t_scheduler_queued"] == 3
+    depth["queued"] = 0
+    s = _samples(m.render_prometheus())
+    assert s["t_scheduler_queued"] == 0
+    assert not any(name.startswith("t_broken") for name in s)
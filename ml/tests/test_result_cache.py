@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+import pytest
+
+from storage_manager import LocalStorageManager
+
+FINGERPRINT = "f" * 64
+
+
+def _scan(path, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 255, size=(120, 200), dtype=np.uint8)
+    cv2.imwrite(str(path), image)
+    return str(path)
+
+
+def _cached_result():
+    """Result of an earlier scan: one line with a crop box, one without (whole page)."""
+    crop = {"min_x": 10, "max_x": 60, "min_y": 20, "max_y": 50, "width": 50, "height": 30, "padding": 0}
+    no_crop = {k: 0 for k in crop}
+    return {
+        "scan": {"id": "original_000", "image_path": "/old/original.jpg"},
+        "regions": [{
+            "id": "r1",
+            "lines": [
+                {"id": "l1", "text": "Выдано", "coordinates": {"crop": crop},
+                 "cropped_image": {"filename": "region_000_000.jpg", "path": "/old/original_000_region_000_000.jpg"}},
+                {"id": "l2", "text": "", "coordinates": {"crop": no_crop},
+                 "cropped_image": {"filename": "region_000_001.jpg", "path": "/old/original_000_region_000_001.jpg"}},
+            ],
+        }],
+    }
+
+
+def test_cache_lru_eviction_and_stats(tmp_path):
+    storage = LocalStorageManager(str(tmp_path), result_cache_max_bytes=250)
+    payload = {"text": "x" * 80}
+    storage.save_cached_result("a", payload)
+    storage.save_cached_result("b", payload)
+    assert storage.load_cached_result("a") == payload  # a становится свежее b
+    storage.save_cached_result("c", payload)
+
+    assert storage.load_cached_result("b") is None
+    assert storage.load_cached_result("a") == payload
+    assert storage.load_cached_result("c") == payload
+    stats = storage.get_result_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 1, 2)
+    assert stats["size_bytes"] <= 250
+
+
+def test_cache_disabled(tmp_path):
+    storage = LocalStorageManager(str(tmp_path), result_cache_max_bytes=0)
+    assert storage.save_cached_result("a", {"x": 1}) is None
+    assert storage.load_cached_result("a") is None
+
+
+def test_cache_key_follows_content_and_models(tmp_path):
+    storage = LocalStorageManager(str(tmp_path))
+    first = _scan(tmp_path / "first.jpg")
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes((tmp_path / "first.jpg").read_bytes())
+    other = _scan(tmp_path / "other.jpg", seed=1)
+
+    key = storage.result_cache_key(first, FINGERPRINT)
+    assert storage.result_cache_key(str(copy), FINGERPRINT) == key
+    assert storage.result_cache_key(other, FINGERPRINT) != key
+    assert storage.result_cache_key(first, "0" * 64) != key
+
+
+@pytest.mark.parametrize("crop_storage", ["files", "pack"])
+def test_hit_recuts_crops_for_the_new_scan(tmp_path, monkeypatch, crop_storage):
+    pytest.importorskip("torch")
+    from pipeline_processor import PipelineProcessor
+
+    # модели не нужны: на попадании в кэш пайплайн их не запускает
+    monkeypatch.setattr(PipelineProcessor, "_initialize_components", lambda self: None)
+    processor = PipelineProcessor()
+    processor._model_fingerprint = FINGERPRINT
+
+    storage = LocalStorageManager(str(tmp_path / "storage"), crop_storage=crop_storage)
+    image_path = _scan(tmp_path / "page.jpg")
+    storage.save_cached_result(storage.result_cache_key(image_path, FINGERPRINT), _cached_result())
+
+    result = processor.process_scan(image_path, "group_page_000", storage)
+
+    assert result["scan"]["id"] == "group_page_000"
+    assert result["scan"]["image_path"] == image_path
+    lines = result["regions"][0]["lines"]
+    assert [line["text"] for line in lines] == ["Выдано", ""]
+    for line in lines:
+        assert "original_000" not in line["cropped_image"]["path"]
+
+    crop = storage.load_cropped_image("group_page_000", "000_000")
+    page = storage.load_cropped_image("group_page_000", "000_001")
+    assert crop.shape[:2] == (30, 50)
+    assert page.shape[:2] == (120, 200)
+    assert storage.get_result_cache_stats()["hits"] == 1
@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+
+import result_format
+from result_format import FORMAT_V1, FORMAT_V2, compact_result, dumps_result, result_version
+
+SAMPLE = Path(__file__).resolve().parents[1] / "result-test3.json"
+
+
+def _sample():
+    return json.loads(SAMPLE.read_text(encoding="utf-8"))
+
+
+def test_v1_output_is_unchanged():
+    result = _sample()
+    assert json.loads(dumps_result(result, FORMAT_V1)) == result
+
+
+def test_v2_keeps_text_and_geometry():
+    result = _sample()
+    compact = json.loads(dumps_result(result, FORMAT_V2))
+
+    assert result_version(compact) == 2
+    assert "cropped_images" not in compact
+    assert compact["scan"] == result["scan"]
+    for region, region_v1 in zip(compact["regions"], result["regions"]):
+        assert region["concatenated_text"] == region_v1["concatenated_text"]
+        coords = region_v1["coordinates"]
+        assert region["bbox"] == [coords["min_x"], coords["min_y"], coords["max_x"], coords["max_y"],
+                                  coords["padding"]]
+        for line, line_v1 in zip(region["lines"], region_v1["lines"]):
+            assert line["text"] == line_v1["text"]
+            assert line["image"] == line_v1["cropped_image"]["path"]
+            crop = line_v1["coordinates"]["crop"]
+            assert line["crop"][:4] == [crop["min_x"], crop["min_y"], crop["max_x"], crop["max_y"]]
+
+
+def test_line_without_crop_has_no_box():
+    result = _sample()
+    line = result["regions"][0]["lines"][0]
+    line["coordinates"]["crop"] = {k: 0 for k in line["coordinates"]["crop"]}
+    assert compact_result(result)["regions"][0]["lines"][0]["crop"] is None
+
+
+def test_compact_is_idempotent():
+    compact = compact_result(_sample())
+    assert compact_result(compact) is compact
+
+
+def test_configured_format(monkeypatch):
+    for value, expected in (("v2", FORMAT_V2), ("compact", FORMAT_V2), ("2", FORMAT_V2),
+                            ("", FORMAT_V1), ("v1", FORMAT_V1)):
+        monkeypatch.setenv("ML_RESULT_FORMAT", value)
+        assert result_format.configured_format() == expected
@@ -0,0 +1,59 @@
+import numpy as np
+
+import storage_manager
+from retention import RetentionPolicy, StorageRetention
+
+CROP = np.zeros((10, 40, 3), dtype=np.uint8)
+
+
+def _fill(storage, scan_id, text="<xml/>"):
+    storage.save_cropped_image(CROP, scan_id, "000_000")
+    storage.save_xml_intermediate(text, scan_id, "layout")
+    storage.save_final_json({"scan": {"id": scan_id}}, scan_id)
+
+
+def test_max_age_evicts_only_stale_scans(storage, monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(storage_manager.time, "time", lambda: clock["now"])
+    _fill(storage, "old_000")
+    clock["now"] = 5000.0
+    _fill(storage, "new_000")
+
+    retention = StorageRetention(storage, RetentionPolicy(max_age_seconds=100))
+    result = retention.run_once(now=5050.0)
+    assert result["evicted_scans"] == 1
+    assert [s["scan_id"] for s in storage.get_scan_usage()] == ["new_000"]
+    assert storage.load_final_json("old_000") is None
+    assert storage.load_final_json("new_000") is not None
+
+
+def test_size_cap_evicts_least_recently_used_first(storage):
+    for scan_id in ("a_000", "b_000", "c_000"):
+        _fill(storage, scan_id)
+    storage.load_cropped_image("a_000", "000_000")  # a снова свежий
+    per_scan = storage.get_scan_usage()[0]["bytes"]
+
+    retention = StorageRetention(storage, RetentionPolicy(max_bytes=per_scan * 2))
+    retention.run_once()
+
+    assert [s["scan_id"] for s in storage.get_scan_usage()] == ["c_000", "a_000"]
+    assert storage.get_usage_bytes() <= per_scan * 2
+    assert retention.stats()["evicted_scans_total"] == 1
+
+
+def test_pinned_scan_is_not_evicted(storage):
+    _fill(storage, "busy_000")
+    _fill(storage, "idle_000")
+    retention = StorageRetention(storage, RetentionPolicy(max_bytes=1))
+
+    with storage.scan_in_use("busy_000"):
+        retention.run_once()
+        assert [s["scan_id"] for s in storage.get_scan_usage()] == ["busy_000"]
+    assert not storage.is_scan_in_use("busy_000")
+
+
+def test_disabled_policy_does_not_start():
+    assert not RetentionPolicy().enabled
+    retention = StorageRetention(storage_manager=None, policy=RetentionPolicy())
+    retention.start()
+    assert retention._thread is None
@@ -0,0 +1,100 @@
+import threading
+
+from scheduler import FairScanScheduler
+
+
+def _submit(scheduler, group_uuid, count, prefix=None):
+    for i in range(count):
+        scheduler.submit(group_uuid, f"/data/{prefix or group_uuid}/page{i}.jpg", "/dst", "")
+
+
+def _drain(scheduler):
+    order = []
+    while True:
+        job = scheduler.get(timeout=0)
+        if job is None:
+            return order
+        order.append(job)
+        scheduler.task_done(job)
+
+
+def test_groups_are_served_round_robin():
+    scheduler = FairScanScheduler(small_group_max=0)
+    _submit(scheduler, "a", 3)
+    _submit(scheduler, "b", 2)
+
+    assert [job.group_uuid for job in _drain(scheduler)] == ["a", "b", "a", "b", "a"]
+
+
+def test_small_group_jumps_the_queue():
+    scheduler = FairScanScheduler(small_group_max=2)
+    _submit(scheduler, "big", 5)
+    assert scheduler.get(timeout=0).group_uuid == "big"
+    _submit(scheduler, "small", 2)
+
+    order = [job.group_uuid for job in _drain(scheduler)]
+    assert order[:2] == ["small", "small"]
+    assert order.count("big") == 4
+
+
+def test_queue_position_matches_service_order():
+    scheduler = FairScanScheduler(small_group_max=0)
+    _submit(scheduler, "a", 3)
+    _submit(scheduler, "b", 1)
+
+    position = scheduler.queue_position("b")
+    assert position["pending"] == 1
+    assert position["scans_ahead"] == 1
+    assert position["queue_size"] == 4
+
+    order = _drain(scheduler)
+    assert order[position["scans_ahead"]].group_uuid == "b"
+
+
+def test_duplicate_submit_is_ignored_until_done():
+    scheduler = FairScanScheduler()
+    assert scheduler.submit("a", "/data/a/page.jpg", "/dst", "")
+    assert not scheduler.submit("a", "/data/a/page.jpg", "/dst", "")
+    job = scheduler.get(timeout=0)
+    assert not scheduler.submit("a", "/data/a/page.jpg", "/dst", "")
+    scheduler.task_done(job)
+    assert scheduler.submit("a", "/data/a/page.jpg", "/dst", "")
+
+
+def test_scan_ids_are_numbered_per_group():
+    scheduler = FairScanScheduler(small_group_max=0)
+    _submit(scheduler, "a", 2, prefix="shared")
+    scheduler.submit("b", "/data/b/page0.jpg", "/dst", "")
+
+    ids = {(job.group_uuid, job.image_path): job.scan_id for job in _drain(scheduler)}
+    assert ids[("a", "/data/shared/page0.jpg")] == "page0_000"
+    assert ids[("a", "/data/shared/page1.jpg")] == "page1_001"
+    assert ids[("b", "/data/b/page0.jpg")] == "page0_000"
+
+
+def test_cancel_drops_pending_scans_only():
+    scheduler = FairScanScheduler(small_group_max=0)
+    _submit(scheduler, "a", 3)
+    _submit(scheduler, "b", 1)
+    running = scheduler.get(timeout=0)
+    assert running.group_uuid == "a"
+
+    assert scheduler.cancel_group("a") == 2
+    assert scheduler.stats() == {"pending": 1, "in_progress": 1, "active_groups": 1}
+    assert [job.group_uuid for job in _drain(scheduler)] == ["b"]
+
+    scheduler.task_done(running)
+    assert scheduler.stats()["in_progress"] == 0
+    assert scheduler.cancel_group("a") == 0
+    # отменённый путь можно поставить снова
+    assert scheduler.submit("a", running.image_path, "/dst", "")
+
+
+def test_get_blocks_until_submit():
+    scheduler = FairScanScheduler()
+    taken = []
+    worker = threading.Thread(target=lambda: taken.append(scheduler.get(timeout=5)))
+    worker.start()
+    scheduler.submit("a", "/data/a/page.jpg", "/dst", "")
+    worker.join(5)
+    assert taken and taken[0].image_path == "/data/a/page.jpg"
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+from storage_manager import LocalStorageManager
+
+CROP = np.zeros((10, 40, 3), dtype=np.uint8)
+
+
+def _fill(storage, scan_id, image_path):
+    storage.save_input_scan(image_path, scan_id)
+    storage.save_cropped_image(CROP, scan_id, "000_000")
+    storage.save_cropped_image(CROP, scan_id, "000_001")
+    storage.save_xml_intermediate("<layout/>", scan_id, "layout")
+    storage.save_final_json({"scan": {"id": scan_id}}, scan_id)
+    storage.save_log("done", scan_id)
+
+
+def _disk_bytes(storage):
+    return sum(p.stat().st_size for p in storage.base_path.rglob("*")
+               if p.is_file() and p.parent != storage.base_path and p.parent.name != "result_cache")
+
+
+def test_counters_follow_saves_overwrites_and_cleanup(storage, tmp_path):
+    image = tmp_path / "page.jpg"
+    cv2.imwrite(str(image), np.zeros((20, 20), dtype=np.uint8))
+    _fill(storage, "a_000", str(image))
+    _fill(storage, "b_000", str(image))
+    storage.save_xml_intermediate("<layout>longer than before</layout>", "a_000", "layout")
+
+    info = storage.get_storage_info()
+    assert (info["input_scans_count"], info["cropped_images_count"], info["xml_files_count"],
+            info["json_files_count"], info["log_files_count"]) == (2, 4, 2, 2, 2)
+    assert info["total_size_bytes"] == _disk_bytes(storage) == storage.get_usage_bytes()
+
+    freed = storage.cleanup_scan("a_000")
+    info = storage.get_storage_info()
+    assert freed > 0
+    assert info["cropped_images_count"] == 2
+    assert info["total_size_bytes"] == _disk_bytes(storage)
+    assert [s["scan_id"] for s in storage.get_scan_usage()] == ["b_000"]
+
+
+def test_index_is_persisted_and_matches_rescan(storage, tmp_path):
+    image = tmp_path / "page.jpg"
+    cv2.imwrite(str(image), np.zeros((20, 20), dtype=np.uint8))
+    _fill(storage, "a_000", str(image))
+    storage.flush_index()
+    assert storage.index_path.exists()
+
+    reopened = LocalStorageManager(str(storage.base_path))
+    assert reopened.get_storage_info() == storage.get_storage_info()
+    assert reopened.get_scan_usage() == storage.get_scan_usage()
+
+    incremental = storage.get_storage_info()
+    assert storage.rescan() == incremental
+
+
+def test_missing_index_is_rebuilt_from_disk(storage, tmp_path):
+    image = tmp_path / "page.jpg"
+    cv2.imwrite(str(image), np.zeros((20, 20), dtype=np.uint8))
+    _fill(storage, "a_000", str(image))
+    storage.flush_index()
+    storage.index_path.unlink()
+
+    reopened = LocalStorageManager(str(storage.base_path))
+    assert reopened.get_storage_info() == storage.get_storage_info()
+    assert [s["scan_id"] for s in reopened.get_scan_usage()] == ["a_000"]
@@ -0,0 +1,101 @@
+import os
+import time
+
+import pytest
+
+import watcher
+from watcher import RawDataWatcher
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+@pytest.fixture(params=["inotify", "poll"])
+def watch(request, tmp_path, monkeypatch):
+    """Start a watcher on tmp_path; returns (start(process_existing), reported list)."""
+    monkeypatch.setattr(watcher, "SETTLE_SECONDS", 0)
+    reported = []
+    started = []
+
+    def start(process_existing=False):
+        w = RawDataWatcher(str(tmp_path), lambda gid, path: reported.append((gid, path)),
+                           mode=request.param, poll_interval=0.1, process_existing=process_existing)
+        w.start()
+        started.append(w)
+        time.sleep(0.3)  # watcher успел обойти каталоги
+        return w
+
+    yield start, reported
+    for w in started:
+        w.stop()
+
+
+def _stage(tmp_path, gid, name, data=b"jpeg"):
+    """Write a file the way the backend does: into .staging_*, then rename into raw_data/."""
+    group = tmp_path / gid
+    staging = group / ".staging_test"
+    staging.mkdir(parents=True, exist_ok=True)
+    (group / "raw_data").mkdir(exist_ok=True)
+    staged = staging / name
+    staged.write_bytes(data)
+    return staged, group / "raw_data" / name
+
+
+def test_staged_file_is_reported_once_after_publish(tmp_path, watch):
+    start, reported = watch
+    (tmp_path / "g1" / "raw_data").mkdir(parents=True)
+    start()
+
+    staged, final = _stage(tmp_path, "g1", "page.jpg")
+    time.sleep(0.4)
+    assert reported == []  # в staging — ещё не загружен
+
+    os.rename(staged, final)
+    assert _wait_for(lambda: reported == [("g1", str(final))])
+    time.sleep(0.4)
+    assert reported == [("g1", str(final))]
+
+
+def test_new_group_and_nested_dirs_are_picked_up(tmp_path, watch):
+    start, reported = watch
+    start()
+
+    raw = tmp_path / "g2" / "raw_data" / "opis" / "delo"
+    raw.mkdir(parents=True)
+    time.sleep(0.3)
+    (raw / "scan.png").write_bytes(b"png")
+    assert _wait_for(lambda: reported == [("g2", str(raw / "scan.png"))])
+
+
+def test_hidden_and_non_image_files_are_ignored(tmp_path, watch):
+    start, reported = watch
+    raw = tmp_path / "g3" / "raw_data"
+    raw.mkdir(parents=True)
+    start()
+
+    (raw / ".up_page.jpg").write_bytes(b"partial")
+    (raw / "notes.txt").write_bytes(b"text")
+    (raw / "page.jpg").write_bytes(b"jpeg")
+    assert _wait_for(lambda: len(reported) == 1)
+    time.sleep(0.3)
+    assert reported == [("g3", str(raw / "page.jpg"))]
+
+
+@pytest.mark.parametrize("process_existing", [False, True])
+def test_existing_files_are_reported_only_on_request(tmp_path, watch, process_existing):
+    start, reported = watch
+    raw = tmp_path / "g4" / "raw_data"
+    raw.mkdir(parents=True)
+    (raw / "old.jpg").write_bytes(b"jpeg")
+    start(process_existing=process_existing)
+
+    expected = [("g4", str(raw / "old.jpg"))] if process_existing else []
+    # уже лежавший файл может дописываться: отчёт — после проверки, что он не меняется
+    _wait_for(lambda: reported == expected, timeout=3.0 if process_existing else 1.0)
+    assert reported == expected
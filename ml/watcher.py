@@ -0,0 +1,302 @@
+"""
+Watch-folder ingestion for the ML pipeline.
+Watches groups/*/raw_data/ and reports every image as soon as it is fully
+written. The backend saves uploads and extracts archives into a hidden
+".staging_*" directory of the group and renames them into raw_data/ only after
+the file is registered, so a callback for a reported image finds its file.
+Uses inotify when available and falls back to polling.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}
+
+# Files found by a directory scan are reported once they stop changing for this long
+SETTLE_SECONDS = 1.0
+
+# inotify constants (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def is_ready_image(path: Path) -> bool:
+    """Final image name (not a hidden temp file) with a supported extension."""
+    return not path.name.startswith('.') and path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+class _Inotify:
+    """Minimal ctypes binding to the Linux inotify API."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def read_events(self, timeout: float):
+        """Yield (wd, mask, name) tuples, waiting up to timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class RawDataWatcher:
+    """Reports images that appear under <root>/<group_uuid>/raw_data/."""
+
+    def __init__(self, root: str, on_image: Callable[[str, str], None], mode: str = "auto",
+                 poll_interval: float = 2.0, process_existing: bool = False):
+        """
+        Initialize watcher.
+
+        Args:
+            root: Groups directory (contains <group_uuid>/raw_data/)
+            on_image: Callback(group_uuid, image_path) for every ready image
+            mode: "inotify", "poll" or "auto" (inotify with polling fallback)
+            poll_interval: Polling period in seconds
+            process_existing: Also report images already present at start
+        """
+        self.root = Path(root)
+        self.on_image = on_image
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.process_existing = process_existing
+
+        # reported images per group; a group's entry goes away with its directory
+        self._seen: Dict[str, Set[str]] = {}
+        self._seen_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # inotify watch descriptor -> (directory, kind), kind is "root", "group" or "raw"
+        self._watches: Dict[int, Tuple[Path, str]] = {}
+        # files found by a scan that may still be written: path -> last seen size
+        self._deferred: Dict[str, int] = {}
+
+    def start(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="raw-data-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        inotify = None
+        if self.mode in ("auto", "inotify"):
+            try:
+                inotify = _Inotify()
+            except OSError as e:
+                if self.mode == "inotify":
+                    raise
+                print(f"[watcher] inotify unavailable ({e}), falling back to polling")
+
+        if inotify is not None:
+            print(f"[watcher] watching {self.root} with inotify")
+            try:
+                self._run_inotify(inotify)
+            finally:
+                inotify.close()
+        else:
+            print(f"[watcher] polling {self.root} every {self.poll_interval}s")
+            self._run_polling()
+
+    # ---------- inotify ----------
+
+    def _run_inotify(self, inotify: _Inotify):
+        self._add_watch(inotify, self.root, "root")
+        for group_dir in self._list_dirs(self.root):
+            self._watch_group(inotify, group_dir, initial=True)
+
+        while not self._stop.is_set():
+            for wd, mask, name in list(inotify.read_events(timeout=1.0)):
+                if mask & IN_Q_OVERFLOW:
+                    print("[watcher] inotify queue overflow, rescanning")
+                    for group_dir in self._list_dirs(self.root):
+                        self._watch_group(inotify, group_dir, initial=False)
+                    continue
+                if mask & IN_IGNORED:
+                    gone = self._watches.pop(wd, None)
+                    if gone is not None and gone[1] == "group":
+                        # каталог группы удалён — её файлы больше не появятся
+                        self._forget_group(gone[0].name)
+                    continue
+                watched = self._watches.get(wd)
+                if watched is None or not name:
+                    continue
+                directory, kind = watched
+                path = directory / name
+
+                if mask & IN_ISDIR:
+                    if kind == "root":
+                        self._watch_group(inotify, path, initial=False)
+                    elif kind == "group" and name == "raw_data":
+                        self._watch_raw_tree(inotify, path, initial=False)
+                    elif kind == "raw":
+                        self._watch_raw_tree(inotify, path, initial=False)
+                    continue
+
+                # файл готов: переименован из .up_* или закрыт после записи
+                if kind == "raw" and mask & (IN_MOVED_TO | IN_CLOSE_WRITE):
+                    self._emit(path)
+
+            self._flush_deferred()
+
+    def _add_watch(self, inotify: _Inotify, path: Path, kind: str):
+        mask = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF
+        if kind == "raw":
+            mask |= IN_CLOSE_WRITE
+        try:
+            wd = inotify.add_watch(path, mask)
+        except OSError as e:
+            print(f"[watcher] cannot watch {path}: {e}")
+            return
+        self._watches[wd] = (path, kind)
+
+    def _watch_group(self, inotify: _Inotify, group_dir: Path, initial: bool):
+        self._add_watch(inotify, group_dir, "group")
+        raw_dir = group_dir / "raw_data"
+        if raw_dir.is_dir():
+            self._watch_raw_tree(inotify, raw_dir, initial)
+
+    def _watch_raw_tree(self, inotify: _Inotify, raw_dir: Path, initial: bool):
+        """Watch a raw_data (sub)tree; files created before the watch was added are picked up by a scan."""
+        for directory in [raw_dir] + [p for p in raw_dir.rglob("*") if p.is_dir()]:
+            self._add_watch(inotify, directory, "raw")
+        self._scan_existing(raw_dir, emit=not initial or self.process_existing)
+
+    # ---------- polling ----------
+
+    def _run_polling(self):
+        pending_sizes: Dict[str, int] = {}
+        for raw_dir in self.root.glob("*/raw_data"):
+            self._scan_existing(raw_dir, emit=self.process_existing)
+
+        while not self._stop.wait(self.poll_interval):
+            self._flush_deferred()
+            present = {p.name for p in self._list_dirs(self.root)}
+            for group_uuid in [g for g in self._seen if g not in present]:
+                self._forget_group(group_uuid)
+            current: Dict[str, int] = {}
+            for raw_dir in self.root.glob("*/raw_data"):
+                for path in raw_dir.rglob("*"):
+                    if not is_ready_image(path) or self._is_seen(path):
+                        continue
+                    try:
+                        current[str(path)] = path.stat().st_size
+                    except FileNotFoundError:
+                        continue
+            # готов, если размер не менялся между двумя опросами
+            for key, size in current.items():
+                if pending_sizes.get(key) == size:
+                    self._emit(Path(key))
+            pending_sizes = {k: v for k, v in current.items() if not self._is_seen(Path(k))}
+
+    # ---------- common ----------
+
+    def _scan_existing(self, raw_dir: Path, emit: bool):
+        for path in sorted(raw_dir.rglob("*")):
+            if path.is_file() and is_ready_image(path):
+                if emit:
+                    # может ещё дописываться (распаковка zip) — отчитаемся, когда файл перестанет меняться
+                    self._deferred.setdefault(str(path), -1)
+                else:
+                    self._mark_seen(path)
+
+    def _flush_deferred(self):
+        now = time.time()
+        for key, last_size in list(self._deferred.items()):
+            path = Path(key)
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                del self._deferred[key]
+                continue
+            if st.st_size == last_size and now - st.st_mtime >= SETTLE_SECONDS:
+                del self._deferred[key]
+                self._emit(path)
+            else:
+                self._deferred[key] = st.st_size
+
+    @staticmethod
+    def _list_dirs(path: Path):
+        return [p for p in path.iterdir() if p.is_dir()] if path.is_dir() else []
+
+    def _group_uuid(self, path: Path) -> Optional[str]:
+        try:
+            return path.relative_to(self.root).parts[0]
+        except (ValueError, IndexError):
+            return None
+
+    def _is_seen(self, path: Path) -> bool:
+        with self._seen_lock:
+            return str(path) in self._seen.get(self._group_uuid(path), ())
+
+    def _mark_seen(self, path: Path) -> bool:
+        """Mark a path as reported; returns False if it already was."""
+        with self._seen_lock:
+            seen = self._seen.setdefault(self._group_uuid(path), set())
+            if str(path) in seen:
+                return False
+            seen.add(str(path))
+            return True
+
+    def _forget_group(self, group_uuid: str):
+        with self._seen_lock:
+            self._seen.pop(group_uuid, None)
+        for key in [k for k in self._deferred if self._group_uuid(Path(k)) == group_uuid]:
+            del self._deferred[key]
+
+    def _emit(self, path: Path):
+        if not is_ready_image(path) or not self._mark_seen(path):
+            return
+        group_uuid = self._group_uuid(path)
+        if group_uuid is None:
+            return
+        try:
+            self.on_image(group_uuid, str(path))
+        except Exception as e:
+            print(f"[watcher] failed to enqueue {path}: {e}")
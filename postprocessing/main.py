@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import os
+import time
 from pathlib import Path
 
 from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
@@ -18,11 +19,15 @@ logger = logging.getLogger(__name__)
 
 completions_router = web.RouteTableDef()
 
+# Отменённые группы хранятся сутки: повторные запросы по ним игнорируются
+CANCEL_TTL_SECONDS = 24 * 3600
+
 async def on_startup(app: web.Application):
     app['http'] = ClientSession(
     timeout=ClientTimeout(total=15),
     connector=TCPConnector(limit=100, ssl=False)  
     )
+    app['cancelled'] = {}
 
 async def on_cleanup(app: web.Application):
     await app['http'].close()
@@ -35,7 +40,18 @@ def _extract_group_uuid_from_path(p: Path) -> str:
             return parts[i + 1]
     return None
 
-async def process_single_file(input_path: Path, output_path: Path, session, callback_url) -> bool:
+def _dumps_like_input(data) -> str:
+    """Компактный результат (format_version 2) пишем тоже компактно, v1 — с отступами, как раньше."""
+    if isinstance(data, dict) and data.get("format_version") == 2:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+def _is_cancelled(app: web.Application, group_uuid: str) -> bool:
+    cancelled_at = app['cancelled'].get(group_uuid)
+    return cancelled_at is not None and time.time() - cancelled_at <= CANCEL_TTL_SECONDS
+
+async def process_single_file(input_path: Path, output_path: Path, session, callback_url,
+                              is_cancelled=lambda: False) -> bool:
     """Processes a single JSON file"""
 
     try:
@@ -46,12 +62,17 @@ async def process_single_file(input_path: Path, output_path: Path, session, call
         
         logger.debug(f"Starting to process file: {input_path.name}")
         processed_data = await process_text(data)
+
+        if is_cancelled():
+            # группу удалили, пока шёл запрос к LLM — результат никому не нужен
+            logger.info(f"Cancelled, skipping result for {input_path.name}")
+            return False
         
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
         logger.debug(f"Saving result to: {output_path}")
         async with aiofiles.open(output_path, 'w', encoding='utf-8') as f:
-            content = json.dumps(processed_data, ensure_ascii=False, indent=2)
+            content = _dumps_like_input(processed_data)
             await f.write(content)
             
         logger.info(f"File {input_path.name} processed successfully!")
@@ -59,15 +80,18 @@ async def process_single_file(input_path: Path, output_path: Path, session, call
         group_uuid = _extract_group_uuid_from_path(Path(input_path))
         filename = input_path.name
 
-        payload = {"group_uuid": group_uuid, "filename": filename, "status": "done"}
+        payload = {"group_uuid": group_uuid, "filename": filename, "status": "done",
+                   "result_filename": output_path.name}
         async with session.post(callback_url, json=payload) as resp:
             print(f"Status: {resp.status}")
         return True
         
     except (json.JSONDecodeError, ValueError, Exception) as e:
         logger.error(f"Error processing file {input_path.name}: {e}")
+        if is_cancelled():
+            return False
         async with aiofiles.open(output_path, 'w', encoding='utf-8') as f:
-            content = json.dumps(data, ensure_ascii=False, indent=2)
+            content = _dumps_like_input(data)
             await f.write(content)
         return False
 
@@ -108,12 +132,34 @@ async def process_files(request: web.Request) -> web.Response:
     successful = 0
     failed = 0
     
+    group_uuid = _extract_group_uuid_from_path(input_path)
+
+    def is_cancelled() -> bool:
+        return _is_cancelled(request.app, group_uuid) or not input_path.exists()
+
     for json_file in json_files:
+        if is_cancelled():
+            logger.info(f"Group {group_uuid} cancelled, stopping")
+            break
         output_file = output_path / json_file.name
-        await process_single_file(json_file, output_file, session, callback)
+        await process_single_file(json_file, output_file, session, callback, is_cancelled)
 
     return web.json_response({"status_code":200})
 
+@completions_router.post('/cancel')
+async def cancel_group(request: web.Request) -> web.Response:
+    group_uuid = request.query.get('group_uuid')
+    if not group_uuid:
+        return web.json_response({'error': 'group_uuid is required'}, status=400)
+
+    cancelled = request.app['cancelled']
+    now = time.time()
+    for gid in [g for g, t in cancelled.items() if now - t > CANCEL_TTL_SECONDS]:
+        del cancelled[gid]
+    cancelled[group_uuid] = now
+    logger.info(f"Group {group_uuid} cancelled")
+    return web.json_response({'group_uuid': group_uuid, 'status': 'cancelled'})
+
 def create_app():
     app = web.Application()
     app.on_startup.append(on_startup)